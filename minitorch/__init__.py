@@ -1,8 +1,15 @@
 from .tensor_data import *  # noqa: F401,F403
+from .storage import *  # noqa: F401,F403
+from .parallel import *  # noqa: F401,F403
 from .tensor import *  # noqa: F401,F403
 from .tensor_ops import *  # noqa: F401,F403
+from .fast_ops import *  # noqa: F401,F403
+from .numpy_ops import *  # noqa: F401,F403
 from .tensor_functions import *  # noqa: F401,F403
+from .fusion import *  # noqa: F401,F403
+from .lazy_tensor import *  # noqa: F401,F403
 from .operators import *  # noqa: F401,F403
 from .autodiff import *  # noqa: F401,F403
 from .scalar import *  # noqa: F401,F403
 from .module import *  # noqa: F401,F403
+from . import nn  # noqa: F401
@@ -83,17 +83,29 @@ class Context:
 
     def __init__(self, no_grad=False):
         self._saved_values = None
+        self._saved_versions = ()
         self.no_grad = no_grad
 
     def save_for_backward(self, *values):
         if self.no_grad:
             return
         self._saved_values = values
+        # Remember versions to detect in-place changes before backward.
+        self._saved_versions = [
+            (v._version, v._version.value)
+            for v in values
+            if getattr(v, "_version", None) is not None
+        ]
 
     @property
     def saved_values(self):
         assert not self.no_grad, "Doesn't require grad"
         assert self._saved_values is not None, "Did you forget to save values?"
+        for counter, value in self._saved_versions:
+            if counter.value != value:
+                raise RuntimeError(
+                    "A value saved for backward was modified by an in-place operation."
+                )
         return unwrap_tuple(self._saved_values)
 
 
@@ -184,6 +196,7 @@ class FunctionBase:
         # TODO: Implement for Task 1.3.
 
         result = []
+        derivatives = None
 
         for index, arg in enumerate(inputs):
 
@@ -191,7 +204,10 @@ class FunctionBase:
             if is_constant(arg):
                 continue
 
-            output = wrap_tuple(cls.backward(ctx, d_output))[index]
+            # Run backward once for all the inputs.
+            if derivatives is None:
+                derivatives = wrap_tuple(cls.backward(ctx, d_output))
+            output = derivatives[index]
 
             vwd = VariableWithDeriv(arg, output)
 
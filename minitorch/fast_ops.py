@@ -0,0 +1,682 @@
+import functools
+import numpy as np
+from numba import njit, prange
+from . import operators
+from .fusion import FUSABLE
+from .tensor_data import shape_broadcast, matmul_shape
+
+
+@njit(inline="always")
+def _broadcast_strides(out_shape, in_shape, in_strides):
+    """
+    Align `in_strides` to the dimensions of `out_shape`, using a stride of 0 for
+    every dimension that is broadcast (missing or of size 1 in `in_shape`).
+    """
+    n = len(out_shape)
+    offset = n - len(in_shape)
+    strides = np.zeros(n, np.int64)
+    for i in range(len(in_shape)):
+        if in_shape[i] != 1:
+            strides[i + offset] = in_strides[i]
+    return strides
+
+
+@njit(inline="always")
+def _is_aligned(out_shape, out_strides, in_shape, in_strides):
+    "True if both tensors have the same shape and the same contiguous layout."
+    if len(out_shape) != len(in_shape):
+        return False
+    stride = 1
+    for i in range(len(out_shape) - 1, -1, -1):
+        if out_shape[i] != in_shape[i]:
+            return False
+        if out_shape[i] != 1 and (
+            out_strides[i] != stride or in_strides[i] != stride
+        ):
+            return False
+        stride *= out_shape[i]
+    return True
+
+
+def tensor_map(fn):
+    """
+    NUMBA higher-order tensor map function. See `tensor_ops.py` for description.
+
+    Optimizations:
+
+        * Main loop in parallel
+        * Positions are computed arithmetically, no index buffers are allocated
+        * When `out` and `in` are stride-aligned, avoid indexing
+
+    Args:
+        fn: function mappings floats-to-floats to apply.
+        out (array): storage for out tensor.
+        out_shape (array): shape for out tensor.
+        out_strides (array): strides for out tensor.
+        in_storage (array): storage for in tensor.
+        in_shape (array): shape for in tensor.
+        in_strides (array): strides for in tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+
+    def _map(out, out_shape, out_strides, in_storage, in_shape, in_strides):
+        size = 1
+        for s in out_shape:
+            size *= s
+
+        if _is_aligned(out_shape, out_strides, in_shape, in_strides):
+            for i in prange(size):
+                out[i] = fn(in_storage[i])
+            return
+
+        dims = len(out_shape)
+        b_strides = _broadcast_strides(out_shape, in_shape, in_strides)
+        for i in prange(size):
+            # Copy the loop index, numba does not allow rebinding it.
+            cur = i + 0
+            o = 0
+            j = 0
+            for d in range(dims - 1, -1, -1):
+                idx = cur % out_shape[d]
+                cur = cur // out_shape[d]
+                o += idx * out_strides[d]
+                j += idx * b_strides[d]
+            out[o] = fn(in_storage[j])
+
+    return njit(parallel=True)(_map)
+
+
+def map(fn):
+    """
+    Higher-order tensor map function ::
+
+      fn_map = map(fn)
+      b = fn_map(a)
+
+    Args:
+        fn: function from float-to-float to apply.
+        a (:class:`TensorData`): tensor to map over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+               should broadcast with `a`
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+
+    # JIT compile `fn` so that it can be inlined into the kernel.
+    f = tensor_map(njit()(operators.jit_form(fn)))
+
+    def ret(a, out=None):
+        if out is None:
+            out = a.empty(a.shape)
+        f(*out.tuple(), *a.tuple())
+        return out
+
+    return ret
+
+
+def tensor_zip(fn):
+    """
+    NUMBA higher-order tensor zip function. See `tensor_ops.py` for description.
+
+    Optimizations:
+
+        * Main loop in parallel
+        * Positions are computed arithmetically, no index buffers are allocated
+        * When `out`, `a`, `b` are stride-aligned, avoid indexing
+
+    Args:
+        fn: function maps two floats to float to apply.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor.
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+
+    def _zip(
+        out,
+        out_shape,
+        out_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        b_storage,
+        b_shape,
+        b_strides,
+    ):
+        size = 1
+        for s in out_shape:
+            size *= s
+
+        if _is_aligned(out_shape, out_strides, a_shape, a_strides) and _is_aligned(
+            out_shape, out_strides, b_shape, b_strides
+        ):
+            for i in prange(size):
+                out[i] = fn(a_storage[i], b_storage[i])
+            return
+
+        dims = len(out_shape)
+        a_bstrides = _broadcast_strides(out_shape, a_shape, a_strides)
+        b_bstrides = _broadcast_strides(out_shape, b_shape, b_strides)
+        for i in prange(size):
+            # Copy the loop index, numba does not allow rebinding it.
+            cur = i + 0
+            o = 0
+            j = 0
+            k = 0
+            for d in range(dims - 1, -1, -1):
+                idx = cur % out_shape[d]
+                cur = cur // out_shape[d]
+                o += idx * out_strides[d]
+                j += idx * a_bstrides[d]
+                k += idx * b_bstrides[d]
+            out[o] = fn(a_storage[j], b_storage[k])
+
+    return njit(parallel=True)(_zip)
+
+
+def zip(fn):
+    """
+    Higher-order tensor zip function.
+
+      fn_zip = zip(fn)
+      c = fn_zip(a, b)
+
+    Args:
+        fn: function from two floats-to-float to apply
+        a (:class:`TensorData`): tensor to zip over
+        b (:class:`TensorData`): tensor to zip over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+               should broadcast with `a` and `b`
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    f = tensor_zip(njit()(operators.jit_form(fn)))
+
+    def ret(a, b, out=None):
+        if out is None:
+            if a.shape != b.shape:
+                c_shape = shape_broadcast(a.shape, b.shape)
+            else:
+                c_shape = a.shape
+            out = a.empty(c_shape, dtype=np.result_type(a.dtype, b.dtype))
+        f(*out.tuple(), *a.tuple(), *b.tuple())
+        return out
+
+    return ret
+
+
+# Elements folded serially before partial results are combined pairwise.
+REDUCE_BLOCK = 128
+
+
+def tensor_reduce(fn, compensated=False):
+    """
+    NUMBA higher-order tensor reduce function. See `tensor_ops.py` for description.
+
+    Optimizations:
+
+        * Main loop in parallel
+        * Offsets within a reduced block are computed once, before the main loop
+        * Inner-loop should not call any functions or write non-local variables
+        * Long reductions fold blocks of `REDUCE_BLOCK` elements and combine the
+          partial results pairwise, or use compensated summation
+
+    Args:
+        fn: associative reduction function mapping two floats to float.
+        compensated (bool): use compensated summation, `fn` must be addition.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        reduce_shape (array): shape of reduction (1 for dimension kept, shape value for dimensions summed out)
+        reduce_size (int): size of reduce shape
+
+    Returns:
+        None : Fills in `out`
+    """
+
+    def _reduce(
+        out,
+        out_shape,
+        out_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        reduce_shape,
+        reduce_size,
+    ):
+        dims = len(out_shape)
+        size = 1
+        for s in out_shape:
+            size *= s
+
+        # Offset of each element of a reduced block from its first element,
+        # shared by all blocks.
+        inner = np.zeros(reduce_size, dtype=np.int64)
+        for j in range(reduce_size):
+            cur = j
+            for d in range(dims - 1, -1, -1):
+                inner[j] += (cur % reduce_shape[d]) * a_strides[d]
+                cur = cur // reduce_shape[d]
+
+        for i in prange(size):
+            # Reduced dimensions have size 1 in `out_shape`, so the index of
+            # the out cell is also the first index of its block in `a`.
+            cur = i + 0
+            o = 0
+            base = 0
+            for d in range(dims - 1, -1, -1):
+                idx = cur % out_shape[d]
+                cur = cur // out_shape[d]
+                o += idx * out_strides[d]
+                base += idx * a_strides[d]
+
+            acc = out[o]
+            if compensated:
+                comp = 0.0
+                for j in range(reduce_size):
+                    v = a_storage[base + inner[j]]
+                    t = acc + v
+                    if abs(acc) >= abs(v):
+                        comp += (acc - t) + v
+                    else:
+                        comp += (v - t) + acc
+                    acc = t
+                acc += comp
+            elif reduce_size <= REDUCE_BLOCK:
+                for j in range(reduce_size):
+                    acc = fn(acc, a_storage[base + inner[j]])
+            else:
+                blocks = (reduce_size + REDUCE_BLOCK - 1) // REDUCE_BLOCK
+                partials = np.empty(blocks, dtype=a_storage.dtype)
+                for k in range(blocks):
+                    j0 = k * REDUCE_BLOCK
+                    x = a_storage[base + inner[j0]]
+                    for j in range(j0 + 1, min(j0 + REDUCE_BLOCK, reduce_size)):
+                        x = fn(x, a_storage[base + inner[j]])
+                    partials[k] = x
+                step = 1
+                while step < blocks:
+                    for k in range(0, blocks - step, 2 * step):
+                        partials[k] = fn(partials[k], partials[k + step])
+                    step *= 2
+                acc = fn(acc, partials[0])
+            out[o] = acc
+
+    return njit(parallel=True)(_reduce)
+
+
+def reduce(fn, start=0.0, compensated=False):
+    """
+    Higher-order tensor reduce function. ::
+
+      fn_reduce = reduce(fn)
+      out = fn_reduce(a, dims)
+
+    Args:
+        fn: associative function from two floats-to-float to apply
+        start (float): value the reduction starts from
+        compensated (bool): use compensated summation, `fn` must be addition
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list, optional): list of dims to reduce
+        out (:class:`TensorData`, optional): tensor to reduce into
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+
+    f = tensor_reduce(njit()(operators.jit_form(fn)), compensated)
+
+    def ret(a, dims=None, out=None):
+        old_shape = None
+        if out is None:
+            out_shape = list(a.shape)
+            for d in dims:
+                out_shape[d] = 1
+            # Other values when not sum.
+            out = a.empty(tuple(out_shape))
+            out._tensor._storage[:] = start
+        else:
+            old_shape = out.shape
+            diff = len(a.shape) - len(out.shape)
+            out = out.view(*([1] * diff + list(old_shape)))
+
+        # Assume they are the same dim
+        assert len(out.shape) == len(a.shape)
+
+        # Create a reduce shape / reduce size
+        reduce_shape = []
+        reduce_size = 1
+        for i, s in enumerate(a.shape):
+            if out.shape[i] == 1:
+                reduce_shape.append(s)
+                reduce_size *= s
+            else:
+                reduce_shape.append(1)
+
+        # Apply
+        f(*out.tuple(), *a.tuple(), np.array(reduce_shape), reduce_size)
+
+        if old_shape is not None:
+            out = out.view(*old_shape)
+        return out
+
+    return ret
+
+
+def tensor_arg_reduce(fn):
+    """
+    NUMBA higher-order tensor reduce function that also records which element
+    each result comes from. See `tensor_ops.py` for description.
+
+    Optimizations:
+
+        * Main loop in parallel
+        * Offsets within a reduced block are computed once, before the main loop
+
+    Args:
+        fn: reduction function returning one of its two arguments (e.g. `max`).
+
+    Returns:
+        None : Fills in `out` and `arg`
+    """
+
+    def _arg_reduce(
+        out,
+        out_shape,
+        out_strides,
+        arg,
+        arg_shape,
+        arg_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        reduce_shape,
+        reduce_size,
+    ):
+        dims = len(out_shape)
+        size = 1
+        for s in out_shape:
+            size *= s
+
+        inner = np.zeros(reduce_size, dtype=np.int64)
+        for j in range(reduce_size):
+            cur = j
+            for d in range(dims - 1, -1, -1):
+                inner[j] += (cur % reduce_shape[d]) * a_strides[d]
+                cur = cur // reduce_shape[d]
+
+        for i in prange(size):
+            cur = i + 0
+            o = 0
+            p = 0
+            base = 0
+            for d in range(dims - 1, -1, -1):
+                idx = cur % out_shape[d]
+                cur = cur // out_shape[d]
+                o += idx * out_strides[d]
+                p += idx * arg_strides[d]
+                base += idx * a_strides[d]
+
+            acc = a_storage[base]
+            best = 0
+            for j in range(1, reduce_size):
+                v = a_storage[base + inner[j]]
+                # NaN propagates: the first NaN is selected.
+                if acc == acc and (v != v or fn(acc, v) != acc):
+                    acc = v
+                    best = j
+            out[o] = acc
+            arg[p] = best
+
+    return njit(parallel=True)(_arg_reduce)
+
+
+def arg_reduce(fn):
+    """
+    Higher-order tensor reduce function returning the reduced values and
+    the positions they come from. See `tensor_ops.py` for description.
+
+    Args:
+        fn: function from two floats to one of them
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list): list of dims to reduce
+
+    Returns:
+        tuple : values and int64 positions, with the reduced dimensions kept
+    """
+
+    f = tensor_arg_reduce(njit()(operators.jit_form(fn)))
+
+    def ret(a, dims):
+        out_shape = tuple(1 if d in dims else s for d, s in enumerate(a.shape))
+        reduce_shape = [s if d in dims else 1 for d, s in enumerate(a.shape)]
+        out = a.empty(out_shape)
+        arg = a.empty(out_shape, dtype=np.int64)
+        reduce_size = int(np.prod(reduce_shape))
+        f(*out.tuple(), *arg.tuple(), *a.tuple(), np.array(reduce_shape), reduce_size)
+        return out, arg
+
+    return ret
+
+
+# Rows, columns and inner entries per tile of the matrix multiply.
+MATMUL_BLOCK = 64
+
+
+def tensor_matrix_multiply(
+    out,
+    out_shape,
+    out_strides,
+    a_storage,
+    a_shape,
+    a_strides,
+    b_storage,
+    b_shape,
+    b_strides,
+):
+    """
+    NUMBA blocked tensor matrix multiply.
+
+    Optimizations:
+
+        * Outer loop in parallel over tiles of `MATMUL_BLOCK` rows
+        * Tiles of `b` are reused by every row of a tile while in cache
+        * Inner loop runs along the columns of `b` and `out`
+
+    Args:
+        out (array): storage for `out` tensor, filled with zeros.
+        out_shape (array): shape for `out` tensor (3-D).
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor (3-D).
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor (3-D).
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+    a_batch_stride = a_strides[0] if a_shape[0] > 1 else 0
+    b_batch_stride = b_strides[0] if b_shape[0] > 1 else 0
+    rows = out_shape[1]
+    cols = out_shape[2]
+    inner = a_shape[2]
+    row_blocks = (rows + MATMUL_BLOCK - 1) // MATMUL_BLOCK
+
+    for p in prange(out_shape[0] * row_blocks):
+        n = p // row_blocks
+        i0 = (p % row_blocks) * MATMUL_BLOCK
+        i1 = min(i0 + MATMUL_BLOCK, rows)
+        for j0 in range(0, cols, MATMUL_BLOCK):
+            j1 = min(j0 + MATMUL_BLOCK, cols)
+            for k0 in range(0, inner, MATMUL_BLOCK):
+                k1 = min(k0 + MATMUL_BLOCK, inner)
+                for i in range(i0, i1):
+                    a_row = n * a_batch_stride + i * a_strides[1]
+                    o_row = n * out_strides[0] + i * out_strides[1]
+                    for k in range(k0, k1):
+                        a_val = a_storage[a_row + k * a_strides[2]]
+                        b_row = n * b_batch_stride + k * b_strides[1]
+                        for j in range(j0, j1):
+                            out[o_row + j * out_strides[2]] += (
+                                a_val * b_storage[b_row + j * b_strides[2]]
+                            )
+
+
+_tensor_matrix_multiply = njit(parallel=True)(tensor_matrix_multiply)
+
+
+def matrix_multiply(a, b):
+    """
+    Batched matrix multiply. 2-D tensors are multiplied as a batch of one
+    matrix, and the batch dimension of 3-D tensors is broadcast ::
+
+        for n:
+          for i:
+            for j:
+              for k:
+                out[n, i, j] += a[n, i, k] * b[n, k, j]
+
+    Args:
+        a (:class:`TensorData`): tensor data `a`, 2-D or 3-D
+        b (:class:`TensorData`): tensor data `b`, 2-D or 3-D
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    out = a.zeros(
+        matmul_shape(a.shape, b.shape), dtype=np.result_type(a.dtype, b.dtype)
+    )
+    _tensor_matrix_multiply(
+        *out._tensor.as_batch().tuple(),
+        *a._tensor.as_batch().tuple(),
+        *b._tensor.as_batch().tuple(),
+    )
+    return out
+
+
+# JIT versions of the functions fused kernels are built from.
+FUSED_SCALARS = {
+    name: njit()(operators.jit_form(getattr(operators, name))) for name in FUSABLE
+}
+
+
+def tensor_nary(fn, nin, nout):
+    """
+    NUMBA higher-order n-ary tensor zip function. See `tensor_ops.py` for
+    description. The kernel is generated for the given number of inputs and
+    outputs, with the same loops as :func:`tensor_zip`.
+
+    Args:
+        fn: function of `nin` values returning a tuple of `nout` values.
+        nin (int): number of input tensors.
+        nout (int): number of output tensors.
+        *args (arrays): storage, shape and strides of each output, then of
+            each input, all outputs having the same shape.
+
+    Returns:
+        None : Fills in the outputs
+    """
+    outs = [f"o{k}" for k in range(nout)]
+    ins = [f"x{i}" for i in range(nin)]
+    names = outs + ins
+    params = ", ".join(f"{n}, {n}_shape, {n}_strides" for n in names)
+    aligned = " and ".join(
+        f"_is_aligned(o0_shape, o0_strides, {n}_shape, {n}_strides)" for n in names
+    )
+    lines = [
+        f"def _nary({params}):",
+        "    size = 1",
+        "    for s in o0_shape:",
+        "        size *= s",
+        f"    if {aligned}:",
+        "        for i in prange(size):",
+        f"            r = fn({', '.join(f'{x}[i]' for x in ins)})",
+    ]
+    lines += [f"            {o}[i] = r[{k}]" for k, o in enumerate(outs)]
+    lines += ["        return", "    dims = len(o0_shape)"]
+    lines += [
+        f"    {n}_b = _broadcast_strides(o0_shape, {n}_shape, {n}_strides)"
+        for n in names
+    ]
+    lines += [
+        "    for i in prange(size):",
+        "        # Copy the loop index, numba does not allow rebinding it.",
+        "        cur = i + 0",
+    ]
+    lines += [f"        p_{n} = 0" for n in names]
+    lines += [
+        "        for d in range(dims - 1, -1, -1):",
+        "            idx = cur % o0_shape[d]",
+        "            cur = cur // o0_shape[d]",
+    ]
+    lines += [f"            p_{n} += idx * {n}_b[d]" for n in names]
+    lines += [f"        r = fn({', '.join(f'{x}[p_{x}]' for x in ins)})"]
+    lines += [f"        {o}[p_{o}] = r[{k}]" for k, o in enumerate(outs)]
+
+    scope = {
+        "fn": fn,
+        "prange": prange,
+        "_is_aligned": _is_aligned,
+        "_broadcast_strides": _broadcast_strides,
+    }
+    exec("\n".join(lines), scope)
+    return njit(parallel=True)(scope["_nary"])
+
+
+def nary(program):
+    """
+    Higher-order n-ary tensor zip for fused kernels (see `fusion.py`). ::
+
+      fn_nary = nary(program)
+      out, = fn_nary(a, b, c)
+
+    Args:
+        program (:class:`FusedProgram`): program to compile
+        *tensors (:class:`TensorData`): tensors to zip over, broadcast together
+        out (list of :class:`TensorData`): optional, one tensor data per output
+            of `program` to fill in
+
+    Returns:
+        list of :class:`TensorData` : one new tensor data per output
+    """
+    fn = njit()(program.compile(FUSED_SCALARS))
+    f = tensor_nary(fn, program.nin, program.nout)
+
+    def ret(*tensors, out=None):
+        if out is None:
+            shape = functools.reduce(shape_broadcast, (t.shape for t in tensors))
+            dtype = np.result_type(*(t.dtype for t in tensors))
+            out = [tensors[0].empty(shape, dtype=dtype) for _ in range(program.nout)]
+        f(
+            *(x for o in out for x in o.tuple()),
+            *(x for t in tensors for x in t.tuple()),
+        )
+        return out
+
+    return ret
+
+
+class FastOps:
+    map = map
+    zip = zip
+    reduce = reduce
+    arg_reduce = arg_reduce
+    matrix_multiply = matrix_multiply
+    nary = nary
@@ -0,0 +1,267 @@
+"""
+Fusion of chains of elementwise tensor operations into a single kernel.
+"""
+
+import functools
+import inspect
+from .tensor import Tensor
+
+# Scalar functions of `operators.py` that fused kernels are built from.
+FUSABLE = (
+    "add",
+    "mul",
+    "eq",
+    "neg",
+    "inv",
+    "sigmoid",
+    "relu",
+    "log",
+    "exp",
+    "softplus",
+    "relu_back",
+    "log_back",
+    "inv_back",
+)
+
+
+class Expr:
+    """
+    Node of a traced elementwise expression.
+
+    Attributes:
+        op (str): name of a function in `FUSABLE`, "input" or "const"
+        args (tuple): argument nodes, or the input position / constant value
+    """
+
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+
+    @staticmethod
+    def wrap(b):
+        return b if isinstance(b, Expr) else Expr("const", float(b))
+
+    def __add__(self, b):
+        return Expr("add", self, Expr.wrap(b))
+
+    def __radd__(self, b):
+        return Expr("add", Expr.wrap(b), self)
+
+    def __sub__(self, b):
+        return Expr("add", self, -Expr.wrap(b))
+
+    def __rsub__(self, b):
+        return Expr("add", Expr.wrap(b), -self)
+
+    def __mul__(self, b):
+        return Expr("mul", self, Expr.wrap(b))
+
+    def __rmul__(self, b):
+        return Expr("mul", Expr.wrap(b), self)
+
+    def __truediv__(self, b):
+        return Expr("mul", self, Expr("inv", Expr.wrap(b)))
+
+    def __rtruediv__(self, b):
+        return Expr("mul", Expr.wrap(b), Expr("inv", self))
+
+    def __neg__(self):
+        if self.op == "const":
+            return Expr("const", -self.args[0])
+        return Expr("neg", self)
+
+    def sigmoid(self):
+        return Expr("sigmoid", self)
+
+    def relu(self):
+        return Expr("relu", self)
+
+    def log(self):
+        return Expr("log", self)
+
+    def exp(self):
+        return Expr("exp", self)
+
+    def softplus(self):
+        return Expr("softplus", self)
+
+
+def _grad_exprs(output, nin, grad):
+    """
+    Reverse-mode derivatives of `output` with respect to each input, as
+    expressions of the inputs and of `grad`, the derivative of the output.
+    """
+    order = []
+    seen = set()
+
+    def visit(node):
+        if id(node) in seen or node.op in ("input", "const"):
+            return
+        seen.add(id(node))
+        for arg in node.args:
+            visit(arg)
+        order.append(node)
+
+    visit(output)
+    grads = {id(output): grad}
+    inputs = [Expr("const", 0.0) for _ in range(nin)]
+
+    def accumulate(node, d):
+        if node.op == "const":
+            return
+        if node.op == "input":
+            i = node.args[0]
+            prev = inputs[i]
+            inputs[i] = d if prev.op == "const" else Expr("add", prev, d)
+            return
+        prev = grads.get(id(node))
+        grads[id(node)] = d if prev is None else Expr("add", prev, d)
+
+    if output.op in ("input", "const"):
+        accumulate(output, grad)
+    for node in reversed(order):
+        d = grads.get(id(node))
+        if d is None:
+            continue
+        a = node.args[0]
+        if node.op == "add":
+            accumulate(a, d)
+            accumulate(node.args[1], d)
+        elif node.op == "mul":
+            b = node.args[1]
+            accumulate(a, Expr("mul", d, b))
+            accumulate(b, Expr("mul", d, a))
+        elif node.op == "neg":
+            accumulate(a, Expr("neg", d))
+        elif node.op == "inv":
+            accumulate(a, Expr("inv_back", a, d))
+        elif node.op == "sigmoid":
+            # sigmoid'(a) = s * (1 - s), reusing the node for s.
+            one_minus = Expr("add", Expr("const", 1.0), Expr("neg", node))
+            accumulate(a, Expr("mul", d, Expr("mul", node, one_minus)))
+        elif node.op == "relu":
+            accumulate(a, Expr("relu_back", a, d))
+        elif node.op == "log":
+            accumulate(a, Expr("log_back", a, d))
+        elif node.op == "exp":
+            accumulate(a, Expr("mul", d, node))
+        elif node.op == "softplus":
+            accumulate(a, Expr("mul", d, Expr("sigmoid", a)))
+    return inputs
+
+
+class FusedProgram:
+    """
+    Straight-line program computing `outputs` from `nin` inputs, compiled
+    once per backend into a single elementwise kernel.
+
+    Attributes:
+        nin (int): number of inputs
+        nout (int): number of outputs
+        source (str): python source of the scalar function, calling the
+            functions of `FUSABLE` by name
+        constants (dict): values of the constants named in `source`
+    """
+
+    def __init__(self, outputs, nin):
+        self.outputs = outputs
+        self.nin = nin
+        self.nout = len(outputs)
+        self.constants = {}
+        self.source = self._emit()
+        self._kernels = {}
+        self._grad = None
+
+    def _emit(self):
+        names = {}
+        lines = []
+
+        def visit(node):
+            if id(node) in names:
+                return names[id(node)]
+            if node.op == "input":
+                name = f"x{node.args[0]}"
+            elif node.op == "const":
+                # Bound by name, `repr` of inf and nan is not valid source.
+                name = f"c{len(self.constants)}"
+                self.constants[name] = node.args[0]
+            else:
+                assert node.op in FUSABLE, f"Cannot fuse {node.op}."
+                args = ", ".join(visit(arg) for arg in node.args)
+                name = f"t{len(lines)}"
+                lines.append(f"    {name} = {node.op}({args})")
+            names[id(node)] = name
+            return name
+
+        results = [visit(out) for out in self.outputs]
+        params = ", ".join(f"x{i}" for i in range(self.nin))
+        return "\n".join(
+            [f"def fused({params}):"] + lines + [f"    return ({', '.join(results)},)"]
+        )
+
+    def compile(self, namespace):
+        """
+        Build the scalar function.
+
+        Args:
+            namespace (dict): implementation of each name of `FUSABLE`
+
+        Returns:
+            function : function of `nin` values returning a tuple of `nout` values
+        """
+        scope = dict(namespace, **self.constants)
+        exec(self.source, scope)
+        return scope["fused"]
+
+    def kernel(self, tensor_ops):
+        "The kernel of `tensor_ops.nary` for this program, compiled on first use."
+        if tensor_ops not in self._kernels:
+            self._kernels[tensor_ops] = tensor_ops.nary(self)
+        return self._kernels[tensor_ops]
+
+    @property
+    def grad(self):
+        """
+        Program computing the derivative for each input from the inputs and
+        the derivative of the (single) output, in one kernel.
+        """
+        if self._grad is None:
+            assert self.nout == 1, "Only single output programs have a gradient."
+            grad = Expr("input", self.nin)
+            self._grad = FusedProgram(
+                _grad_exprs(self.outputs[0], self.nin, grad), self.nin + 1
+            )
+        return self._grad
+
+
+def fuse(fn):
+    """
+    Fuse an elementwise function of tensors into one kernel, that reads each
+    input once and writes the result once, with a fused backward. ::
+
+      bce = fuse(lambda out, y: -(out * y + (out - 1.0) * (y - 1.0)).log())
+      loss = bce(out, y)
+
+    `fn` may use `+`, `-`, `*`, `/`, negation, numbers and the `sigmoid`,
+    `relu`, `log`, `exp` and `softplus` methods of its arguments. Only
+    functions wrapped by `fuse` are fused, other chains of operations run one
+    kernel per operation (see :func:`lazy` to defer and prune them instead).
+
+    Args:
+        fn: function of tensors built from elementwise operations
+
+    Returns:
+        function : function of tensors (or numbers) returning a tensor
+    """
+    nin = len(inspect.signature(fn).parameters)
+    output = Expr.wrap(fn(*[Expr("input", i) for i in range(nin)]))
+    program = FusedProgram([output], nin)
+
+    @functools.wraps(fn)
+    def fused(*vals):
+        first = next(v for v in vals if isinstance(v, Tensor))
+        vals = [first._ensure_tensor(v) for v in vals]
+        return first.backend.Fused.apply(program, *vals)
+
+    fused.program = program
+    return fused
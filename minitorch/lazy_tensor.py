@@ -0,0 +1,193 @@
+"""
+Lazy execution of elementwise tensor Functions.
+"""
+
+import contextlib
+import functools
+import weakref
+from collections import OrderedDict
+import numpy as np
+from .autodiff import Context, History, Variable
+from .operators import prod
+from .tensor_data import shape_broadcast
+
+# Results of Functions of constant tensors (see `Tensor._ensure_tensor`),
+# reused across evaluations.
+FOLD_CACHE_SIZE = 32
+_folded = OrderedDict()
+
+# CSE tables of the active `lazy` scopes, innermost last.
+_scopes = []
+
+
+@contextlib.contextmanager
+def lazy():
+    """
+    Record elementwise tensor operations instead of running them. ::
+
+      with minitorch.lazy():
+          out = model.forward(X)
+          loss = -((out * y) + (out - 1.0) * (y - 1.0)).log()
+      loss.sum().backward()
+
+    A recorded value is computed the first time its data is needed (indexing,
+    `to_numpy`, `backward`, or a Function that is not elementwise). Only the
+    operations it depends on run (dead ones are skipped), each distinct
+    operation of the scope runs once (common subexpressions are shared), and
+    operations of number constants are folded and cached across evaluations
+    (e.g. the `-1.0` of `y - 1.0`).
+    """
+    _scopes.append({})
+    try:
+        yield
+    finally:
+        _scopes.pop()
+
+
+def is_lazy():
+    "True inside a :func:`lazy` scope."
+    return bool(_scopes)
+
+
+class LazyData:
+    """
+    Placeholder for the data of a Tensor returned by a recorded Function.
+
+    Attributes:
+        shape (tuple): shape of the result
+        dtype (numpy dtype): element type of the result
+        size (int): number of elements
+        dims (int): number of dimensions
+    """
+
+    def __init__(self, fn, ctx, vals, shape, dtype, cse):
+        self.fn = fn
+        self.ctx = ctx
+        self.vals = vals
+        self.shape = shape
+        self.dtype = dtype
+        self.size = int(prod(shape))
+        self.dims = len(shape)
+        self.cse = cse
+        self.result = None
+        # Inputs must not change in place before the Function runs.
+        self.versions = [
+            (v._data._version, v._data._version.value)
+            for v in vals
+            if isinstance(v, Variable) and not isinstance(v._data, LazyData)
+        ]
+
+    def materialize(self):
+        """
+        Run this Function and the pending Functions it depends on.
+
+        Returns:
+            :class:`TensorData` : the result
+        """
+        # Pending Functions this one depends on, in topological order.
+        order = []
+        seen = set()
+        stack = [(self, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                order.append(node)
+            elif node.result is None and id(node) not in seen:
+                seen.add(id(node))
+                stack.append((node, True))
+                for v in node.vals:
+                    if isinstance(v, Variable) and isinstance(v._data, LazyData):
+                        stack.append((v._data, False))
+
+        for node in order:
+            node._run()
+        return self.result
+
+    def _run(self):
+        for counter, value in self.versions:
+            if counter.value != value:
+                raise RuntimeError(
+                    "An input of a lazy operation was modified in place before it ran."
+                )
+        vals = [_resolve(v) for v in self.vals]
+        key = (self.fn, tuple(_key(v) for v in vals))
+
+        if _foldable(vals):
+            self.result = _fold(key, _tracked(vals), lambda: self._forward(vals))
+        elif key in self.cse:
+            # Same Function of the same inputs, share the result and the
+            # values saved for backward.
+            self.result, ctx, _ = self.cse[key]
+            self.ctx._saved_values = ctx._saved_values
+            self.ctx._saved_versions = ctx._saved_versions
+        else:
+            self.result = self._forward(vals)
+            self.cse[key] = (self.result, self.ctx, vals)
+        self.vals = None
+
+    def _forward(self, vals):
+        raw = [v.get_data() if isinstance(v, Variable) else v for v in vals]
+        return self.fn.forward(self.ctx, *raw)._tensor
+
+
+def _resolve(v):
+    if isinstance(v, Variable) and isinstance(v._data, LazyData):
+        v._data = v._data.result
+    return v
+
+
+def _key(v):
+    # Numbers are wrapped in shared constant tensors (see
+    # `Tensor._ensure_tensor`), so they match by identity too.
+    if not isinstance(v, Variable):
+        return id(v)
+    return (id(v._data), v._data._version.value)
+
+
+def _tracked(vals):
+    "Inputs matched by identity in `_key`."
+    return [v._data for v in vals if isinstance(v, Variable)]
+
+
+def _foldable(vals):
+    "Are all the tensor inputs constants or results folded from constants."
+    return all(v._data._shared for v in vals if isinstance(v, Variable))
+
+
+def _fold(key, inputs, compute):
+    entry = _folded.get(key)
+    if entry is not None:
+        refs, result = entry
+        if all(r() is data for r, data in zip(refs, inputs)):
+            _folded.move_to_end(key)
+            return result
+    result = compute()
+    # Folded results are shared by later evaluations, so they are read-only.
+    # Tensors holding them copy them on their first in-place write.
+    result._storage.flags.writeable = False
+    result._shared = True
+    _folded[key] = ([weakref.ref(data) for data in inputs], result)
+    if len(_folded) > FOLD_CACHE_SIZE:
+        _folded.popitem(last=False)
+    return result
+
+
+def record(fn, vals):
+    """
+    Record an elementwise Function call in the current :func:`lazy` scope.
+
+    Args:
+        fn (:class:`FunctionBase`): elementwise Function
+        vals (list): arguments of `fn.apply`
+
+    Returns:
+        :class:`Tensor` : tensor whose data is computed on first use
+    """
+    tensors = [v for v in vals if isinstance(v, Variable)]
+    need_grad = any(v.history is not None for v in tensors)
+    shape = functools.reduce(shape_broadcast, (v.shape for v in tensors))
+    dtype = np.result_type(*(v.dtype for v in tensors))
+    ctx = Context(not need_grad)
+    data = LazyData(fn, ctx, vals, shape, dtype, _scopes[-1])
+    back = History(fn, ctx, vals) if need_grad else None
+    return fn.variable((data, tensors[0].backend), back)
@@ -0,0 +1,172 @@
+"""
+Neural network layers built from the tensor Functions of a backend.
+"""
+
+from .module import Module, Parameter
+from .tensor_functions import (
+    rand,
+    TensorFunctions,
+    AFFINE_ACTIVATIONS,
+    conv1d,
+    conv2d,
+    max_pool2d,
+    avg_pool2d,
+)
+
+
+class Linear(Module):
+    """
+    Fully connected layer computing `activation(x @ weights + bias)` with one
+    `Affine` Function of the backend, so the bias and the activation do not
+    need their own passes or intermediates, forward or backward.
+
+    Args:
+        in_size (int): size of the last dimension of the inputs
+        out_size (int): size of the last dimension of the outputs
+        activation (str, optional): None, "relu" or "sigmoid"
+        backend (:class:`Backend`): tensor backend of the parameters
+
+    Attributes:
+        weights (:class:`Parameter`): weights of shape (in_size, out_size),
+            initialized uniformly in [-1, 1)
+        bias (:class:`Parameter`): bias of shape (out_size,), initialized
+            uniformly in [-1, 1)
+    """
+
+    def __init__(self, in_size, out_size, activation=None, backend=TensorFunctions):
+        super().__init__()
+        if activation not in AFFINE_ACTIVATIONS:
+            raise ValueError(f"Unknown activation {activation}.")
+        self.weights = Parameter(2 * (rand((in_size, out_size), backend=backend) - 0.5))
+        self.bias = Parameter(2 * (rand((out_size,), backend=backend) - 0.5))
+        self.in_size = in_size
+        self.out_size = out_size
+        self.activation = activation
+
+    def forward(self, x):
+        return x.backend.Affine.apply(
+            x, self.weights.value, self.bias.value, self.activation
+        )
+
+
+class _Conv(Module):
+    "Convolution layer with `n` spatial dimensions, see :class:`Conv2d`."
+
+    n = None
+    conv = None
+
+    def __init__(
+        self,
+        in_channels,
+        out_channels,
+        kernel_size,
+        stride=1,
+        padding=0,
+        dilation=1,
+        backend=TensorFunctions,
+    ):
+        super().__init__()
+        if isinstance(kernel_size, int):
+            kernel_size = (kernel_size,) * self.n
+        shape = (out_channels, in_channels) + tuple(kernel_size)
+        self.weights = Parameter(2 * (rand(shape, backend=backend) - 0.5))
+        self.bias = Parameter(2 * (rand((out_channels,), backend=backend) - 0.5))
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.stride = stride
+        self.padding = padding
+        self.dilation = dilation
+
+    def forward(self, x):
+        out = self.conv(
+            x, self.weights.value, self.stride, self.padding, self.dilation
+        )
+        return out + self.bias.value.view(self.out_channels, *([1] * self.n))
+
+
+class Conv1d(_Conv):
+    """
+    1-D convolution layer computing `conv1d(x, weights) + bias`, see
+    :func:`conv1d`.
+
+    Args:
+        in_channels (int): channels of the inputs (batch, in_channels, width)
+        out_channels (int): channels of the outputs
+        kernel_size (int): width of the kernels
+        stride (int): step between two positions of the kernel
+        padding (int): zeros added on both sides of the inputs
+        dilation (int): step between two elements read by the kernel
+        backend (:class:`Backend`): tensor backend of the parameters
+
+    Attributes:
+        weights (:class:`Parameter`): kernels of shape
+            (out_channels, in_channels, kernel_size), initialized uniformly
+            in [-1, 1)
+        bias (:class:`Parameter`): bias of shape (out_channels,), initialized
+            uniformly in [-1, 1)
+    """
+
+    n = 1
+    conv = staticmethod(conv1d)
+
+
+class Conv2d(_Conv):
+    """
+    2-D convolution layer computing `conv2d(x, weights) + bias`, see
+    :func:`conv2d`.
+
+    Args:
+        in_channels (int): channels of the inputs (batch, in_channels, h, w)
+        out_channels (int): channels of the outputs
+        kernel_size (int or tuple): (height, width) of the kernels
+        stride (int or tuple): step between two positions of the kernel
+        padding (int or tuple): zeros added on both sides of the inputs
+        dilation (int or tuple): step between two elements read by the kernel
+        backend (:class:`Backend`): tensor backend of the parameters
+
+    Attributes:
+        weights (:class:`Parameter`): kernels of shape
+            (out_channels, in_channels, *kernel_size), initialized uniformly
+            in [-1, 1)
+        bias (:class:`Parameter`): bias of shape (out_channels,), initialized
+            uniformly in [-1, 1)
+    """
+
+    n = 2
+    conv = staticmethod(conv2d)
+
+
+class MaxPool2d(Module):
+    """
+    Maximum of each window of the inputs, see :func:`max_pool2d`.
+
+    Args:
+        kernel_size (int or tuple): (height, width) of the windows
+        stride (int or tuple): step between two windows, `kernel_size` if None
+    """
+
+    def __init__(self, kernel_size, stride=None):
+        super().__init__()
+        self.kernel_size = kernel_size
+        self.stride = stride
+
+    def forward(self, x):
+        return max_pool2d(x, self.kernel_size, self.stride)
+
+
+class AvgPool2d(Module):
+    """
+    Mean of each window of the inputs, see :func:`avg_pool2d`.
+
+    Args:
+        kernel_size (int or tuple): (height, width) of the windows
+        stride (int or tuple): step between two windows, `kernel_size` if None
+    """
+
+    def __init__(self, kernel_size, stride=None):
+        super().__init__()
+        self.kernel_size = kernel_size
+        self.stride = stride
+
+    def forward(self, x):
+        return avg_pool2d(x, self.kernel_size, self.stride)
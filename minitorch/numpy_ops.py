@@ -0,0 +1,578 @@
+import builtins
+import functools
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from . import operators
+from .fusion import FUSABLE
+from .parallel import parallel_for, run_chunked, split_axis, unaliased
+from .tensor_data import shape_broadcast, matmul_shape
+
+
+# Whole-array equivalents of the scalar functions in `operators.py`, see
+# :func:`operators.register`.
+UFUNCS = operators.VECTORIZED
+
+
+def vectorize(fn, nin):
+    """
+    Find the whole-array version of a scalar function.
+
+    Args:
+        fn: scalar function from `operators.py` (or any python function)
+        nin (int): number of arguments of `fn`
+
+    Returns:
+        function : array function, falls back to :func:`numpy.frompyfunc`
+        for functions without a registered equivalent.
+    """
+    vec = operators.vectorized(fn)
+    if vec is not None:
+        return vec
+    return np.frompyfunc(fn, nin, 1)
+
+
+def strided_view(storage, shape, strides):
+    """
+    View `storage` as an ndarray with the given shape and (element) strides.
+
+    Args:
+        storage (array): tensor storage
+        shape (array): tensor shape
+        strides (array): tensor strides
+
+    Returns:
+        array : view sharing memory with `storage`
+    """
+    itemsize = storage.strides[0]
+    return as_strided(
+        storage,
+        shape=tuple(int(s) for s in shape),
+        strides=tuple(int(s) * itemsize for s in strides),
+    )
+
+
+def tensor_map(fn):
+    """
+    NumPy higher-order tensor map function. See `tensor_ops.py` for description.
+
+    Args:
+        fn: function mappings floats-to-floats to apply.
+        out (array): storage for out tensor.
+        out_shape (array): shape for out tensor.
+        out_strides (array): strides for out tensor.
+        in_storage (array): storage for in tensor.
+        in_shape (array): shape for in tensor.
+        in_strides (array): strides for in tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+    vec = vectorize(fn, 1)
+
+    def kernel(out_view, in_view):
+        out_view[...] = vec(in_view)
+
+    def _map(out, out_shape, out_strides, in_storage, in_shape, in_strides):
+        out_view = strided_view(out, out_shape, out_strides)
+        in_view = strided_view(in_storage, in_shape, in_strides)
+        run_chunked(kernel, out_view, in_view)
+
+    return _map
+
+
+def map(fn):
+    """
+    Higher-order tensor map function ::
+
+      fn_map = map(fn)
+      b = fn_map(a)
+
+    Args:
+        fn: function from float-to-float to apply.
+        a (:class:`TensorData`): tensor to map over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+               should broadcast with `a`
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    f = tensor_map(fn)
+
+    def ret(a, out=None):
+        if out is None:
+            out = a.empty(a.shape)
+        f(*out.tuple(), *a.tuple())
+        return out
+
+    return ret
+
+
+def tensor_zip(fn):
+    """
+    NumPy higher-order tensor zip function. See `tensor_ops.py` for description.
+
+    Args:
+        fn: function maps two floats to float to apply.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor.
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+    vec = vectorize(fn, 2)
+
+    def kernel(out_view, a_view, b_view):
+        out_view[...] = vec(a_view, b_view)
+
+    def _zip(
+        out,
+        out_shape,
+        out_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        b_storage,
+        b_shape,
+        b_strides,
+    ):
+        out_view = strided_view(out, out_shape, out_strides)
+        a_view = strided_view(a_storage, a_shape, a_strides)
+        b_view = strided_view(b_storage, b_shape, b_strides)
+        run_chunked(kernel, out_view, a_view, b_view)
+
+    return _zip
+
+
+def zip(fn):
+    """
+    Higher-order tensor zip function.
+
+      fn_zip = zip(fn)
+      c = fn_zip(a, b)
+
+    Args:
+        fn: function from two floats-to-float to apply
+        a (:class:`TensorData`): tensor to zip over
+        b (:class:`TensorData`): tensor to zip over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+               should broadcast with `a` and `b`
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    f = tensor_zip(fn)
+
+    def ret(a, b, out=None):
+        if out is None:
+            if a.shape != b.shape:
+                c_shape = shape_broadcast(a.shape, b.shape)
+            else:
+                c_shape = a.shape
+            out = a.empty(c_shape, dtype=np.result_type(a.dtype, b.dtype))
+        f(*out.tuple(), *a.tuple(), *b.tuple())
+        return out
+
+    return ret
+
+
+# Elements summed at once per step of a compensated sum.
+REDUCE_BLOCK = 1 << 12
+
+
+def _two_sum(a, b):
+    "Sums `a + b` and their exact rounding errors."
+    s = a + b
+    bp = s - a
+    return s, (a - (s - bp)) + (b - bp)
+
+
+def _reduced_last(a_view, axes):
+    "`a_view` with `axes` moved to the end and flattened into one axis."
+    kept = tuple(i for i in range(a_view.ndim) if i not in axes)
+    x = a_view.transpose(kept + axes)
+    return x.reshape(x.shape[: len(kept)] + (-1,))
+
+
+def compensated_sum(a_view, axes):
+    """
+    Sum `a_view` over `axes` with compensated summation. Blocks of
+    `REDUCE_BLOCK` elements are added as a tree of halves, keeping the exact
+    rounding error of every addition, and the block sums are accumulated
+    the same way.
+
+    Args:
+        a_view (array): array to sum
+        axes (tuple): axes to sum over
+
+    Returns:
+        array : the sums, with `axes` kept with size 1
+    """
+    x = _reduced_last(a_view, axes)
+    acc = np.zeros(x.shape[:-1], dtype=x.dtype)
+    comp = np.zeros_like(acc)
+    for k in range(0, x.shape[-1], REDUCE_BLOCK):
+        block = x[..., k : k + REDUCE_BLOCK]
+        while block.shape[-1] > 1:
+            half = block.shape[-1] // 2
+            s, e = _two_sum(block[..., :half], block[..., half : 2 * half])
+            comp += np.add.reduce(e, axis=-1)
+            block = np.concatenate([s, block[..., 2 * half :]], axis=-1)
+        acc, e = _two_sum(acc, block[..., 0])
+        comp += e
+    shape = [1 if i in axes else s for i, s in enumerate(a_view.shape)]
+    return (acc + comp).reshape(shape)
+
+
+def tensor_reduce(fn, compensated=False):
+    """
+    NumPy higher-order tensor reduce function. See `tensor_ops.py` for description.
+
+    Args:
+        fn: associative reduction function mapping two floats to float.
+        compensated (bool): use compensated summation, `fn` must be addition.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        reduce_shape (array): shape of reduction (1 for dimension kept, shape value for dimensions summed out)
+        reduce_size (int): size of reduce shape
+
+    Returns:
+        None : Fills in `out`
+    """
+    ufunc = vectorize(fn, 2)
+    if not isinstance(ufunc, np.ufunc):
+        ufunc = np.frompyfunc(fn, 2, 1)
+
+    def _reduce(
+        out,
+        out_shape,
+        out_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        reduce_shape,
+        reduce_size,
+    ):
+        out_view = strided_view(out, out_shape, out_strides)
+        a_view = strided_view(a_storage, a_shape, a_strides)
+        axes = tuple(i for i, s in enumerate(out_shape) if s == 1)
+
+        def kernel(out_view, a_view):
+            if compensated:
+                result = compensated_sum(a_view, axes)
+            else:
+                result = ufunc.reduce(a_view, axis=axes, keepdims=True)
+            # `out` holds the start value, fold it in like the other backends.
+            out_view[...] = ufunc(out_view, result)
+
+        # Chunks of independent out cells, along a dimension that is kept.
+        axis = split_axis(out_shape)
+        if axis is None:
+            kernel(out_view, a_view)
+            return
+
+        def run(start, stop):
+            index = (slice(None),) * axis + (slice(start, stop),)
+            kernel(out_view[index], a_view[index])
+
+        parallel_for(run, out_shape[axis], a_view.size // out_shape[axis])
+
+    return _reduce
+
+
+def reduce(fn, start=0.0, compensated=False):
+    """
+    Higher-order tensor reduce function. ::
+
+      fn_reduce = reduce(fn)
+      out = fn_reduce(a, dims)
+
+    Args:
+        fn: associative function from two floats-to-float to apply
+        start (float): value the reduction starts from
+        compensated (bool): use compensated summation, `fn` must be addition
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list, optional): list of dims to reduce
+        out (:class:`TensorData`, optional): tensor to reduce into
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+
+    f = tensor_reduce(fn, compensated)
+
+    def ret(a, dims=None, out=None):
+        old_shape = None
+        if out is None:
+            out_shape = list(a.shape)
+            for d in dims:
+                out_shape[d] = 1
+            # Other values when not sum.
+            out = a.empty(tuple(out_shape))
+            out._tensor._storage[:] = start
+        else:
+            old_shape = out.shape
+            diff = len(a.shape) - len(out.shape)
+            out = out.view(*([1] * diff + list(old_shape)))
+
+        # Assume they are the same dim
+        assert len(out.shape) == len(a.shape)
+
+        # Create a reduce shape / reduce size
+        reduce_shape = []
+        reduce_size = 1
+        for i, s in enumerate(a.shape):
+            if out.shape[i] == 1:
+                reduce_shape.append(s)
+                reduce_size *= s
+            else:
+                reduce_shape.append(1)
+
+        # Apply
+        f(*out.tuple(), *a.tuple(), reduce_shape, reduce_size)
+
+        if old_shape is not None:
+            out = out.view(*old_shape)
+        return out
+
+    return ret
+
+
+# Whole-array selection of the element chosen by a reduction function.
+ARG_UFUNCS = {
+    operators.max: np.argmax,
+    operators.minimum: np.argmin,
+}
+
+
+def tensor_arg_reduce(fn):
+    """
+    NumPy higher-order tensor reduce function that also records which element
+    each result comes from. See `tensor_ops.py` for description.
+
+    Args:
+        fn: reduction function in `ARG_UFUNCS`.
+
+    Returns:
+        None : Fills in `out` and `arg`
+    """
+    select = ARG_UFUNCS[fn]
+
+    def _arg_reduce(
+        out,
+        out_shape,
+        out_strides,
+        arg,
+        arg_shape,
+        arg_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        reduce_shape,
+        reduce_size,
+    ):
+        a_view = strided_view(a_storage, a_shape, a_strides)
+        axes = tuple(i for i, s in enumerate(out_shape) if s == 1)
+        x = _reduced_last(a_view, axes)
+        best = select(x, axis=-1)[..., None]
+        strided_view(arg, arg_shape, arg_strides)[...] = best.reshape(out_shape)
+        values = np.take_along_axis(x, best, axis=-1)
+        strided_view(out, out_shape, out_strides)[...] = values.reshape(out_shape)
+
+    return _arg_reduce
+
+
+def arg_reduce(fn):
+    """
+    Higher-order tensor reduce function returning the reduced values and
+    the positions they come from. See `tensor_ops.py` for description.
+
+    Args:
+        fn: function from two floats to one of them
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list): list of dims to reduce
+
+    Returns:
+        tuple : values and int64 positions, with the reduced dimensions kept
+    """
+
+    f = tensor_arg_reduce(fn)
+
+    def ret(a, dims):
+        out_shape = tuple(1 if d in dims else s for d, s in enumerate(a.shape))
+        reduce_shape = [s if d in dims else 1 for d, s in enumerate(a.shape)]
+        out = a.empty(out_shape)
+        arg = a.empty(out_shape, dtype=np.int64)
+        reduce_size = int(np.prod(reduce_shape))
+        f(*out.tuple(), *arg.tuple(), *a.tuple(), reduce_shape, reduce_size)
+        return out, arg
+
+    return ret
+
+
+def tensor_matrix_multiply(
+    out,
+    out_shape,
+    out_strides,
+    a_storage,
+    a_shape,
+    a_strides,
+    b_storage,
+    b_shape,
+    b_strides,
+):
+    """
+    NumPy tensor matrix multiply, `numpy.matmul` on strided views (the BLAS
+    kernel behind it is blocked already).
+
+    Args:
+        out (array): storage for `out` tensor, filled with zeros.
+        out_shape (array): shape for `out` tensor (3-D).
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor (3-D).
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor (3-D).
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+    out_view = strided_view(out, out_shape, out_strides)
+    out_view[...] = np.matmul(
+        strided_view(a_storage, a_shape, a_strides),
+        strided_view(b_storage, b_shape, b_strides),
+    )
+
+
+def matrix_multiply(a, b):
+    """
+    Batched matrix multiply. 2-D tensors are multiplied as a batch of one
+    matrix, and the batch dimension of 3-D tensors is broadcast ::
+
+        for n:
+          for i:
+            for j:
+              for k:
+                out[n, i, j] += a[n, i, k] * b[n, k, j]
+
+    Args:
+        a (:class:`TensorData`): tensor data `a`, 2-D or 3-D
+        b (:class:`TensorData`): tensor data `b`, 2-D or 3-D
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    out = a.zeros(
+        matmul_shape(a.shape, b.shape), dtype=np.result_type(a.dtype, b.dtype)
+    )
+    tensor_matrix_multiply(
+        *out._tensor.as_batch().tuple(),
+        *a._tensor.as_batch().tuple(),
+        *b._tensor.as_batch().tuple(),
+    )
+    return out
+
+
+# Elements evaluated at once by fused kernels, so that the temporaries of
+# each step stay in cache.
+NARY_CHUNK = 1 << 16
+
+
+def tensor_nary(fn, nin, nout):
+    """
+    NumPy higher-order n-ary tensor zip function. See `tensor_ops.py` for
+    description. The output is processed in chunks of about `NARY_CHUNK`
+    elements along the dimension of :func:`split_axis`, split between threads
+    (see :func:`parallel_for`).
+
+    Args:
+        fn: function of `nin` values returning a tuple of `nout` values.
+        nin (int): number of input tensors.
+        nout (int): number of output tensors.
+        *args (arrays): storage, shape and strides of each output, then of
+            each input, all outputs having the same shape.
+
+    Returns:
+        None : Fills in the outputs
+    """
+
+    def _nary(*args):
+        views = [strided_view(*args[3 * j : 3 * j + 3]) for j in range(nout + nin)]
+        outs = views[:nout]
+        shape = outs[0].shape
+        ins = [np.broadcast_to(v, shape) for v in views[nout:]]
+        for out in outs:
+            ins = [unaliased(v, out) for v in ins]
+        axis = split_axis(shape)
+        if axis is None:
+            for out, result in builtins.zip(outs, fn(*ins)):
+                out[...] = result
+            return
+        step = max(1, NARY_CHUNK * shape[axis] // outs[0].size)
+
+        def run(start, stop):
+            for r in range(start, stop, step):
+                index = (slice(None),) * axis + (slice(r, min(r + step, stop)),)
+                results = fn(*(v[index] for v in ins))
+                for out, result in builtins.zip(outs, results):
+                    out[index] = result
+
+        parallel_for(run, shape[axis], outs[0].size // shape[axis])
+
+    return _nary
+
+
+def nary(program):
+    """
+    Higher-order n-ary tensor zip for fused kernels (see `fusion.py`). ::
+
+      fn_nary = nary(program)
+      out, = fn_nary(a, b, c)
+
+    Args:
+        program (:class:`FusedProgram`): program to compile
+        *tensors (:class:`TensorData`): tensors to zip over, broadcast together
+        out (list of :class:`TensorData`): optional, one tensor data per output
+            of `program` to fill in
+
+    Returns:
+        list of :class:`TensorData` : one new tensor data per output
+    """
+    namespace = {
+        name: UFUNCS[getattr(operators, name)] for name in FUSABLE
+    }
+    f = tensor_nary(program.compile(namespace), program.nin, program.nout)
+
+    def ret(*tensors, out=None):
+        if out is None:
+            shape = functools.reduce(shape_broadcast, (t.shape for t in tensors))
+            dtype = np.result_type(*(t.dtype for t in tensors))
+            out = [tensors[0].empty(shape, dtype=dtype) for _ in range(program.nout)]
+        f(
+            *(x for o in out for x in o.tuple()),
+            *(x for t in tensors for x in t.tuple()),
+        )
+        return out
+
+    return ret
+
+
+class NumpyOps:
+    map = map
+    zip = zip
+    reduce = reduce
+    arg_reduce = arg_reduce
+    matrix_multiply = matrix_multiply
+    nary = nary
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 ## Task 0.1
 ## Mathematical operators
@@ -76,6 +77,11 @@ def max(x, y):
     return x if x > y else y
 
 
+def minimum(x, y):
+    ":math:`f(x) =` x if x is less than y else y"
+    return x if x < y else y
+
+
 def sigmoid(x):
     r"""
     :math:`f(x) =  \frac{1.0}{(1.0 + e^{-x})}`
@@ -109,6 +115,15 @@ def relu(x):
     return float(x) if x > 0.0 else 0.0
 
 
+def softplus(x):
+    """
+    :math:`f(x) = log(1 + e^x)`
+
+    Calculate as :math:`max(x, 0) + log(1 + e^{-|x|})` for stability.
+    """
+    return (x if x > 0.0 else 0.0) + math.log1p(math.exp(-abs(x)))
+
+
 def relu_back(x, y):
 
     # :math:`f(x) =` y if x is greater than 0 else 0"
@@ -130,6 +145,20 @@ def exp(x):
     return math.exp(x)
 
 
+def logaddexp(x, y):
+    r"""
+    :math:`f(x, y) = log(e^x + e^y)`
+
+    Calculate as :math:`m + log(1 + e^{-|x - y|})` with :math:`m = max(x, y)`
+    for stability. It is associative, so reducing with it from
+    :math:`-\infty` computes a log-sum-exp in one pass.
+    """
+    m = x if x > y else y
+    if m == -math.inf:
+        return m
+    return m + math.log1p(math.exp(-abs(x - y)))
+
+
 def log_back(a, b):
     return b / (a + EPS)
 
@@ -264,3 +293,81 @@ def prod(ls):
     # TODO: Implement for Task 0.3.
 
     return reduce(mul, 1)(ls)
+
+
+## Vectorized and JIT variants of the scalar functions.
+
+# Array-in, array-out implementations, see :func:`register`.
+VECTORIZED = {}
+
+# Implementations compiled by JIT backends (Numba), see :func:`register`.
+JIT_FORMS = {}
+
+
+def register(fn, vectorized=None, jit=None):
+    """
+    Register faster variants of the scalar function `fn`, that backends use
+    in place of calling `fn` once per element.
+
+    Args:
+        fn: scalar function
+        vectorized: function of arrays computing `fn` elementwise, with the
+            same results. Reductions use it too if it is a ufunc.
+        jit: scalar function with the same results that Numba can compile
+    """
+    if vectorized is not None:
+        VECTORIZED[fn] = vectorized
+    if jit is not None:
+        JIT_FORMS[fn] = jit
+
+
+def vectorized(fn):
+    "The registered array variant of `fn`, or None."
+    return VECTORIZED.get(fn)
+
+
+def jit_form(fn):
+    "The registered JIT variant of `fn`, `fn` itself by default."
+    return JIT_FORMS.get(fn, fn)
+
+
+def _sigmoid_array(x):
+    # Same branches as `sigmoid`, without overflow in `exp`.
+    e = np.exp(-np.abs(x))
+    return np.where(x >= 0, 1.0 / (1.0 + e), e / (1.0 + e))
+
+
+def _sigmoid_jit(x):
+    # Same branches as `sigmoid`, with a single `exp`.
+    if x >= 0.0:
+        return 1.0 / (1.0 + math.exp(-x))
+    e = math.exp(x)
+    return e / (1.0 + e)
+
+
+def _relu_jit(x):
+    return x if x > 0.0 else 0.0
+
+
+register(neg, np.negative)
+register(id, np.positive)
+register(sigmoid, _sigmoid_array, jit=_sigmoid_jit)
+# `np.maximum` and `np.minimum` propagate NaN, the comparisons below select
+# like the scalar functions instead.
+register(relu, lambda x: np.where(x > 0.0, x, 0.0), jit=_relu_jit)
+register(log, lambda x: np.log(x + EPS))
+register(exp, np.exp)
+register(softplus, lambda x: np.logaddexp(0.0, x))
+register(inv, np.reciprocal)
+register(add, np.add)
+register(sub, np.subtract)
+register(mul, np.multiply)
+register(lt, np.less)
+register(gt, np.greater)
+register(eq, np.equal)
+register(max, lambda x, y: np.where(x > y, x, y))
+register(minimum, lambda x, y: np.where(x < y, x, y))
+register(logaddexp, np.logaddexp)
+register(relu_back, lambda x, y: np.where(x > 0, y, 0.0))
+register(log_back, lambda x, y: y / (x + EPS))
+register(inv_back, lambda x, y: -(1.0 / x ** 2) * y)
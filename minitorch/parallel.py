@@ -0,0 +1,147 @@
+"""
+Chunked execution of kernels on a pool of threads.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numba
+import numpy as np
+
+# Options used by :func:`parallel_for`, see :func:`set_parallel_options`.
+PARALLEL_OPTIONS = {"threads": os.cpu_count() or 1, "min_chunk": 1 << 16}
+
+_lock = threading.Lock()
+_executor = None
+_executor_threads = 0
+
+
+def set_parallel_options(threads=None, min_chunk=None):
+    """
+    Set how kernels split their work across threads. Options left as None
+    are unchanged.
+
+    Args:
+        threads (int): number of threads, 1 runs every kernel serially. Also
+            sets the number of threads of the Numba kernels (up to the
+            number Numba was started with).
+        min_chunk (int): minimum number of elements per chunk, kernels on
+            fewer elements run serially
+    """
+    if threads is not None:
+        PARALLEL_OPTIONS["threads"] = max(1, int(threads))
+        numba.set_num_threads(
+            min(PARALLEL_OPTIONS["threads"], numba.config.NUMBA_NUM_THREADS)
+        )
+    if min_chunk is not None:
+        PARALLEL_OPTIONS["min_chunk"] = max(1, int(min_chunk))
+
+
+def _get_executor():
+    """
+    The shared thread pool, replaced when the number of threads changes. The
+    previous pool is not shut down, callers may still be submitting to it,
+    its threads exit once it is garbage collected.
+    """
+    global _executor, _executor_threads
+    threads = PARALLEL_OPTIONS["threads"]
+    with _lock:
+        if _executor is None or _executor_threads != threads:
+            _executor = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix="minitorch"
+            )
+            _executor_threads = threads
+        return _executor
+
+
+def chunk_ranges(length, inner=1):
+    """
+    Split `range(length)` into at most one contiguous chunk per thread, each
+    of at least `min_chunk` elements.
+
+    Args:
+        length (int): number of indices to split
+        inner (int): number of elements per index
+
+    Returns:
+        list : (start, stop) pairs covering `range(length)`
+    """
+    count = (length * inner) // PARALLEL_OPTIONS["min_chunk"]
+    count = max(1, min(PARALLEL_OPTIONS["threads"], count, length))
+    bounds = [length * k // count for k in range(count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parallel_for(fn, length, inner=1):
+    """
+    Call `fn(start, stop)` on the chunks of :func:`chunk_ranges` in the
+    thread pool, and wait for all of them. A single chunk runs in the calling
+    thread. `fn` should spend its time in code that releases the GIL (NumPy
+    or Numba `nogil` loops) for the chunks to run concurrently.
+
+    Args:
+        fn: function of the (start, stop) of a chunk, writing disjoint outputs
+        length (int): number of indices to split
+        inner (int): number of elements per index
+    """
+    ranges = chunk_ranges(length, inner)
+    if len(ranges) == 1:
+        fn(0, length)
+        return
+    executor = _get_executor()
+    futures = [executor.submit(fn, start, stop) for start, stop in ranges]
+    for future in futures:
+        future.result()
+
+
+def split_axis(shape):
+    """
+    Axis of `shape` to split into chunks: the first one with at least as many
+    entries as threads, or else the longest one (e.g. the last axis of a
+    (2, N) output). None if no axis has more than one entry.
+    """
+    threads = PARALLEL_OPTIONS["threads"]
+    longest = None
+    for d, s in enumerate(shape):
+        if s > 1 and s >= threads:
+            return d
+        if s > 1 and (longest is None or s > shape[longest]):
+            longest = d
+    return longest
+
+
+def unaliased(in_view, out_view):
+    "`in_view`, or a copy if it may overlap `out_view` other than elementwise."
+    if not np.may_share_memory(in_view, out_view):
+        return in_view
+    a, b = in_view.__array_interface__, out_view.__array_interface__
+    if a["data"] == b["data"] and in_view.strides == out_view.strides:
+        return in_view
+    return np.array(in_view)
+
+
+def run_chunked(kernel, out_view, *in_views):
+    """
+    Call `kernel(out_chunk, *in_chunks)` on chunks of `out_view` along the
+    axis of :func:`split_axis`, in parallel (see :func:`parallel_for`), with
+    the inputs broadcast to the shape of the output. Inputs that may overlap
+    the output with another layout (e.g. a transposed view of it) are copied
+    first, later chunks would otherwise read elements already written.
+
+    Args:
+        kernel: function filling in its first argument from the others
+        out_view (array): output
+        *in_views (arrays): inputs, broadcastable to `out_view`
+    """
+    shape = out_view.shape
+    ins = [unaliased(np.broadcast_to(v, shape), out_view) for v in in_views]
+    axis = split_axis(shape)
+    if axis is None:
+        kernel(out_view, *ins)
+        return
+
+    def run(start, stop):
+        index = (slice(None),) * axis + (slice(start, stop),)
+        kernel(out_view[index], *(v[index] for v in ins))
+
+    parallel_for(run, shape[axis], out_view.size // shape[axis])
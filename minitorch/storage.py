@@ -0,0 +1,148 @@
+"""
+Pooled allocation of tensor storage.
+"""
+
+import threading
+import weakref
+import numpy as np
+from .operators import prod
+from .tensor_data import TensorData
+
+
+class _Lease:
+    """
+    Owner of a pooled buffer while it is in use. Storage arrays are created
+    from the lease, so numpy keeps it as the base of the storage and of every
+    view of it (permute, slice, numpy array, ...): the lease is collected,
+    and the buffer released, once none of them is alive.
+    """
+
+    def __init__(self, buffer, size):
+        self._buffer = buffer
+        self.__array_interface__ = buffer[:size].__array_interface__
+
+
+class StoragePool:
+    """
+    Size-bucketed allocator for tensor storage.
+
+    Buffers are allocated with a bucketed number of elements (at most a
+    quarter more than requested) and handed out as a view of the requested
+    size. Once that view and every view of it are garbage collected the
+    buffer goes back to the free list of its bucket, and is reused by a later
+    request for the same bucket and dtype.
+
+    Attributes:
+        max_bytes (int): largest number of bytes kept in the free lists
+        hits (int): allocations served from the pool
+        misses (int): allocations that needed a new buffer
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._free = {}
+        self._bytes = 0
+        # Re-entrant: `_release` runs from `weakref.finalize`, which garbage
+        # collection may trigger while this thread holds the lock.
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def bucket(size):
+        """
+        Number of elements of the buffer used for `size` elements: `size`
+        rounded up to an eighth of the next power of two.
+        """
+        size = max(int(size), 1)
+        step = max((1 << (size - 1).bit_length()) // 8, 1)
+        return -(-size // step) * step
+
+    def _take(self, size, dtype):
+        key = (dtype.str, self.bucket(size))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buffer = free.pop()
+                self._bytes -= buffer.nbytes
+                self.hits += 1
+                return buffer
+            self.misses += 1
+        return np.empty(key[1], dtype=dtype)
+
+    def _release(self, buffer):
+        key = (buffer.dtype.str, buffer.shape[0])
+        with self._lock:
+            if self._bytes + buffer.nbytes <= self.max_bytes:
+                self._free.setdefault(key, []).append(buffer)
+                self._bytes += buffer.nbytes
+
+    def empty(self, shape, dtype=np.float64):
+        """
+        Allocate uninitialized storage, for outputs that will be fully
+        overwritten.
+
+        Args:
+            shape (tuple): shape of tensor
+            dtype (numpy dtype): element type of the storage
+
+        Returns:
+            :class:`TensorData` : new tensor data backed by a pooled buffer
+        """
+        dtype = np.dtype(dtype)
+        size = int(prod(shape))
+        buffer = self._take(size, dtype)
+        lease = _Lease(buffer, size)
+        weakref.finalize(lease, self._release, buffer)
+        return TensorData(np.asarray(lease), tuple(shape))
+
+    def full(self, shape, value, dtype=np.float64):
+        """
+        Allocate storage filled with `value`.
+
+        Args:
+            shape (tuple): shape of tensor
+            value (float): fill value
+            dtype (numpy dtype): element type of the storage
+
+        Returns:
+            :class:`TensorData` : new tensor data backed by a pooled buffer
+        """
+        data = self.empty(shape, dtype)
+        data._storage.fill(value)
+        return data
+
+    def stats(self):
+        """
+        Returns:
+            dict : hits, misses, number of pooled buffers and their bytes
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "buffers": sum(len(free) for free in self._free.values()),
+                "bytes_in_pool": self._bytes,
+            }
+
+    def clear(self):
+        "Drop all pooled buffers and reset the statistics."
+        with self._lock:
+            self._free = {}
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+default_pool = StoragePool()
+
+
+def pool_stats():
+    """
+    Statistics of the default storage pool used by `zeros`, `ones`, `empty`
+    and the outputs of the backend kernels.
+
+    Returns:
+        dict : hits, misses, number of pooled buffers and their bytes
+    """
+    return default_pool.stats()
@@ -3,8 +3,15 @@ Implementation of the core Tensor object for autodifferentiation.
 """
 
 from .autodiff import Variable
-from .tensor_data import TensorData
-from . import operators
+from .tensor_data import TensorData, IndexingError
+from .storage import default_pool
+from .lazy_tensor import LazyData
+from numbers import Integral
+import functools
+import numpy as np
+
+# Python numbers used in tensor expressions, kept as shared constant tensors.
+CONSTANT_CACHE_SIZE = 256
 
 
 class Tensor(Variable):
@@ -14,23 +21,39 @@ class Tensor(Variable):
 
     Attributes:
 
-        _tensor (:class:`TensorData`) : the tensor data storage
+        _tensor (:class:`TensorData`) : the tensor data storage, computed on
+            first access for the results of :func:`lazy` operations
         backend : backend object used to implement tensor math (see `tensor_functions.py`)
     """
 
     def __init__(self, v, back=None, name=None, backend=None):
-        assert isinstance(v, TensorData)
+        assert isinstance(v, (TensorData, LazyData))
         assert backend is not None
         super().__init__(back, name=name)
-        self._tensor = v
+        self._data = v
         self.backend = backend
 
+    @property
+    def _tensor(self):
+        if isinstance(self._data, LazyData):
+            self._data = self._data.materialize()
+        return self._data
+
+    @_tensor.setter
+    def _tensor(self, v):
+        self._data = v
+
     def to_numpy(self):
         """
         Returns:
-             narray : converted to numpy array
+             narray : numpy view of the tensor, sharing its storage (no copy)
         """
-        return self.contiguous()._tensor._storage.reshape(self.shape)
+        return np.asarray(self)
+
+    @property
+    def __array_interface__(self):
+        "Expose the storage to numpy with the tensor's shape and strides."
+        return self._tensor.__array_interface__
 
     # Properties
     @property
@@ -39,7 +62,7 @@ class Tensor(Variable):
         Returns:
              tuple : shape of the tensor
         """
-        return self._tensor.shape
+        return self._data.shape
 
     @property
     def size(self):
@@ -47,7 +70,7 @@ class Tensor(Variable):
         Returns:
              int : size of the tensor
         """
-        return self._tensor.size
+        return self._data.size
 
     @property
     def dims(self):
@@ -55,12 +78,22 @@ class Tensor(Variable):
         Returns:
              int : dimensionality of the tensor
         """
-        return self._tensor.dims
+        return self._data.dims
+
+    @property
+    def dtype(self):
+        """
+        Returns:
+             dtype : numpy element type of the storage
+        """
+        return self._data.dtype
 
     def _ensure_tensor(self, b):
-        "Turns a python number into a tensor with the same backend."
+        "Turns a python number into a (shared, read-only) tensor with the same backend."
         if isinstance(b, (int, float)):
-            b = Tensor.make([b], (1,), backend=self.backend)
+            # Promoted like numpy, e.g. an integer tensor times 0.5 is float.
+            dtype = np.result_type(self.dtype, b)
+            b = _constant(float(b).hex(), self.backend, dtype.str)
         else:
             b._type_(self.backend)
         return b
@@ -80,6 +113,10 @@ class Tensor(Variable):
             self, self.backend.Inv.apply(self._ensure_tensor(b))
         )
 
+    def __matmul__(self, b):
+        "Matrix multiply of 2-D or batched 3-D tensors"
+        return self.backend.MatMul.apply(self, b)
+
     def __lt__(self, b):
         return self.backend.LT.apply(self, self._ensure_tensor(b))
 
@@ -104,13 +141,43 @@ class Tensor(Variable):
     def exp(self):
         return self.backend.Exp.apply(self)
 
-    def sum(self, dim=None):
-        "Compute the sum over dimension `dim`"
-        return self.backend.Sum.apply(self, dim)
+    def sum(self, dim=None, keepdim=True, compensated=False):
+        """
+        Compute the sum over dimension `dim`, an int or a tuple of ints, in
+        one pass. Reduced dimensions are kept with size 1 unless `keepdim` is
+        False. With no `dim`, sum everything into a tensor of shape (1,).
+        Long sums are computed pairwise, `compensated` uses the slower but
+        more accurate compensated (Kahan) summation instead.
+        """
+        return self.backend.Sum.apply(self, dim, keepdim, compensated)
+
+    def mean(self, dim=None, keepdim=True, compensated=False):
+        "Compute the mean over dimension `dim`, see :meth:`sum`"
+        return self.backend.Mean.apply(self, dim, keepdim, compensated)
+
+    def max(self, dim=None, keepdim=True):
+        "Compute the maximum over dimension `dim`, see :meth:`sum`"
+        return self.backend.Max.apply(self, dim, keepdim)
 
-    def mean(self, dim=None):
-        "Compute the mean over dimension `dim`"
-        return self.backend.Mean.apply(self, dim)
+    def min(self, dim=None, keepdim=True):
+        "Compute the minimum over dimension `dim`, see :meth:`sum`"
+        return self.backend.Min.apply(self, dim, keepdim)
+
+    def argmax(self, dim=None, keepdim=True):
+        """
+        Positions of the maximum over dimension `dim`, see :meth:`sum`, as an
+        int64 tensor. Positions are counted in row-major order over the
+        reduced dimensions (the index along `dim` for a single dimension).
+        """
+        return self.backend.Argmax.apply(self, dim, keepdim)
+
+    def prod(self, dim=None, keepdim=True):
+        "Compute the product over dimension `dim`, see :meth:`sum`"
+        return self.backend.Prod.apply(self, dim, keepdim)
+
+    def logsumexp(self, dim=None, keepdim=True):
+        "Compute `log(sum(exp(self)))` over dimension `dim` without overflow"
+        return self.backend.LogSumExp.apply(self, dim, keepdim)
 
     def permute(self, *order):
         "Permute tensor dimensions to *order"
@@ -120,23 +187,158 @@ class Tensor(Variable):
         "Change the shape of the tensor to a new shape with the same size"
         return self.backend.View.apply(self, shape)
 
+    def take(self, indices):
+        "Elements at the flat (row-major) `indices`, as a 1-D tensor"
+        return self.backend.Take.apply(self, indices)
+
+    def index_select(self, dim, index):
+        "Entries of dimension `dim` at the positions in `index`"
+        return self.backend.IndexSelect.apply(self, dim, index)
+
     def contiguous(self):
         "Return a contiguous tensor with the same data"
         return self.backend.Copy.apply(self)
 
+    # In-place operations write into the storage of this tensor. They are
+    # not recorded by autodiff, and backward fails if a value it saved was
+    # modified this way.
+    def _writable(self):
+        """
+        Copy-on-write of shared constants (numbers, or results folded from
+        them by :func:`lazy`): give this tensor its own copy before writing.
+        The copy keeps the version counter, so values saved for backward
+        still see the write. Other read-only storage is an error.
+        """
+        data = self._tensor
+        if data._shared:
+            values = np.array(np.asarray(data)).reshape(-1)
+            self._tensor = TensorData(values, data.shape, version=data._version)
+        elif not data._storage.flags.writeable:
+            raise ValueError(
+                "Cannot write in place to read-only storage (e.g. a file mapped "
+                'with mode "r", use mode "c" for copy-on-write).'
+            )
+
+    def _unaliased(self, other):
+        """
+        `other`, or a copy of it if it overlaps the memory of this tensor
+        with another layout (e.g. `t.add_(t.permute(1, 0))`). Kernels writing
+        into this tensor would otherwise read elements they already wrote.
+        """
+        a, b = self._tensor, other._tensor
+        if not np.shares_memory(a._storage, b._storage):
+            return other
+        a_array, b_array = a.__array_interface__, b.__array_interface__
+        same_layout = (
+            a.shape == b.shape
+            and a_array["strides"] == b_array["strides"]
+            and a_array["data"] == b_array["data"]
+        )
+        return other if same_layout else self.backend._id_map(other)
+
+    def _inplace(self, kernel, *others):
+        for other in others:
+            if TensorData.shape_broadcast(self.shape, other.shape) != self.shape:
+                raise IndexingError(
+                    f"Cannot broadcast {other.shape} into {self.shape} in place."
+                )
+        self._writable()
+        others = [self._unaliased(other) for other in others]
+        kernel(self, *others, out=self)
+        self._tensor._version.bump()
+        return self
+
+    def add_(self, b):
+        return self._inplace(self.backend._add_zip, self._ensure_tensor(b))
+
+    def sub_(self, b):
+        return self._inplace(self.backend._sub_zip, self._ensure_tensor(b))
+
+    def mul_(self, b):
+        return self._inplace(self.backend._mul_zip, self._ensure_tensor(b))
+
+    def div_(self, b):
+        inv = self.backend._inv_map(self._ensure_tensor(b))
+        return self._inplace(self.backend._mul_zip, inv)
+
+    def neg_(self):
+        return self._inplace(self.backend._neg_map)
+
+    def sigmoid_(self):
+        return self._inplace(self.backend._sigmoid_map)
+
+    def relu_(self):
+        return self._inplace(self.backend._relu_map)
+
+    def log_(self):
+        return self._inplace(self.backend._log_map)
+
+    def exp_(self):
+        return self._inplace(self.backend._exp_map)
+
+    def fill_(self, value):
+        "Set every element to `value`"
+        value = self._ensure_tensor(value)
+        self._writable()
+        self.backend._id_map(value, out=self)
+        self._tensor._version.bump()
+        return self
+
+    def zero_(self):
+        return self.fill_(0.0)
+
     def __repr__(self):
         return self._tensor.to_string()
 
+    def _is_position(self, key):
+        "Is `key` a full index of a single element (rather than a slice)."
+        if isinstance(key, tuple):
+            return len(key) == self.dims and all(
+                isinstance(k, Integral) for k in key
+            )
+        return self.dims == 1 and isinstance(key, Integral)
+
     def __getitem__(self, key):
-        return self._tensor.get(key)
+        """
+        A full integer index returns the element as a float. Any other key of
+        ints and slices (e.g. `t[2:10, :]`, `t[:, 0]`) returns a tensor that
+        views the same storage, without copying.
+        """
+        if self._is_position(key):
+            return self._tensor.get(key)
+        return self.backend.Slice.apply(self, key)
 
     def __setitem__(self, key, val):
-        self._tensor.set(key, val)
+        self._writable()
+        if self._is_position(key):
+            self._tensor.set(key, val)
+        else:
+            view = self._new(self._tensor.slice(key))
+            val = view._unaliased(self._ensure_tensor(val))
+            self.backend._id_map(val, out=view)
+            self._tensor._version.bump()
 
     @property
     def grad(self):
         return self.derivative
 
+    @property
+    def _version(self):
+        return self._tensor._version
+
+    def _add_deriv(self, val):
+        # Accumulate in place, the gradient buffer is allocated once.
+        assert self.history.is_leaf(), "Only leaf variables can have derivatives."
+        if self._derivative is None:
+            self._derivative = self.zeros()
+        self._derivative.add_(val)
+
+    def zero_grad_(self):
+        if self._derivative is None:
+            self._derivative = self.zeros()
+        else:
+            self._derivative.zero_()
+
     # Internal methods used for autodiff.
     def _type_(self, backend):
         self.backend = backend
@@ -147,9 +349,9 @@ class Tensor(Variable):
         return Tensor(tensor_data, backend=self.backend)
 
     @staticmethod
-    def make(storage, shape, strides=None, backend=None):
+    def make(storage, shape, strides=None, backend=None, dtype=None):
         "Create a new tensor from data"
-        return Tensor(TensorData(storage, shape, strides), backend=backend)
+        return Tensor(TensorData(storage, shape, strides, dtype), backend=backend)
 
     def expand(self, other):
         "Method used to allow for backprop over reduce."
@@ -157,7 +359,7 @@ class Tensor(Variable):
         if self.shape == other.shape:
             return other
         shape = TensorData.shape_broadcast(self.shape, other.shape)
-        buf = self.zeros(shape)
+        buf = self.empty(shape)
         self.backend._id_map(other, out=buf)
         if self.shape == shape:
             return buf
@@ -166,31 +368,26 @@ class Tensor(Variable):
         self.backend._add_reduce(buf, out=buf2)
         return buf2
 
-    def zeros(self, shape=None):
-        def zero(shape):
-            return Tensor.make(
-                [0] * int(operators.prod(shape)), shape, backend=self.backend
-            )
-
-        if shape is None:
-            out = zero(self.shape)
+    def _full(self, shape, value, dtype):
+        shape = self.shape if shape is None else shape
+        dtype = self.dtype if dtype is None else dtype
+        if value is None:
+            data = default_pool.empty(shape, dtype)
         else:
-            out = zero(shape)
+            data = default_pool.full(shape, value, dtype)
+        out = Tensor(data, backend=self.backend)
         out._type_(self.backend)
         return out
 
-    def ones(self, shape=None):
-        def one(shape):
-            return Tensor.make(
-                [1] * int(operators.prod(shape)), shape, backend=self.backend
-            )
+    def zeros(self, shape=None, dtype=None):
+        return self._full(shape, 0.0, dtype)
 
-        if shape is None:
-            out = one(self.shape)
-        else:
-            out = one(shape)
-        out._type_(self.backend)
-        return out
+    def ones(self, shape=None, dtype=None):
+        return self._full(shape, 1.0, dtype)
+
+    def empty(self, shape=None, dtype=None):
+        "Uninitialized tensor, for outputs that will be fully overwritten."
+        return self._full(shape, None, dtype)
 
     def tuple(self):
         return self._tensor.tuple()
@@ -199,7 +396,20 @@ class Tensor(Variable):
         return Tensor(self._tensor, backend=self.backend)
 
     def backward(self, grad_output=None):
+        # Run pending lazy operations, backward needs their saved values.
+        self._tensor
         if grad_output is None:
             assert self.shape == (1,), "Must provide grad_output if non-scalar"
-            grad_output = Tensor.make([1.0], (1,), backend=self.backend)
+            grad_output = Tensor.make(
+                [1.0], (1,), backend=self.backend, dtype=self.dtype
+            )
         super().backward(grad_output)
+
+
+@functools.lru_cache(maxsize=CONSTANT_CACHE_SIZE)
+def _constant(value, backend, dtype):
+    "Read-only tensor of shape (1,) holding the float with hex `value`."
+    out = Tensor.make([float.fromhex(value)], (1,), backend=backend, dtype=dtype)
+    out._tensor._storage.flags.writeable = False
+    out._tensor._shared = True
+    return out
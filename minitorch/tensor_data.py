@@ -1,4 +1,6 @@
+import functools
 import random
+from numbers import Integral
 from .operators import prod
 from numpy import array, float64, ndarray
 import numba
@@ -55,14 +57,11 @@ def count(position, shape, out_index):
 
     # TODO: Implement for Task 2.1.
 
-    # Provided by class Lecture
-    ##################################################
-    strides = strides_from_shape(shape)
-    for index, stride in enumerate(strides):
-        new_elem = position // stride
-        position = position - (new_elem * stride)
-        out_index[index] = new_elem
-    ##################################################
+    # Peel off the innermost dimension first, no strides are needed.
+    cur = position
+    for i in range(len(shape) - 1, -1, -1):
+        out_index[i] = int(cur % shape[i])
+        cur = cur // shape[i]
 
 
 def broadcast_index(big_index, big_shape, shape, out_index):
@@ -97,6 +96,71 @@ def broadcast_index(big_index, big_shape, shape, out_index):
             out_index[i] = 0
 
 
+def broadcast_strides(big_shape, shape, strides):
+    """
+    Align the `strides` of a tensor with `shape` to the dimensions of
+    `big_shape`, following broadcasting rules. Broadcast dimensions (missing
+    or of size 1 in `shape`) get a stride of 0, so walking `big_shape` with
+    the result revisits the same storage positions.
+
+    Args:
+        big_shape (array-like): tensor shape of bigger tensor
+        shape (array-like): tensor shape of smaller tensor
+        strides (array-like): tensor strides of smaller tensor
+
+    Returns:
+        list : strides with one entry per dimension of `big_shape`
+    """
+    offset = len(big_shape) - len(shape)
+    out = [0] * len(big_shape)
+    for i in range(len(shape)):
+        if shape[i] != 1:
+            out[i + offset] = int(strides[i])
+    return out
+
+
+def strided_positions(shape, *all_strides):
+    """
+    Walk every index of `shape` in order (the same order as :func:`count`)
+    and yield the storage position of that index under each of the given
+    strides.
+
+    Indices are advanced like an odometer: the innermost dimension is
+    incremented and carries into outer dimensions when it wraps, with the
+    running positions updated by the matching strides. This makes each step
+    O(1) amortized instead of re-deriving the index from scratch.
+
+    Args:
+        shape (array-like): shape to iterate over
+        *all_strides (array-like): strides aligned to `shape`, one per operand
+
+    Yields:
+        tuple : storage positions, one per operand
+    """
+    dims = len(shape)
+    shape = [int(s) for s in shape]
+    all_strides = [[int(s) for s in strides] for strides in all_strides]
+    operands = range(len(all_strides))
+    size = int(prod(shape))
+
+    index = [0] * dims
+    positions = [0] * len(all_strides)
+    for _ in range(size):
+        yield tuple(positions)
+        d = dims - 1
+        while d >= 0:
+            index[d] += 1
+            if index[d] < shape[d]:
+                for k in operands:
+                    positions[k] += all_strides[k][d]
+                break
+            # Wrap this dimension and carry into the next one.
+            index[d] = 0
+            for k in operands:
+                positions[k] -= all_strides[k][d] * (shape[d] - 1)
+            d -= 1
+
+
 def shape_broadcast(shape1, shape2):
     """
     Broadcast two shapes to create a new union shape.
@@ -114,19 +178,122 @@ def shape_broadcast(shape1, shape2):
 
     # TODO: Implement for Task 2.4.
 
-    a = list(np.zeros(shape1).shape)
-    b = list(np.zeros(shape2).shape)
-
-    if all((m == n) or (m == 1) or (n == 1) for m, n in zip(a[::-1], b[::-1])):
-        if len(a) < len(b):
-            a = list([1] * (len(b) - len(a))) + a
+    # Work on the shape tuples only, never allocate the tensors themselves.
+    a = [int(s) for s in shape1]
+    b = [int(s) for s in shape2]
+    if len(a) < len(b):
+        a = [1] * (len(b) - len(a)) + a
+    else:
+        b = [1] * (len(a) - len(b)) + b
+
+    out = []
+    for m, n in zip(a, b):
+        if m == n or n == 1:
+            out.append(m)
+        elif m == 1:
+            out.append(n)
         else:
-            b = list([1] * (len(a) - len(b))) + b
+            raise IndexingError(f"Cannot broadcast {shape1} and {shape2}.")
+    return tuple(out)
 
-        return tuple([max(m, n) for m, n in zip(a[::1], b[::1])])
-    else:
 
-        raise IndexingError("Cannot Broadcast")
+def matmul_shape(a_shape, b_shape):
+    """
+    Shape of the matrix product of two 2-D or 3-D (batched) tensors. The batch
+    dimension is broadcast.
+
+    Args:
+        a_shape (tuple) : shape of the left tensor
+        b_shape (tuple) : shape of the right tensor
+
+    Returns:
+        tuple : shape of the product
+
+    Raises:
+        IndexingError : if the shapes do not match
+    """
+    if not (2 <= len(a_shape) <= 3 and 2 <= len(b_shape) <= 3):
+        raise IndexingError(f"Cannot multiply {a_shape} and {b_shape}, not matrices.")
+    if a_shape[-1] != b_shape[-2]:
+        raise IndexingError(f"Cannot multiply {a_shape} and {b_shape}.")
+    batch = shape_broadcast(a_shape[:-2], b_shape[:-2])
+    return batch + (a_shape[-2], b_shape[-1])
+
+
+PLAN_CACHE_SIZE = 128
+# Only plans of up to this many positions are cached, which bounds the cache
+# to PLAN_CACHE_SIZE * PLAN_CACHE_MAX_SIZE * 8 bytes (16 MiB).
+PLAN_CACHE_MAX_SIZE = 1 << 14
+
+# Options used by `TensorData.to_string`, see :func:`set_printoptions`.
+PRINT_OPTIONS = {"threshold": 1000, "edgeitems": 3, "precision": 2}
+
+
+def set_printoptions(threshold=None, edgeitems=None, precision=None):
+    """
+    Set how tensors are printed. Options left as None are unchanged.
+
+    Args:
+        threshold (int): tensors with more elements than this are summarized
+        edgeitems (int): number of items kept at the start and end of each
+            summarized dimension
+        precision (int): number of digits after the decimal point
+    """
+    for key, value in [
+        ("threshold", threshold),
+        ("edgeitems", edgeitems),
+        ("precision", precision),
+    ]:
+        if value is not None:
+            PRINT_OPTIONS[key] = int(value)
+
+
+def broadcast_plan(out_shape, in_shape, in_strides):
+    """
+    Precompute the storage position read from a tensor with `in_shape` and
+    `in_strides` for every index of `out_shape` (in the order of
+    :func:`count`), following broadcasting rules.
+
+    Plans only depend on shapes and strides, so plans of up to
+    `PLAN_CACHE_MAX_SIZE` positions are memoized in an LRU cache of
+    `PLAN_CACHE_SIZE` entries and reused by repeated calls with the same
+    layouts (e.g. successive training steps). Larger plans are built on each
+    call and freed with their result.
+
+    Args:
+        out_shape (array-like): tensor shape of the output
+        in_shape (array-like): tensor shape of the input
+        in_strides (array-like): tensor strides of the input
+
+    Returns:
+        array : read-only array of `size(out_shape)` storage positions
+    """
+    key = (
+        tuple(int(s) for s in out_shape),
+        tuple(int(s) for s in in_shape),
+        tuple(int(s) for s in in_strides),
+    )
+    if prod(key[0]) > PLAN_CACHE_MAX_SIZE:
+        return _make_plan(*key)
+    return _broadcast_plan(*key)
+
+
+def _make_plan(out_shape, in_shape, in_strides):
+    strides = broadcast_strides(out_shape, in_shape, in_strides)
+    plan = np.zeros(out_shape, dtype=np.int64)
+    for d, (size, stride) in enumerate(zip(out_shape, strides)):
+        if stride != 0:
+            axis = [1] * len(out_shape)
+            axis[d] = size
+            plan += (np.arange(size, dtype=np.int64) * stride).reshape(axis)
+    plan = plan.reshape(-1)
+    plan.flags.writeable = False
+    return plan
+
+
+_broadcast_plan = functools.lru_cache(maxsize=PLAN_CACHE_SIZE)(_make_plan)
+broadcast_plan.cache_info = _broadcast_plan.cache_info
+broadcast_plan.cache_clear = _broadcast_plan.cache_clear
 
 
 def strides_from_shape(shape):
@@ -138,12 +305,33 @@ def strides_from_shape(shape):
     return tuple(reversed(layout[:-1]))
 
 
+class VersionCounter:
+    """
+    Number of in-place modifications of a storage. It is shared by all the
+    views of that storage, so that autodiff can detect that a value saved
+    for backward was changed.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+
 class TensorData:
-    def __init__(self, storage, shape, strides=None):
+    def __init__(self, storage, shape, strides=None, dtype=None, version=None):
         if isinstance(storage, ndarray):
+            if dtype is not None and storage.dtype != dtype:
+                storage = storage.astype(dtype)
             self._storage = storage
         else:
-            self._storage = array(storage, dtype=float64)
+            self._storage = array(storage, dtype=float64 if dtype is None else dtype)
+        self.dtype = self._storage.dtype
+        self._version = VersionCounter() if version is None else version
+        # Set on read-only storage reused by many tensors (number constants
+        # and results folded from them), which in-place operations copy.
+        self._shared = False
 
         if strides is None:
             strides = strides_from_shape(shape)
@@ -158,7 +346,9 @@ class TensorData:
         self.dims = len(strides)
         self.size = int(prod(shape))
         self.shape = shape
-        assert len(self._storage) == self.size
+        # Views (e.g. slices) may only use part of a larger storage.
+        extent = 1 + sum((s - 1) * st for s, st in zip(shape, strides))
+        assert self.size == 0 or len(self._storage) >= extent
 
     def to_cuda_(self):
         if not numba.cuda.is_cuda_array(self._storage):
@@ -166,16 +356,17 @@ class TensorData:
 
     def is_contiguous(self):
         """
-        Check that the layout is contiguous, i.e. outer dimensions have bigger strides than inner dimensions.
+        Check that the layout is contiguous, i.e. the strides are the row-major
+        strides of the shape (ignoring dimensions of size 1). Permuted or
+        sliced views are generally not contiguous.
 
         Returns:
             bool : True if contiguous
         """
-        last = 1e9
-        for stride in self._strides:
-            if stride > last:
+        expected = strides_from_shape(self.shape)
+        for stride, size, exp in zip(self.strides, self.shape, expected):
+            if size != 1 and stride != exp:
                 return False
-            last = stride
         return True
 
     @staticmethod
@@ -200,6 +391,74 @@ class TensorData:
         # Call fast indexing.
         return index_to_position(array(index), self._strides)
 
+    def positions(self, indices):
+        """
+        Storage positions of a batch of indices, checked in one pass.
+
+        Args:
+            indices (array-like): (k, dims) array of indices
+
+        Returns:
+            array : k storage positions
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.ndim != 2 or indices.shape[1] != self.dims:
+            raise IndexingError(
+                f"Indices of shape {indices.shape} must be (k, {self.dims})."
+            )
+        if (indices < 0).any():
+            raise IndexingError("Negative indexing not supported.")
+        if (indices >= self._shape).any():
+            raise IndexingError(f"Indices out of range {self.shape}.")
+        return indices @ self._strides
+
+    def _axis_key(self, indices, dim):
+        "Numpy key selecting the entries `indices` of dimension `dim`, checked."
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if ((indices < 0) | (indices >= self.shape[dim])).any():
+            raise IndexingError(f"Indices out of range {self.shape[dim]}.")
+        return (slice(None),) * dim + (indices,)
+
+    def gather(self, indices, dim=None):
+        """
+        Read the elements at a batch of indices.
+
+        Args:
+            indices (array-like): (k, dims) array of indices, or with `dim`
+                k entries of dimension `dim`
+            dim (int): optional, select whole slices along this dimension
+
+        Returns:
+            array : the k values, or with `dim` an array of the shape of the
+            tensor with `k` entries in dimension `dim`
+        """
+        if dim is not None:
+            return np.asarray(self)[self._axis_key(indices, dim)]
+        return self._storage[self.positions(indices)]
+
+    def scatter(self, indices, values, accumulate=False, dim=None):
+        """
+        Write elements at a batch of indices.
+
+        Args:
+            indices (array-like): (k, dims) array of indices, or with `dim`
+                k entries of dimension `dim`
+            values (array-like): k values (with `dim`, an array of the shape
+                returned by :meth:`gather`), or a single value
+            accumulate (bool): add to the elements instead of replacing them,
+                repeated indices then add up
+            dim (int): optional, write whole slices along this dimension
+        """
+        if dim is not None:
+            target, key = np.asarray(self), self._axis_key(indices, dim)
+        else:
+            target, key = self._storage, self.positions(indices)
+        if accumulate:
+            np.add.at(target, key, values)
+        else:
+            target[key] = values
+        self._version.bump()
+
     def indices(self):
         lshape = array(self.shape)
         out_index = array(self.shape)
@@ -207,6 +466,55 @@ class TensorData:
             count(i, lshape, out_index)
             yield tuple(out_index)
 
+    def slice(self, key):
+        """
+        View part of the tensor with a key of ints and slices, e.g.
+        `(slice(2, 10), 0)` for `t[2:10, 0]`. Dimensions indexed by an int are
+        dropped and missing trailing dimensions are kept whole.
+
+        Args:
+            key (int, slice or tuple): index with one entry per leading dimension
+
+        Returns:
+            :class:`TensorData`: a new TensorData sharing the same storage.
+
+        Raises:
+            IndexingError : if the key does not fit the shape
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.dims:
+            raise IndexingError(f"Index {key} has too many entries for {self.shape}.")
+
+        offset = 0
+        shape = []
+        strides = []
+        for i, k in enumerate(key):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(self.shape[i])
+                if step < 1:
+                    raise IndexingError(f"Slice step must be positive in {key}.")
+                shape.append(max(0, (stop - start + step - 1) // step))
+                strides.append(int(self.strides[i]) * step)
+                offset += start * int(self.strides[i])
+            elif isinstance(k, Integral):
+                if k < 0 or k >= self.shape[i]:
+                    raise IndexingError(f"Index {key} out of range {self.shape}.")
+                offset += int(k) * int(self.strides[i])
+            else:
+                raise IndexingError(f"Unsupported index {k} in {key}.")
+
+        shape += list(self.shape[len(key) :])
+        strides += [int(s) for s in self.strides[len(key) :]]
+        if not shape:
+            shape, strides = [1], [1]
+        return TensorData(
+            self._storage[offset:],
+            tuple(shape),
+            tuple(strides),
+            version=self._version,
+        )
+
     def sample(self):
         return tuple((random.randint(0, s - 1) for s in self.shape))
 
@@ -215,10 +523,48 @@ class TensorData:
 
     def set(self, key, val):
         self._storage[self.index(key)] = val
+        self._version.bump()
 
     def tuple(self):
         return (self._storage, self._shape, self._strides)
 
+    def as_batch(self):
+        """
+        View a matrix as a batch of one matrix, for the matrix multiply kernels.
+
+        Returns:
+            :class:`TensorData` : 3-D tensor data sharing the storage
+        """
+        if self.dims == 3:
+            return self
+        assert self.dims == 2, "Only matrices can be viewed as a batch."
+        return TensorData(
+            self._storage,
+            (1,) + tuple(self.shape),
+            (0,) + tuple(self.strides),
+            version=self._version,
+        )
+
+    def as_strided(self, shape, strides, offset=0):
+        """
+        View the storage with any shape and strides, e.g. the overlapping
+        windows of a convolution, where an element can appear many times.
+
+        Args:
+            shape (tuple): shape of the view
+            strides (tuple): strides of the view
+            offset (int): position in the storage of the first element
+
+        Returns:
+            :class:`TensorData` : tensor data sharing the storage
+        """
+        return TensorData(
+            self._storage[offset:],
+            tuple(int(s) for s in shape),
+            tuple(int(s) for s in strides),
+            version=self._version,
+        )
+
     def permute(self, *order):
         """
         Permute the dimensions of the tensor.
@@ -241,30 +587,62 @@ class TensorData:
             new_shape.append(self.shape[ind])
             new_stride.append(self.strides[ind])
 
-        new_TensorData = TensorData(tuple(self._storage), tuple(new_shape), tuple(new_stride))
+        # Only shape and strides change, the storage is shared (no copy).
+        return TensorData(
+            self._storage, tuple(new_shape), tuple(new_stride), version=self._version
+        )
 
-        return new_TensorData
+    @property
+    def __array_interface__(self):
+        """
+        Numpy array interface (version 3) describing the storage with this
+        shape and strides, so `numpy.asarray` views the data without copying.
+        """
+        interface = self._storage.__array_interface__
+        itemsize = self._storage.strides[0]
+        return {
+            "version": 3,
+            "shape": tuple(int(s) for s in self.shape),
+            "typestr": self._storage.dtype.str,
+            "data": interface["data"],
+            "strides": tuple(int(s) * itemsize for s in self.strides),
+        }
 
     def to_string(self):
-        s = ""
-        for index in self.indices():
-            l = ""
-            for i in range(len(index) - 1, -1, -1):
-                if index[i] == 0:
-                    l = "\n%s[" % ("\t" * i) + l
-                else:
-                    break
-            s += l
-            v = self.get(index)
-            s += f"{v:3.2f}"
-            l = ""
-            for i in range(len(index) - 1, -1, -1):
-                if index[i] == self.shape[i] - 1:
-                    l += "]"
-                else:
-                    break
-            if l:
-                s += l
+        """
+        Format the tensor, summarizing dimensions with first and last
+        `edgeitems` entries when there are more than `threshold` elements
+        (see :func:`set_printoptions`).
+
+        Returns:
+            str : formatted tensor
+        """
+        edge = PRINT_OPTIONS["edgeitems"]
+        summarize = self.size > PRINT_OPTIONS["threshold"]
+
+        # Select the printed elements first, so only those are formatted.
+        keep = []
+        cuts = []
+        for s in self.shape:
+            if summarize and s > 2 * edge:
+                keep.append(np.r_[0:edge, s - edge : s])
+                cuts.append(edge)
+            else:
+                keep.append(np.arange(s))
+                cuts.append(None)
+        values = np.asarray(self)[np.ix_(*keep)]
+        text = np.char.mod(f"%3.{PRINT_OPTIONS['precision']}f", values)
+
+        def block(text, depth):
+            if depth == len(cuts) - 1:
+                items = list(text)
+                ellipsis = "..."
             else:
-                s += " "
-        return s
+                items = [block(t, depth + 1) for t in text]
+                ellipsis = "\n" + "\t" * (depth + 1) + "..."
+            if cuts[depth] is not None:
+                items.insert(cuts[depth], ellipsis)
+            sep = " " if depth == len(cuts) - 1 else ""
+            return "\n" + "\t" * depth + "[" + sep.join(items) + "]"
+
+        return block(text, 0)
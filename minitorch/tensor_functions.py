@@ -5,9 +5,23 @@ Implementation of the autodifferentiation Functions for Tensor.
 
 from .autodiff import FunctionBase
 from .tensor_ops import TensorOps
+from .fast_ops import FastOps
+from .numpy_ops import NumpyOps
+from numbers import Integral
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from . import operators
 from .tensor import Tensor
+from .tensor_data import (
+    TensorData,
+    IndexingError,
+    strides_from_shape,
+    broadcast_plan,
+)
+from .storage import default_pool
+from .lazy_tensor import is_lazy, record
+from .fusion import Expr, FusedProgram
+import itertools
 import random
 
 
@@ -15,6 +29,15 @@ import random
 class Function(FunctionBase):
     data_type = Tensor
 
+    # Elementwise Functions are recorded instead of run in `lazy()` scopes.
+    elementwise = False
+
+    @classmethod
+    def apply(cls, *vals):
+        if cls.elementwise and is_lazy():
+            return record(cls, vals)
+        return super().apply(*vals)
+
     @staticmethod
     def variable(data, back):
         return Tensor(data[0], back, backend=data[1])
@@ -24,6 +47,81 @@ class Function(FunctionBase):
         return (a._tensor, a.backend)
 
 
+def _bce_with_logits_programs():
+    """
+    Fused programs of the binary cross-entropy of labels `y` against
+    `sigmoid(x)`, computed from the logits `x` as `softplus(x) - x * y`.
+
+    Returns:
+        tuple : forward program of (x, y) returning the loss and the sigmoid,
+        and backward program of (x, p, y, grad) returning the derivatives for
+        the logits, `(p - y) * grad` with `p` the saved sigmoid, and the labels
+    """
+    x, y = Expr("input", 0), Expr("input", 1)
+    forward = FusedProgram([x.softplus() - x * y, x.sigmoid()], 2)
+    x, p, y, grad = [Expr("input", i) for i in range(4)]
+    backward = FusedProgram([(p - y) * grad, -(x * grad)], 4)
+    return forward, backward
+
+
+BCE_WITH_LOGITS = _bce_with_logits_programs()
+
+
+def _affine_programs(activation):
+    """
+    Fused programs of the bias and activation of an affine layer.
+
+    Returns:
+        tuple : forward program of (h, bias) returning `activation(h + bias)`,
+        and backward program of (out, grad) returning the derivative for
+        `h + bias` from the saved output, or None without activation
+    """
+    h, bias = Expr("input", 0), Expr("input", 1)
+    out, grad = Expr("input", 0), Expr("input", 1)
+    if activation is None:
+        return FusedProgram([h + bias], 2), None
+    if activation == "relu":
+        # The output is positive exactly where the input is.
+        backward = Expr("relu_back", out, grad)
+        return FusedProgram([(h + bias).relu()], 2), FusedProgram([backward], 2)
+    if activation == "sigmoid":
+        backward = grad * out * (1.0 - out)
+        return FusedProgram([(h + bias).sigmoid()], 2), FusedProgram([backward], 2)
+    raise ValueError(f"Unknown activation {activation}.")
+
+
+def _prod_grad_programs():
+    """
+    Fused programs of the derivative of a product reduction, which is the
+    product of the other elements of the reduction.
+
+    Returns:
+        tuple : program of (a,) returning `a` with zeros replaced by 1 and
+        2 for zeros, 1 elsewhere, whose products over the reduction are the
+        product P of the non-zero elements and 2 to the number of zeros C,
+        and program of (a, P, C, grad) returning the derivatives: `P / a`
+        without zeros, P for a zero alone in its reduction, 0 otherwise
+    """
+    a = Expr("input", 0)
+    zero = Expr("eq", a, Expr("const", 0.0))
+    split = FusedProgram([a + zero, 1.0 + zero], 1)
+    a, nonzero, count, grad = [Expr("input", i) for i in range(4)]
+    zero = Expr("eq", a, Expr("const", 0.0))
+    none = Expr("eq", count, Expr("const", 1.0))
+    single = Expr("eq", count, Expr("const", 2.0))
+    mask = none * Expr("inv", a + zero) + single * zero
+    return split, FusedProgram([grad * nonzero * mask], 4)
+
+
+PROD_GRAD = _prod_grad_programs()
+
+
+AFFINE_ACTIVATIONS = {
+    activation: _affine_programs(activation)
+    for activation in (None, "relu", "sigmoid")
+}
+
+
 def make_tensor_backend(tensor_ops, is_cuda=False):
     """
     Dynamically construct a tensor backend based on a `tensor_ops` object
@@ -48,6 +146,7 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
 
     # Zips
     add_zip = tensor_ops.zip(operators.add)
+    sub_zip = tensor_ops.zip(operators.sub)
     mul_zip = tensor_ops.zip(operators.mul)
     lt_zip = tensor_ops.zip(operators.lt)
     eq_zip = tensor_ops.zip(operators.eq)
@@ -57,13 +156,33 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
 
     # Reduce
     add_reduce = tensor_ops.reduce(operators.add)
+    compensated_add_reduce = tensor_ops.reduce(operators.add, compensated=True)
+    mul_reduce = tensor_ops.reduce(operators.mul, 1.0)
+    logaddexp_reduce = tensor_ops.reduce(operators.logaddexp, -float("inf"))
+    max_arg_reduce = tensor_ops.arg_reduce(operators.max)
+    min_arg_reduce = tensor_ops.arg_reduce(operators.minimum)
+
+    matrix_multiply = tensor_ops.matrix_multiply
 
     class Backend:
         cuda = is_cuda
         _id_map = id_map
         _add_reduce = add_reduce
 
+        # Raw kernels used by the in-place Tensor methods.
+        _neg_map = neg_map
+        _sigmoid_map = sigmoid_map
+        _relu_map = relu_map
+        _log_map = log_map
+        _exp_map = exp_map
+        _inv_map = inv_map
+        _add_zip = add_zip
+        _sub_zip = sub_zip
+        _mul_zip = mul_zip
+
         class Neg(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, t1):
                 return neg_map(t1)
@@ -73,9 +192,14 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return neg_map(grad_output)
 
         class Inv(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, t1):
                 ctx.save_for_backward(t1)
+                # Reciprocals of integers (e.g. counts) are not integers.
+                if not np.issubdtype(t1.dtype, np.floating):
+                    t1 = id_map(t1, out=t1.empty(t1.shape, dtype=np.float64))
                 return inv_map(t1)
 
             @staticmethod
@@ -84,6 +208,8 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return inv_back_zip(t1, grad_output)
 
         class Add(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, t1, t2):
                 return add_zip(t1, t2)
@@ -93,6 +219,8 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return grad_output, grad_output
 
         class Mul(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a, b):
 
@@ -112,29 +240,35 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return grad_output * b, grad_output * a
 
         class Sigmoid(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a):
 
                 # TODO: Implement for Task 2.2.
 
-                ctx.save_for_backward(a)
+                out = sigmoid_map(a)
+                # Save the output, the derivative is out * (1 - out).
+                ctx.save_for_backward(out)
 
-                return sigmoid_map(a)
+                return out
 
             @staticmethod
             def backward(ctx, grad_output):
 
                 # TODO: Implement for Task 2.3.
 
-                a = ctx.saved_values
+                out = ctx.saved_values
 
-                one = a.ones(a.shape)
+                one = out.ones(out.shape)
 
-                f_prime = sigmoid_map(a) * (one - sigmoid_map(a))
+                f_prime = out * (one - out)
 
                 return f_prime * grad_output
 
         class ReLU(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a):
 
@@ -154,6 +288,8 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return relu_back_zip(a, grad_output)
 
         class Log(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a):
 
@@ -173,6 +309,8 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return log_back_zip(a, grad_output)
 
         class Exp(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a):
 
@@ -193,48 +331,122 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
 
         class Sum(Function):
             @staticmethod
-            def forward(ctx, a, dim):
-                ctx.save_for_backward(a.shape, dim)
-                if dim is not None:
-                    return add_reduce(a, [dim])
-                else:
-                    return add_reduce(a, list(range(a.dims))).view(1)
+            def forward(ctx, a, dim, keepdim, compensated):
+                dims = _reduce_dims(a, dim)
+                ctx.save_for_backward(dims, _kept(a, dims, dim, keepdim))
+                reduce = compensated_add_reduce if compensated else add_reduce
+                return _drop_dims(reduce(a, dims), dims, dim, keepdim)
 
             @staticmethod
             def backward(ctx, grad_output):
-                a_shape, dim = ctx.saved_values
-                # START Code Update
-                if dim is None:
-                    out = grad_output.zeros(a_shape)
-                    out._tensor._storage[:] = grad_output[0]
-                    return out
-                else:
-                    return grad_output
-                # END Code Update
+                # `expand` broadcasts the gradient back to the input shape.
+                dims, kept = ctx.saved_values
+                return grad_output if kept else _insert_dims(grad_output, dims)
 
         class Mean(Function):
             @staticmethod
-            def forward(ctx, a, dim):
+            def forward(ctx, a, dim, keepdim, compensated):
 
                 # TODO: Implement for Task 2.2.
 
-                if dim is not None:
-                    ctx.save_for_backward(a.shape[dim])
-                    return add_reduce(a, [dim]) / a.shape[dim]
-                else:
-                    ctx.save_for_backward(a.size)
-                    return add_reduce(a, list(range(a.dims))).view(1) / a.size
+                dims = _reduce_dims(a, dim)
+                count = int(operators.prod([a.shape[d] for d in dims]))
+                ctx.save_for_backward(dims, _kept(a, dims, dim, keepdim), count)
+                reduce = compensated_add_reduce if compensated else add_reduce
+                out = _drop_dims(reduce(a, dims), dims, dim, keepdim)
+                return out / count
 
             @staticmethod
             def backward(ctx, grad_output):
 
                 # TODO: Implement for Task 2.3.
 
-                a = ctx.saved_values
+                dims, kept, count = ctx.saved_values
+                grad = grad_output / count
+                return grad if kept else _insert_dims(grad, dims)
+
+        class Max(Function):
+            @staticmethod
+            def forward(ctx, a, dim, keepdim):
+                dims = _reduce_dims(a, dim)
+                out, arg = max_arg_reduce(a, dims)
+                ctx.save_for_backward(a.shape, arg)
+                return _drop_dims(out, dims, dim, keepdim)
 
-                return grad_output / a
+            @staticmethod
+            def backward(ctx, grad_output):
+                a_shape, arg = ctx.saved_values
+                return _arg_grad(grad_output, a_shape, arg)
+
+        class Min(Function):
+            @staticmethod
+            def forward(ctx, a, dim, keepdim):
+                dims = _reduce_dims(a, dim)
+                out, arg = min_arg_reduce(a, dims)
+                ctx.save_for_backward(a.shape, arg)
+                return _drop_dims(out, dims, dim, keepdim)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                a_shape, arg = ctx.saved_values
+                return _arg_grad(grad_output, a_shape, arg)
+
+        class Argmax(Function):
+            @staticmethod
+            def forward(ctx, a, dim, keepdim):
+                dims = _reduce_dims(a, dim)
+                _, arg = max_arg_reduce(a, dims)
+                ctx.save_for_backward(a.shape)
+                return _drop_dims(arg, dims, dim, keepdim)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                (a_shape,) = ctx.saved_values
+                return grad_output.zeros(a_shape)
+
+        class Prod(Function):
+            @staticmethod
+            def forward(ctx, a, dim, keepdim):
+                dims = _reduce_dims(a, dim)
+                ctx.save_for_backward(a, dims, _kept(a, dims, dim, keepdim))
+                return _drop_dims(mul_reduce(a, dims), dims, dim, keepdim)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                a, dims, kept = ctx.saved_values
+                grad = grad_output if kept else _insert_dims(grad_output, dims)
+                # One reduce of a (..., 2) buffer gives both the product of the
+                # non-zero elements and the number of zeros (as a power of 2).
+                split, backward = PROD_GRAD
+                pairs = a.empty(a.shape + (2,))
+                first = (slice(None),) * a.dims
+                views = [pairs._new(pairs._tensor.slice(first + (k,))) for k in (0, 1)]
+                split.kernel(tensor_ops)(a, out=views)
+                reduced = mul_reduce(pairs, dims)
+                nonzero, count = [
+                    reduced._new(reduced._tensor.slice(first + (k,))) for k in (0, 1)
+                ]
+                (out,) = backward.kernel(tensor_ops)(a, nonzero, count, grad)
+                return out
+
+        class LogSumExp(Function):
+            @staticmethod
+            def forward(ctx, a, dim, keepdim):
+                dims = _reduce_dims(a, dim)
+                out = logaddexp_reduce(a, dims)
+                ctx.save_for_backward(a, out, dims, _kept(a, dims, dim, keepdim))
+                return _drop_dims(out, dims, dim, keepdim)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                # The derivative is the softmax of `a` over the reduced dims.
+                a, out, dims, kept = ctx.saved_values
+                grad = grad_output if kept else _insert_dims(grad_output, dims)
+                return mul_zip(exp_map(sub_zip(a, out)), grad)
 
         class LT(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a, b):
 
@@ -257,6 +469,8 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
                 return grad_output * 0.0, grad_output * 0.0
 
         class EQ(Function):
+            elementwise = True
+
             @staticmethod
             def forward(ctx, a, b):
 
@@ -279,25 +493,240 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
 
                 # TODO: Implement for Task 2.2.
 
-                ctx.save_for_backward(a, order)
+                ctx.save_for_backward(order)
+
+                return a._new(a._tensor.permute(*order))
 
             @staticmethod
             def backward(ctx, grad_output):
 
                 # TODO: Implement for Task 2.3.
 
-                a, order = ctx.saved_values
+                order = ctx.saved_values
+                inverse = [order.index(i) for i in range(len(order))]
+
+                return grad_output._new(grad_output._tensor.permute(*inverse))
+
+        class Slice(Function):
+            @staticmethod
+            def forward(ctx, a, key):
+                ctx.save_for_backward(a.shape, key)
+                return a._new(a._tensor.slice(key))
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, key = ctx.saved_values
+                # Scatter the gradient into the sliced part of a zero tensor.
+                out = grad_output.zeros(shape)
+                id_map(grad_output, out=out._new(out._tensor.slice(key)))
+                return out
+
+        class Fused(Function):
+            elementwise = True
+
+            @staticmethod
+            def forward(ctx, program, *inputs):
+                ctx.save_for_backward(program, *inputs)
+                return program.kernel(tensor_ops)(*inputs)[0]
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                program, *inputs = ctx.saved_values
+                grads = program.grad.kernel(tensor_ops)(*inputs, grad_output)
+                return (None, *grads)
+
+        class BinaryCrossEntropyWithLogits(Function):
+            @staticmethod
+            def forward(ctx, logits, labels, reduction):
+                forward, _ = BCE_WITH_LOGITS
+                loss, prob = forward.kernel(tensor_ops)(logits, labels)
+                count = loss.size if reduction == "mean" else 1
+                ctx.save_for_backward(logits, prob, labels, count)
+                out = add_reduce(loss, list(range(loss.dims))).view(1)
+                return out / count if count > 1 else out
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                _, backward = BCE_WITH_LOGITS
+                logits, prob, labels, count = ctx.saved_values
+                grad = grad_output / count if count > 1 else grad_output
+                grad_logits, grad_labels = backward.kernel(tensor_ops)(
+                    logits, prob, labels, grad
+                )
+                return grad_logits, grad_labels, None
+
+        class Affine(Function):
+            @staticmethod
+            def forward(ctx, x, w, b, activation):
+                forward, _ = AFFINE_ACTIVATIONS[activation]
+                out = matrix_multiply(x, w)
+                # Bias and activation are applied in place, in one kernel.
+                forward.kernel(tensor_ops)(out, b, out=[out])
+                ctx.save_for_backward(x, w, b.shape, out, activation)
+                return out
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                x, w, b_shape, out, activation = ctx.saved_values
+                _, backward = AFFINE_ACTIVATIONS[activation]
+                if backward is None:
+                    grad = grad_output
+                else:
+                    (grad,) = backward.kernel(tensor_ops)(out, grad_output)
+                grad_x = matrix_multiply(grad, _transpose(w))
+                grad_w = matrix_multiply(_transpose(x), grad)
+                grad_b = add_reduce(grad, list(range(grad.dims - 1)))
+                return (
+                    x.expand(grad_x),
+                    w.expand(grad_w),
+                    grad_b.view(*b_shape),
+                    None,
+                )
+
+        # Convolutions of any number of spatial dimensions, as one matrix
+        # multiply of the weights with the patches of the input (im2col).
+        class Conv(Function):
+            @staticmethod
+            def forward(ctx, input, weight, stride, padding, dilation):
+                batch, out_channels = input.shape[0], weight.shape[0]
+                kernel = weight.shape[2:]
+                out_size = _conv_size(input.shape, kernel, stride, padding, dilation)
+                cols = _im2col(_pad(input, padding), kernel, stride, dilation, out_size)
+                w = id_map(weight).view(out_channels, cols.shape[2])
+                out = matrix_multiply(w, _transpose(cols))
+                ctx.save_for_backward(
+                    input.shape, cols, w, weight.shape, stride, padding, dilation
+                )
+                return out.view(batch, out_channels, *out_size)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, cols, w, weight_shape, stride, padding, dilation = (
+                    ctx.saved_values
+                )
+                batch, out_channels, *out_size = grad_output.shape
+                grad = id_map(grad_output).view(batch, out_channels, cols.shape[1])
+                grad_w = add_reduce(matrix_multiply(grad, cols), [0])
+                grad_cols = matrix_multiply(_transpose(w), grad)
+                grad_input = _col2im(
+                    grad_cols, shape, weight_shape[2:], stride, padding, dilation
+                )
+                return grad_input, grad_w.view(*weight_shape), None, None, None
+
+        Conv1d = Conv2d = Conv
+
+        class MaxPool2d(Function):
+            @staticmethod
+            def forward(ctx, input, kernel, stride):
+                windows = _pool_windows(input, kernel, stride)
+                out, arg = max_arg_reduce(windows, [4, 5])
+                positions = _pool_positions(input.shape, kernel, stride, arg)
+                ctx.save_for_backward(input.shape, positions, kernel, stride)
+                return out.view(*windows.shape[:4])
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, positions, kernel, stride = ctx.saved_values
+                out = grad_output.zeros(shape)
+                values = np.asarray(grad_output._tensor).reshape(-1)
+                if all(k <= st for k, st in zip(kernel, stride)):
+                    out._tensor._storage[positions] = values
+                else:
+                    # Overlapping windows can select the same element.
+                    np.add.at(out._tensor._storage, positions, values)
+                return out, None, None
+
+        class AvgPool2d(Function):
+            @staticmethod
+            def forward(ctx, input, kernel, stride):
+                windows = _pool_windows(input, kernel, stride)
+                out = add_reduce(windows, [4, 5])
+                scale = out._ensure_tensor(1.0 / (kernel[0] * kernel[1]))
+                mul_zip(out, scale, out=out)
+                ctx.save_for_backward(input.shape, scale, kernel, stride)
+                return out.view(*windows.shape[:4])
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, scale, kernel, stride = ctx.saved_values
+                grad = mul_zip(grad_output, scale)
+                out = grad.zeros(shape)
+                sb, sc, sh, sw = out._tensor.strides
+                window_strides = (sb, sc, sh * stride[0], sw * stride[1])
+                for i, j in itertools.product(range(kernel[0]), range(kernel[1])):
+                    target = out._new(
+                        out._tensor.as_strided(
+                            grad.shape, window_strides, i * sh + j * sw
+                        )
+                    )
+                    add_zip(target, grad, out=target)
+                return out, None, None
+
+        class MatMul(Function):
+            @staticmethod
+            def forward(ctx, a, b):
+                ctx.save_for_backward(a, b)
+                return matrix_multiply(a, b)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                a, b = ctx.saved_values
+                # Same kernel, reading `a` and `b` through transposed views.
+                grad_a = matrix_multiply(grad_output, _transpose(b))
+                grad_b = matrix_multiply(_transpose(a), grad_output)
+                return a.expand(grad_a), b.expand(grad_b)
+
+        class Take(Function):
+            @staticmethod
+            def forward(ctx, a, indices):
+                flat = np.asarray(indices, dtype=np.int64).reshape(-1)
+                if ((flat < 0) | (flat >= a.size)).any():
+                    raise IndexingError(f"Indices out of range for size {a.size}.")
+                index = np.stack(np.unravel_index(flat, a.shape), axis=1)
+                ctx.save_for_backward(a.shape, index)
+                return Tensor.make(
+                    a._tensor.gather(index), (len(flat),), backend=a.backend
+                )
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, index = ctx.saved_values
+                return _scatter_grad(grad_output, shape, index)
+
+        class IndexSelect(Function):
+            @staticmethod
+            def forward(ctx, a, dim, index):
+                dim = dim % a.dims
+                index = np.asarray(index, dtype=np.int64).reshape(-1)
+                # One gather along `dim`, without an index per element.
+                values = a._tensor.gather(index, dim=dim)
+                ctx.save_for_backward(a.shape, dim, index)
+                return Tensor.make(values.reshape(-1), values.shape, backend=a.backend)
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                shape, dim, index = ctx.saved_values
+                out = grad_output.zeros(shape)
+                values = np.asarray(grad_output._tensor)
+                out._tensor.scatter(index, values, accumulate=True, dim=dim)
+                return out, None, None
 
         class View(Function):
             @staticmethod
             def forward(ctx, a, shape):
                 ctx.save_for_backward(a.shape)
                 assert a._tensor.is_contiguous(), "Must be contiguous to view"
-                return Tensor.make(a._tensor._storage, shape, backend=a.backend)
+                return a._new(
+                    TensorData(a._tensor._storage, shape, version=a._tensor._version)
+                )
 
             @staticmethod
             def backward(ctx, grad_output):
                 original = ctx.saved_values
+                # The gradient may arrive as a strided view (e.g. from
+                # Permute.backward); copy it before reading its storage flat.
+                if not grad_output._tensor.is_contiguous():
+                    grad_output = id_map(grad_output)
                 return Tensor.make(
                     grad_output._tensor._storage, original, backend=grad_output.backend
                 )
@@ -314,25 +743,239 @@ def make_tensor_backend(tensor_ops, is_cuda=False):
     return Backend
 
 
+def _reduce_dims(a, dim):
+    "Sorted dimensions reduced by `dim`, an int, a tuple of ints or None (all)."
+    if dim is None:
+        return list(range(a.dims))
+    dims = [dim] if isinstance(dim, Integral) else list(dim)
+    dims = sorted(set(d % a.dims for d in dims))
+    if len(dims) == 0:
+        raise IndexingError("Need at least one dimension to reduce.")
+    return dims
+
+
+def _kept(a, dims, dim, keepdim):
+    "Does the reduced output of `a` broadcast back to its shape as is."
+    return dim is None or keepdim or len(dims) == a.dims
+
+
+def _drop_dims(out, dims, dim, keepdim):
+    "View of a reduced tensor with the reduced dimensions removed if asked."
+    if dim is None:
+        return out.view(1)
+    if keepdim:
+        return out
+    shape = [s for d, s in enumerate(out.shape) if d not in dims]
+    return out.view(*shape) if shape else out.view(1)
+
+
+def _insert_dims(t, dims):
+    "View of `t` with size-1 dimensions inserted at `dims`, undoing `_drop_dims`."
+    shape = list(t.shape)
+    strides = list(t._tensor.strides)
+    for d in dims:
+        shape.insert(d, 1)
+        strides.insert(d, 0)
+    return t._new(
+        TensorData(
+            t._tensor._storage,
+            tuple(shape),
+            tuple(strides),
+            version=t._tensor._version,
+        )
+    )
+
+
+def _arg_grad(grad_output, shape, arg):
+    """
+    Gradient of a reduction that selects one element per output (e.g. max):
+    each value of `grad_output` goes to the element at the position `arg`
+    recorded by `arg_reduce`, zeros elsewhere.
+    """
+    out = grad_output.zeros(shape)
+    out_shape = arg.shape
+    reduce_shape = [s if o == 1 else 1 for s, o in zip(shape, out_shape)]
+    strides = out._tensor.strides
+    bases = broadcast_plan(out_shape, out_shape, strides).reshape(-1)
+    inner = broadcast_plan(reduce_shape, reduce_shape, strides).reshape(-1)
+    positions = bases + inner[np.asarray(arg._tensor).reshape(-1)]
+    out._tensor._storage[positions] = np.asarray(grad_output._tensor).reshape(-1)
+    return out
+
+
+def _transpose(a):
+    "View of `a` with its last two dimensions swapped."
+    order = list(range(a.dims))
+    order[-2], order[-1] = order[-1], order[-2]
+    return a._new(a._tensor.permute(*order))
+
+
+def _scatter_grad(grad_output, shape, index):
+    "Sum the gradient of gathered elements back into a tensor of `shape`."
+    out = grad_output.zeros(shape)
+    values = np.asarray(grad_output._tensor).reshape(-1)
+    out._tensor.scatter(index, values, accumulate=True)
+    return out
+
+
+def _conv_params(value, n, name, minimum):
+    "Normalize the `name` argument of a convolution, an int or a tuple, to `n` ints."
+    values = (value,) * n if isinstance(value, int) else tuple(value)
+    if len(values) != n or any(v < minimum for v in values):
+        raise IndexingError(f"Expected {n} ints >= {minimum} for {name}, got {value}.")
+    return tuple(int(v) for v in values)
+
+
+def _conv_size(shape, kernel, stride, padding, dilation):
+    "Spatial shape of the output of a convolution of an input of `shape`."
+    size = tuple(
+        (s + 2 * p - d * (k - 1) - 1) // st + 1
+        for s, k, st, p, d in zip(shape[2:], kernel, stride, padding, dilation)
+    )
+    if any(s <= 0 for s in size):
+        raise IndexingError(f"Kernel {kernel} does not fit in the input {shape}.")
+    return size
+
+
+def _unpad(t, padding):
+    "View of `t` (batch, channels, *spatial) without its `padding`."
+    key = (slice(None), slice(None)) + tuple(
+        slice(p, s - p) for p, s in zip(padding, t.shape[2:])
+    )
+    return t._new(t._tensor.slice(key))
+
+
+def _pad(t, padding):
+    "Copy of `t` (batch, channels, *spatial) with zero `padding`, or `t` itself."
+    if not any(padding):
+        return t
+    shape = t.shape[:2] + tuple(s + 2 * p for s, p in zip(t.shape[2:], padding))
+    out = t.zeros(shape)
+    t.backend._id_map(t, out=_unpad(out, padding))
+    return out
+
+
+def _im2col(t, kernel, stride, dilation, out_size):
+    """
+    Copy the patches of `t` (batch, channels, *spatial) under each position of
+    the kernel into contiguous columns, reading them through one strided view
+    of the overlapping windows.
+
+    Returns:
+        :class:`Tensor` : (batch, prod(out_size), channels * prod(kernel)) columns
+    """
+    batch, channels = t.shape[:2]
+    batch_stride, channel_stride, *strides = t._tensor.strides
+    shape = (batch,) + out_size + (channels,) + tuple(kernel)
+    windows = t._tensor.as_strided(
+        shape,
+        (batch_stride,)
+        + tuple(s * st for s, st in zip(strides, stride))
+        + (channel_stride,)
+        + tuple(s * d for s, d in zip(strides, dilation)),
+    )
+    cols = t.empty(shape)
+    t.backend._id_map(t._new(windows), out=cols)
+    return cols.view(batch, int(np.prod(out_size)), channels * int(np.prod(kernel)))
+
+
+def _col2im(cols, shape, kernel, stride, padding, dilation):
+    """
+    Sum the columns (batch, channels * prod(kernel), prod(out_size)) into the
+    positions of an input of `shape` they were read from, undoing
+    :func:`_im2col`. Each kernel offset adds to one strided view of the input.
+    """
+    batch, channels = shape[:2]
+    out_size = _conv_size(shape, kernel, stride, padding, dilation)
+    padded = cols.zeros(
+        (batch, channels) + tuple(s + 2 * p for s, p in zip(shape[2:], padding))
+    )
+    cols = cols.view(batch, channels, *kernel, *out_size)
+    batch_stride, channel_stride, *strides = padded._tensor.strides
+    window_strides = (batch_stride, channel_stride) + tuple(
+        s * st for s, st in zip(strides, stride)
+    )
+    for offset in itertools.product(*(range(k) for k in kernel)):
+        start = sum(o * d * s for o, d, s in zip(offset, dilation, strides))
+        target = padded._new(
+            padded._tensor.as_strided(
+                (batch, channels) + out_size, window_strides, start
+            )
+        )
+        source = cols._new(cols._tensor.slice((slice(None), slice(None)) + offset))
+        padded.backend._add_zip(target, source, out=target)
+    if not any(padding):
+        return padded
+    return padded.backend._id_map(_unpad(padded, padding))
+
+
+def _pool_windows(t, kernel, stride):
+    "Strided view (batch, channels, out_h, out_w, kh, kw) of the windows of `t`."
+    out_size = _conv_size(t.shape, kernel, stride, (0, 0), (1, 1))
+    sb, sc, sh, sw = t._tensor.strides
+    return t._new(
+        t._tensor.as_strided(
+            t.shape[:2] + out_size + tuple(kernel),
+            (sb, sc, sh * stride[0], sw * stride[1], sh, sw),
+        )
+    )
+
+
+def _pool_positions(shape, kernel, stride, arg):
+    """
+    Positions in a contiguous tensor of `shape` of the elements selected in
+    each pooling window, from the positions `arg` within the windows recorded
+    by `arg_reduce`, as an array of the smallest unsigned integer type.
+    """
+    strides = strides_from_shape(shape)
+    out_shape = arg.shape[:4]
+    window_strides = strides[:2] + (strides[2] * stride[0], strides[3] * stride[1])
+    bases = broadcast_plan(out_shape, out_shape, window_strides).reshape(-1)
+    inner = broadcast_plan(kernel, kernel, strides[2:]).reshape(-1)
+    positions = bases + inner[np.asarray(arg._tensor).reshape(-1)]
+    return positions.astype(np.min_scalar_type(int(np.prod(shape)) - 1))
+
+
 TensorFunctions = make_tensor_backend(TensorOps)
+FastTensorFunctions = make_tensor_backend(FastOps)
+NumpyTensorFunctions = make_tensor_backend(NumpyOps)
 
 
 # Helpers for Constructing tensors
-def zeros(shape, backend=TensorFunctions):
+def zeros(shape, backend=TensorFunctions, dtype=np.float64):
     """
     Produce a zero tensor of size `shape`.
 
     Args:
         shape (tuple): shape of tensor
         backend (:class:`Backend`): tensor backend
+        dtype (numpy dtype): element type of the storage
+
+    Returns:
+        :class:`Tensor` : new tensor
+    """
+    data = default_pool.full(tuple(shape), 0.0, dtype)
+    return Tensor(data, backend=backend)
+
+
+def empty(shape, backend=TensorFunctions, dtype=np.float64):
+    """
+    Produce an uninitialized tensor of size `shape`, for outputs that
+    will be fully overwritten.
+
+    Args:
+        shape (tuple): shape of tensor
+        backend (:class:`Backend`): tensor backend
+        dtype (numpy dtype): element type of the storage
 
     Returns:
         :class:`Tensor` : new tensor
     """
-    return Tensor.make([0] * int(operators.prod(shape)), shape, backend=backend)
+    data = default_pool.empty(tuple(shape), dtype)
+    return Tensor(data, backend=backend)
 
 
-def rand(shape, backend=TensorFunctions, requires_grad=False):
+def rand(shape, backend=TensorFunctions, requires_grad=False, dtype=np.float64):
     """
     Produce a random tensor of size `shape`.
 
@@ -340,17 +983,20 @@ def rand(shape, backend=TensorFunctions, requires_grad=False):
         shape (tuple): shape of tensor
         backend (:class:`Backend`): tensor backend
         requires_grad (bool): turn on autodifferentiation
+        dtype (numpy dtype): element type of the storage
 
     Returns:
         :class:`Tensor` : new tensor
     """
     vals = [random.random() for _ in range(int(operators.prod(shape)))]
-    tensor = Tensor.make(vals, shape, backend=backend)
+    tensor = Tensor.make(vals, shape, backend=backend, dtype=dtype)
     tensor.requires_grad_(requires_grad)
     return tensor
 
 
-def tensor(ls, shape=None, backend=TensorFunctions, requires_grad=False):
+def tensor(
+    ls, shape=None, backend=TensorFunctions, requires_grad=False, dtype=np.float64
+):
     """
     Produce a tensor with data ls and shape `shape`.
 
@@ -359,18 +1005,19 @@ def tensor(ls, shape=None, backend=TensorFunctions, requires_grad=False):
         shape (tuple): shape of tensor
         backend (:class:`Backend`): tensor backend
         requires_grad (bool): turn on autodifferentiation
+        dtype (numpy dtype): element type of the storage
 
     Returns:
         :class:`Tensor` : new tensor
     """
     if not shape:
         shape = (len(ls),)
-    tensor = Tensor.make(ls, shape, backend=backend)
+    tensor = Tensor.make(ls, shape, backend=backend, dtype=dtype)
     tensor.requires_grad_(requires_grad)
     return tensor
 
 
-def tensor_fromlist(ls, backend=TensorFunctions, requires_grad=False):
+def tensor_fromlist(ls, backend=TensorFunctions, requires_grad=False, dtype=np.float64):
     """
     Produce a tensor with data and shape from ls
 
@@ -378,6 +1025,7 @@ def tensor_fromlist(ls, backend=TensorFunctions, requires_grad=False):
         ls (list): data for tensor
         backend (:class:`Backend`): tensor backend
         requires_grad (bool): turn on autodifferentiation
+        dtype (numpy dtype): element type of the storage
 
     Returns:
         :class:`Tensor` : new tensor
@@ -397,7 +1045,218 @@ def tensor_fromlist(ls, backend=TensorFunctions, requires_grad=False):
 
     cur = flatten(ls)
     shape = shape(ls)
-    return tensor(cur, tuple(shape), backend=backend, requires_grad=requires_grad)
+    return tensor(
+        cur, tuple(shape), backend=backend, requires_grad=requires_grad, dtype=dtype
+    )
+
+
+def from_file(
+    path,
+    shape=None,
+    mode="r",
+    dtype=np.float64,
+    offset=0,
+    backend=TensorFunctions,
+    requires_grad=False,
+):
+    """
+    Produce a tensor backed by a memory-mapped file. Nothing is read up front,
+    the operating system pages data in as the backend touches the storage,
+    so the file may be larger than memory.
+
+    Args:
+        path (str): raw binary file, or `.npy` file
+        shape (tuple): shape of tensor (optional for `.npy` files)
+        mode (str): memmap mode, "r" (read-only), "r+" (read/write)
+            or "c" (copy-on-write)
+        dtype (numpy dtype): element type of a raw file
+        offset (int): byte offset of the data in a raw file
+        backend (:class:`Backend`): tensor backend
+        requires_grad (bool): turn on autodifferentiation
+
+    Returns:
+        :class:`Tensor` : new tensor
+    """
+    if str(path).endswith(".npy"):
+        data = np.load(path, mmap_mode=mode)
+        if shape is not None and tuple(shape) != data.shape:
+            # Reshaping any other layout would copy the whole file.
+            if not data.flags.c_contiguous:
+                raise ValueError(f"Cannot reshape the non C-order array in {path}.")
+            data = data.reshape(shape)
+        if data.flags.c_contiguous:
+            storage, strides = data.reshape(-1), None
+        elif data.flags.f_contiguous:
+            storage = data.T.reshape(-1)
+            strides = tuple(reversed(strides_from_shape(tuple(reversed(data.shape)))))
+        else:
+            raise ValueError(f"Array in {path} is not contiguous.")
+        shape = data.shape
+    else:
+        if shape is None:
+            raise ValueError("A shape is required for raw files.")
+        size = int(operators.prod(shape))
+        storage = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(size,))
+        strides = None
+
+    tensor = Tensor(TensorData(storage, tuple(shape), strides), backend=backend)
+    tensor.requires_grad_(requires_grad)
+    return tensor
+
+
+def from_numpy(arr, backend=TensorFunctions, requires_grad=False):
+    """
+    Produce a tensor that wraps the memory of a numpy array without copying.
+    Any layout with non-negative strides (transposes, slices, broadcasts) is
+    kept through the tensor strides. Arrays with negative strides or a dtype
+    other than float32/float64 are copied (to float64 in the latter case).
+
+    Args:
+        arr (array): numpy array
+        backend (:class:`Backend`): tensor backend
+        requires_grad (bool): turn on autodifferentiation
+
+    Returns:
+        :class:`Tensor` : new tensor
+    """
+    arr = np.asarray(arr)
+    if arr.ndim == 0:
+        arr = arr.reshape(1)
+    if arr.dtype not in (np.float32, np.float64):
+        arr = arr.astype(np.float64)
+    itemsize = arr.itemsize
+    if any(s < 0 or s % itemsize for s in arr.strides):
+        arr = np.ascontiguousarray(arr)
+
+    strides = tuple(s // itemsize for s in arr.strides)
+    extent = 0
+    if arr.size > 0:
+        extent = 1 + sum((n - 1) * s for n, s in zip(arr.shape, strides))
+    # A flat view over the memory spanned by `arr`, starting at its first element.
+    storage = as_strided(arr, shape=(extent,), strides=(itemsize,))
+
+    tensor = Tensor(TensorData(storage, arr.shape, strides), backend=backend)
+    tensor.requires_grad_(requires_grad)
+    return tensor
+
+
+# Convolutions
+def _conv(function, n, input, weight, stride, padding, dilation):
+    "Check the arguments of an `n`-d convolution and apply `function`."
+    if input.dims != n + 2 or weight.dims != n + 2:
+        raise IndexingError(
+            f"Expected {n + 2}-D input and weight, got {input.shape}, {weight.shape}."
+        )
+    if input.shape[1] != weight.shape[1]:
+        raise IndexingError(
+            f"Input {input.shape} and weight {weight.shape} channels do not match."
+        )
+    stride = _conv_params(stride, n, "stride", 1)
+    padding = _conv_params(padding, n, "padding", 0)
+    dilation = _conv_params(dilation, n, "dilation", 1)
+    return function.apply(input, weight, stride, padding, dilation)
+
+
+def conv1d(input, weight, stride=1, padding=0, dilation=1):
+    """
+    1-D convolution (cross-correlation, as in most libraries) of `input` with
+    the kernels `weight`, computed as one matrix multiply of the weights with
+    the patches of the input.
+
+    Args:
+        input (:class:`Tensor`): input of shape (batch, in_channels, width)
+        weight (:class:`Tensor`): kernels of shape (out_channels, in_channels, k)
+        stride (int): step between two positions of the kernel
+        padding (int): zeros added on both sides of the input
+        dilation (int): step between two elements read by the kernel
+
+    Returns:
+        :class:`Tensor` : output of shape (batch, out_channels, out_width)
+    """
+    return _conv(input.backend.Conv1d, 1, input, weight, stride, padding, dilation)
+
+
+def conv2d(input, weight, stride=1, padding=0, dilation=1):
+    """
+    2-D convolution of `input` with the kernels `weight`, see :func:`conv1d`.
+
+    Args:
+        input (:class:`Tensor`): input of shape (batch, in_channels, height, width)
+        weight (:class:`Tensor`): kernels of shape
+            (out_channels, in_channels, kh, kw)
+        stride (int or tuple): step between two positions of the kernel
+        padding (int or tuple): zeros added on both sides of the input
+        dilation (int or tuple): step between two elements read by the kernel
+
+    Returns:
+        :class:`Tensor` : output of shape (batch, out_channels, out_height, out_width)
+    """
+    return _conv(input.backend.Conv2d, 2, input, weight, stride, padding, dilation)
+
+
+# Pooling
+def _pool(function, input, kernel_size, stride):
+    "Check the arguments of a 2-D pooling and apply `function`."
+    if input.dims != 4:
+        raise IndexingError(f"Expected a 4-D input, got {input.shape}.")
+    kernel = _conv_params(kernel_size, 2, "kernel_size", 1)
+    stride = kernel if stride is None else _conv_params(stride, 2, "stride", 1)
+    return function.apply(input, kernel, stride)
+
+
+def max_pool2d(input, kernel_size, stride=None):
+    """
+    Maximum of each window of `input`, read in one pass through a strided
+    view of the windows. The position of each maximum is saved so backward
+    scatters the gradient directly.
+
+    Args:
+        input (:class:`Tensor`): input of shape (batch, channels, height, width)
+        kernel_size (int or tuple): (height, width) of the windows
+        stride (int or tuple): step between two windows, `kernel_size` if None
+
+    Returns:
+        :class:`Tensor` : output of shape (batch, channels, out_height, out_width)
+    """
+    return _pool(input.backend.MaxPool2d, input, kernel_size, stride)
+
+
+def avg_pool2d(input, kernel_size, stride=None):
+    """
+    Mean of each window of `input`, see :func:`max_pool2d`.
+
+    Args:
+        input (:class:`Tensor`): input of shape (batch, channels, height, width)
+        kernel_size (int or tuple): (height, width) of the windows
+        stride (int or tuple): step between two windows, `kernel_size` if None
+
+    Returns:
+        :class:`Tensor` : output of shape (batch, channels, out_height, out_width)
+    """
+    return _pool(input.backend.AvgPool2d, input, kernel_size, stride)
+
+
+# Losses
+def binary_cross_entropy_with_logits(logits, labels, reduction="sum"):
+    """
+    Binary cross-entropy of `labels` against the probabilities
+    `sigmoid(logits)`, computed from the logits in one fused kernel, without
+    the overflow or `log(0)` of taking the sigmoid first.
+
+    Args:
+        logits (:class:`Tensor`): logits of the probability of label 1
+        labels (:class:`Tensor`): labels, 0.0 or 1.0, broadcast with `logits`
+        reduction (str): "sum" or "mean" of the losses of the elements
+
+    Returns:
+        :class:`Tensor` : loss of shape (1,)
+    """
+    if reduction not in ("sum", "mean"):
+        raise ValueError(f"Unknown reduction {reduction}.")
+    labels = logits._ensure_tensor(labels)
+    return logits.backend.BinaryCrossEntropyWithLogits.apply(
+        logits, labels, reduction
+    )
 
 
 # Gradient check for tensors
@@ -1,14 +1,63 @@
+import builtins
+import functools
 import numpy as np
-import minitorch
+from numpy.lib.stride_tricks import as_strided
+from . import operators
+from .parallel import run_chunked
+from .operators import prod
 from .tensor_data import (
-    count,
-    index_to_position,
-    broadcast_index,
     shape_broadcast,
+    strides_from_shape,
+    broadcast_strides,
+    strided_positions,
+    broadcast_plan,
+    PLAN_CACHE_MAX_SIZE,
+    matmul_shape,
     # MAX_DIMS,
 )
 
 
+def _same_shape(out_shape, in_shape):
+    return len(out_shape) == len(in_shape) and all(
+        o == i for o, i in builtins.zip(out_shape, in_shape)
+    )
+
+
+def _same_contiguous_layout(out_shape, out_strides, in_shape, in_strides):
+    """
+    True if both tensors have the same shape and the standard contiguous
+    layout, in which case storage positions match one to one.
+    """
+    if not _same_shape(out_shape, in_shape):
+        return False
+    contiguous = strides_from_shape(tuple(out_shape))
+    return all(
+        s == o == i or n == 1
+        for s, o, i, n in builtins.zip(contiguous, out_strides, in_strides, out_shape)
+    )
+
+
+def _contiguous_run(shape, strides):
+    """
+    True if the elements of `shape` (with `strides`) are consecutive in the
+    storage, in row-major order.
+    """
+    contiguous = strides_from_shape(tuple(shape))
+    return all(
+        s == c or n == 1 for s, c, n in builtins.zip(strides, contiguous, shape)
+    )
+
+
+def _strided_view(storage, shape, strides):
+    "NumPy view of `storage` with the given shape and (element) strides."
+    itemsize = storage.strides[0]
+    return as_strided(
+        storage,
+        shape=tuple(int(s) for s in shape),
+        strides=tuple(int(s) * itemsize for s in strides),
+    )
+
+
 def tensor_map(fn):
     """
     Higher-order tensor map function ::
@@ -16,6 +65,10 @@ def tensor_map(fn):
       fn_map = tensor_map(fn)
       fn_map(out, ... )
 
+    Functions with a vectorized variant (see :func:`operators.register`) are
+    applied to whole arrays of values instead of one element at a time, in
+    chunks split between threads (see :func:`run_chunked`).
+
     Args:
         fn: function from float-to-float to apply
         out (array): storage for out tensor
@@ -30,28 +83,43 @@ def tensor_map(fn):
 
     """
 
+    vec = operators.vectorized(fn)
+
+    def kernel(out_view, in_view):
+        out_view[...] = vec(in_view)
+
     def _map(out, out_shape, out_strides, in_storage, in_shape, in_strides):
 
         # TODO: Implement for Task 2.2.
 
-        if all(out_shape == in_shape):
-
-            for idx, val in enumerate(in_storage):
-                out[idx] = fn(val)
+        size = int(prod(out_shape))
+        contiguous = _same_contiguous_layout(
+            out_shape, out_strides, in_shape, in_strides
+        )
+        if vec is not None:
+            # Strided views of both sides, no index arrays, in parallel chunks.
+            if contiguous:
+                run_chunked(kernel, out[:size], in_storage[:size])
+            else:
+                run_chunked(
+                    kernel,
+                    _strided_view(out, out_shape, out_strides),
+                    _strided_view(in_storage, in_shape, in_strides),
+                )
+            return
+        if contiguous:
+            for i, val in enumerate(in_storage[:size]):
+                out[i] = fn(val)
+            return
+        in_strides = broadcast_strides(out_shape, in_shape, in_strides)
+        if size <= PLAN_CACHE_MAX_SIZE:
+            # Broadcasting (e.g. from `Tensor.expand`), gather with cached plans.
+            out_pos = broadcast_plan(out_shape, out_shape, out_strides)
+            values = in_storage[broadcast_plan(out_shape, out_shape, in_strides)]
+            out[out_pos] = [fn(x) for x in values.tolist()]
         else:
-
-            for i in range(len(out)):
-
-                index = [0] * len(out_shape)
-                count(i, out_shape, index)
-
-                # Broadcast tensor in_shape
-                in_index = [0] * len(in_shape)
-                broadcast_index(index, out_shape, in_shape, in_index)
-
-                in_pos = index_to_position(in_index, in_strides)
-
-                out[i] = fn(in_storage[in_pos])
+            for o, j in strided_positions(out_shape, out_strides, in_strides):
+                out[o] = fn(in_storage[j])
 
     return _map
 
@@ -78,7 +146,7 @@ def map(fn):
 
     def ret(a, out=None):
         if out is None:
-            out = a.zeros(a.shape)
+            out = a.empty(a.shape)
         f(*out.tuple(), *a.tuple())
         return out
 
@@ -92,6 +160,9 @@ def tensor_zip(fn):
       fn_zip = tensor_zip(fn)
       fn_zip(out, ...)
 
+    Functions with a vectorized variant (see :func:`operators.register`) are
+    applied to whole arrays of values instead of one pair at a time, in
+    chunks split between threads (see :func:`run_chunked`).
 
     Args:
         fn: function mapping two floats to float to apply
@@ -108,6 +179,10 @@ def tensor_zip(fn):
     Returns:
         None : Fills in `out`
     """
+    vec = operators.vectorized(fn)
+
+    def kernel(out_view, a_view, b_view):
+        out_view[...] = vec(a_view, b_view)
 
     def _zip(
         out,
@@ -122,31 +197,40 @@ def tensor_zip(fn):
     ):
         # TODO: Implement for Task 2.2.
 
-        out_a = []
-        out_b = []
-
-        for i in range(len(out)):
-
-            # Use count(…) to go from i to index according to out_shape
-            index = [0] * len(out_shape)
-            count(i, out_shape, index)
-
-            # Broadcast tensor a
-            a_index = [0] * len(a_shape)
-            broadcast_index(index, out_shape, a_shape, a_index)
-            a_pos = index_to_position(a_index, a_strides)
-            out_a.append(a_storage[a_pos])
-
-            # Broadcast tensor b
-            b_index = [0] * len(b_shape)
-            broadcast_index(index, out_shape, b_shape, b_index)
-            b_pos = index_to_position(b_index, b_strides)
-            out_b.append(b_storage[b_pos])
-
-        out_storage = [fn(out_a[j], out_b[j]) for j in range(len(out_a))]
-
-        for idx, val in enumerate(out_storage):
-            out[idx] = val
+        size = int(prod(out_shape))
+        contiguous = _same_contiguous_layout(
+            out_shape, out_strides, a_shape, a_strides
+        ) and _same_contiguous_layout(out_shape, out_strides, b_shape, b_strides)
+        if vec is not None:
+            # Strided views of all operands, no index arrays, in parallel chunks.
+            if contiguous:
+                run_chunked(kernel, out[:size], a_storage[:size], b_storage[:size])
+            else:
+                run_chunked(
+                    kernel,
+                    _strided_view(out, out_shape, out_strides),
+                    _strided_view(a_storage, a_shape, a_strides),
+                    _strided_view(b_storage, b_shape, b_strides),
+                )
+            return
+        if contiguous:
+            pairs = builtins.zip(a_storage[:size], b_storage[:size])
+            for i, (x, y) in enumerate(pairs):
+                out[i] = fn(x, y)
+            return
+        a_strides = broadcast_strides(out_shape, a_shape, a_strides)
+        b_strides = broadcast_strides(out_shape, b_shape, b_strides)
+        if size <= PLAN_CACHE_MAX_SIZE:
+            out_pos = broadcast_plan(out_shape, out_shape, out_strides)
+            a_vals = a_storage[broadcast_plan(out_shape, out_shape, a_strides)]
+            b_vals = b_storage[broadcast_plan(out_shape, out_shape, b_strides)]
+            pairs = builtins.zip(a_vals.tolist(), b_vals.tolist())
+            out[out_pos] = [fn(x, y) for x, y in pairs]
+        else:
+            for o, j, k in strided_positions(
+                out_shape, out_strides, a_strides, b_strides
+            ):
+                out[o] = fn(a_storage[j], b_storage[k])
 
     return _zip
 
@@ -162,6 +246,8 @@ def zip(fn):
         fn: function from two floats-to-float to apply
         a (:class:`TensorData`): tensor to zip over
         b (:class:`TensorData`): tensor to zip over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+               should broadcast with `a` and `b`
 
     Returns:
         :class:`TensorData` : new tensor data
@@ -169,19 +255,87 @@ def zip(fn):
 
     f = tensor_zip(fn)
 
-    def ret(a, b):
-        if a.shape != b.shape:
-            c_shape = shape_broadcast(a.shape, b.shape)
-        else:
-            c_shape = a.shape
-        out = a.zeros(c_shape)
+    def ret(a, b, out=None):
+        if out is None:
+            if a.shape != b.shape:
+                c_shape = shape_broadcast(a.shape, b.shape)
+            else:
+                c_shape = a.shape
+            out = a.empty(c_shape, dtype=np.result_type(a.dtype, b.dtype))
         f(*out.tuple(), *a.tuple(), *b.tuple())
         return out
 
     return ret
 
 
-def tensor_reduce(fn):
+# Elements folded serially before partial results are combined pairwise.
+REDUCE_BLOCK = 128
+
+
+def _read_block(storage, positions, k):
+    "Values of block `k` of `positions`, a slice of `storage` for a range."
+    block = positions[k : k + REDUCE_BLOCK]
+    if isinstance(block, range):
+        return storage[block.start : block.stop].tolist()
+    return storage[block].tolist()
+
+
+def pairwise_fold(fn, acc, storage, positions):
+    """
+    Fold the elements of `storage` at `positions` into `acc`. Blocks of
+    `REDUCE_BLOCK` elements are folded serially, then the block results are
+    combined pairwise, so rounding errors of a long sum grow with the log of
+    its length. Only one block of values is read out of `storage` at a time.
+
+    Args:
+        fn: associative function mapping two floats to float
+        acc (float): start value
+        storage (array): storage to read from
+        positions (array or range): positions of the elements to fold, in order
+
+    Returns:
+        float : the folded value
+    """
+    partials = []
+    for k in range(0, len(positions), REDUCE_BLOCK):
+        values = _read_block(storage, positions, k)
+        x = values[0]
+        for v in values[1:]:
+            x = fn(x, v)
+        partials.append(x)
+    while len(partials) > 1:
+        pairs = builtins.zip(partials[0::2], partials[1::2])
+        partials = [fn(x, y) for x, y in pairs] + partials[len(partials) & ~1 :]
+    return fn(acc, partials[0]) if partials else acc
+
+
+def compensated_sum(acc, storage, positions):
+    """
+    Add the elements of `storage` at `positions` to `acc` with compensated
+    (Kahan-Babuska) summation, carrying the rounding error of each addition
+    forward so the result is accurate to about one rounding.
+
+    Args:
+        acc (float): start value
+        storage (array): storage to read from
+        positions (array or range): positions of the elements to add, in order
+
+    Returns:
+        float : the sum
+    """
+    comp = 0.0
+    for k in range(0, len(positions), REDUCE_BLOCK):
+        for v in _read_block(storage, positions, k):
+            t = acc + v
+            if abs(acc) >= abs(v):
+                comp += (acc - t) + v
+            else:
+                comp += (v - t) + acc
+            acc = t
+    return acc + comp
+
+
+def tensor_reduce(fn, compensated=False):
     """
     Higher-order tensor reduce function. ::
 
@@ -189,7 +343,8 @@ def tensor_reduce(fn):
       c = fn_reduce(out, ...)
 
     Args:
-        fn: reduction function mapping two floats to float
+        fn: associative reduction function mapping two floats to float
+        compensated (bool): use compensated summation, `fn` must be addition
         out (array): storage for `out` tensor
         out_shape (array): shape for `out` tensor
         out_strides (array): strides for `out` tensor
@@ -243,36 +398,30 @@ def tensor_reduce(fn):
         """
         # TODO: Implement for Task 2.2.
 
-        if len(out) == 1:
-
-            out[0] = minitorch.operators.reduce(fn, 0.0)(a_storage)
-
-        else:
-
-            for i in range(len(out)):
-
-                out_storage = []
-
-                for j in range(reduce_size):
-
-                    out_index = list(np.zeros(len(out_shape)))
-                    count(i, out_shape, out_index)
-
-                    reduce_index = list(np.zeros(len(reduce_shape)))
-                    count(j, reduce_shape, reduce_index)
-
-                    for idx, val in enumerate(reduce_index):
-                        out_index[idx] += val
-
-                    idx_to_pos = index_to_position(out_index, a_strides)
-                    out_storage.append(a_storage[idx_to_pos])
-
-                out[i] = minitorch.operators.reduce(fn, 0.0)(list(out_storage))
+        # Reduced dimensions have size 1 in `out_shape`, so the position of
+        # the first element reduced into an out cell follows from its index,
+        # and the offsets of the other elements are the same for every cell.
+        bases = broadcast_plan(out_shape, out_shape, a_strides).ravel()
+        out_pos = broadcast_plan(out_shape, out_shape, out_strides).ravel()
+        # Contiguous runs are read through slices of the storage, only other
+        # layouts need the offsets of the reduced elements.
+        contiguous = _contiguous_run(reduce_shape, a_strides)
+        if not contiguous:
+            inner = broadcast_plan(reduce_shape, reduce_shape, a_strides).ravel()
+        for o, base in builtins.zip(out_pos.tolist(), bases.tolist()):
+            if contiguous:
+                positions = range(base, base + reduce_size)
+            else:
+                positions = base + inner
+            if compensated:
+                out[o] = compensated_sum(out[o], a_storage, positions)
+            else:
+                out[o] = pairwise_fold(fn, out[o], a_storage, positions)
 
     return _reduce
 
 
-def reduce(fn, start=0.0):
+def reduce(fn, start=0.0, compensated=False):
     """
     Higher-order tensor reduce function. ::
 
@@ -281,7 +430,9 @@ def reduce(fn, start=0.0):
 
 
     Args:
-        fn: function from two floats-to-float to apply
+        fn: associative function from two floats-to-float to apply
+        start (float): value the reduction starts from
+        compensated (bool): use compensated summation, `fn` must be addition
         a (:class:`TensorData`): tensor to reduce over
         dims (list, optional): list of dims to reduce
         out (:class:`TensorData`, optional): tensor to reduce into
@@ -290,7 +441,7 @@ def reduce(fn, start=0.0):
         :class:`TensorData` : new tensor data
     """
 
-    f = tensor_reduce(fn)
+    f = tensor_reduce(fn, compensated)
 
     # START Code Update
     def ret(a, dims=None, out=None):
@@ -300,7 +451,7 @@ def reduce(fn, start=0.0):
             for d in dims:
                 out_shape[d] = 1
             # Other values when not sum.
-            out = a.zeros(tuple(out_shape))
+            out = a.empty(tuple(out_shape))
             out._tensor._storage[:] = start
         else:
             old_shape = out.shape
@@ -331,7 +482,252 @@ def reduce(fn, start=0.0):
     # END Code Update
 
 
+def tensor_arg_reduce(fn):
+    """
+    Higher-order tensor reduce function that also records which element
+    each result comes from. ::
+
+      fn_arg_reduce = tensor_arg_reduce(fn)
+      fn_arg_reduce(out, ..., arg, ..., a, ...)
+
+    Args:
+        fn: reduction function returning one of its two arguments (e.g. `max`)
+        out (array): storage for `out` tensor
+        out_shape (array): shape for `out` tensor
+        out_strides (array): strides for `out` tensor
+        arg (array): storage for `arg` tensor, with the shape of `out`
+        arg_shape (array): shape for `arg` tensor
+        arg_strides (array): strides for `arg` tensor
+        a_storage (array): storage for `a` tensor
+        a_shape (array): shape for `a` tensor
+        a_strides (array): strides for `a` tensor
+        reduce_shape (array): shape of reduction (1 for dimension kept, shape value for dimensions reduced)
+        reduce_size (int): size of reduce shape
+
+    Returns:
+        None : Fills in `out`, and `arg` with the position of the selected
+        (first, on ties) element within `reduce_shape`, in row-major order.
+        NaN propagates: a reduction with NaNs selects its first NaN, like
+        `numpy.argmax`.
+    """
+
+    def _arg_reduce(
+        out,
+        out_shape,
+        out_strides,
+        arg,
+        arg_shape,
+        arg_strides,
+        a_storage,
+        a_shape,
+        a_strides,
+        reduce_shape,
+        reduce_size,
+    ):
+        bases = broadcast_plan(out_shape, out_shape, a_strides).ravel()
+        out_pos = broadcast_plan(out_shape, out_shape, out_strides).ravel()
+        arg_pos = broadcast_plan(arg_shape, arg_shape, arg_strides).ravel()
+        contiguous = _contiguous_run(reduce_shape, a_strides)
+        if not contiguous:
+            inner = broadcast_plan(reduce_shape, reduce_shape, a_strides).ravel()
+        for o, p, base in builtins.zip(
+            out_pos.tolist(), arg_pos.tolist(), bases.tolist()
+        ):
+            if contiguous:
+                values = a_storage[base : base + reduce_size].tolist()
+            else:
+                values = a_storage[base + inner].tolist()
+            acc, best = values[0], 0
+            for j, v in enumerate(values):
+                # NaN propagates: the first NaN is selected.
+                if acc == acc and (v != v or fn(acc, v) != acc):
+                    acc, best = v, j
+            out[o] = acc
+            arg[p] = best
+
+    return _arg_reduce
+
+
+def arg_reduce(fn):
+    """
+    Higher-order tensor reduce function returning the reduced values and
+    the positions they come from. ::
+
+      max_arg_reduce = arg_reduce(operators.max)
+      values, positions = max_arg_reduce(a, dims)
+
+    Args:
+        fn: function from two floats to one of them
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list): list of dims to reduce
+
+    Returns:
+        tuple : values, and int64 positions within the reduced dimensions,
+        both with the reduced dimensions kept with size 1
+    """
+
+    f = tensor_arg_reduce(fn)
+
+    def ret(a, dims):
+        out_shape = tuple(1 if d in dims else s for d, s in enumerate(a.shape))
+        reduce_shape = [s if d in dims else 1 for d, s in enumerate(a.shape)]
+        out = a.empty(out_shape)
+        arg = a.empty(out_shape, dtype=np.int64)
+        reduce_size = int(prod(reduce_shape))
+        f(*out.tuple(), *arg.tuple(), *a.tuple(), reduce_shape, reduce_size)
+        return out, arg
+
+    return ret
+
+
+# Rows and inner entries per tile of the matrix multiply.
+MATMUL_BLOCK = 64
+
+
+def tensor_matrix_multiply(
+    out,
+    out_shape,
+    out_strides,
+    a_storage,
+    a_shape,
+    a_strides,
+    b_storage,
+    b_shape,
+    b_strides,
+):
+    """
+    Blocked tensor matrix multiply. Rows of `out` are computed one tile of
+    `MATMUL_BLOCK` rows at a time, summing the products of tiles of `a` and
+    `b` along the inner dimension.
+
+    Args:
+        out (array): storage for `out` tensor, filled with zeros.
+        out_shape (array): shape for `out` tensor (3-D).
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor (3-D).
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor (3-D).
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+        None : Fills in `out`
+    """
+
+    batch, rows = int(out_shape[0]), int(out_shape[1])
+    inner = int(a_shape[2])
+    out_view = _strided_view(out, out_shape, out_strides)
+    a_view = _strided_view(a_storage, a_shape, a_strides)
+    b_view = _strided_view(b_storage, b_shape, b_strides)
+    for n in range(batch):
+        # A batch of one is broadcast.
+        a_n = a_view[n if a_shape[0] > 1 else 0]
+        b_n = b_view[n if b_shape[0] > 1 else 0]
+        for i0 in range(0, rows, MATMUL_BLOCK):
+            i1 = builtins.min(i0 + MATMUL_BLOCK, rows)
+            tile = out_view[n, i0:i1]
+            for k0 in range(0, inner, MATMUL_BLOCK):
+                k1 = builtins.min(k0 + MATMUL_BLOCK, inner)
+                tile += np.dot(a_n[i0:i1, k0:k1], b_n[k0:k1])
+
+
+def matrix_multiply(a, b):
+    """
+    Batched matrix multiply. 2-D tensors are multiplied as a batch of one
+    matrix, and the batch dimension of 3-D tensors is broadcast ::
+
+        for n:
+          for i:
+            for j:
+              for k:
+                out[n, i, j] += a[n, i, k] * b[n, k, j]
+
+    Args:
+        a (:class:`TensorData`): tensor data `a`, 2-D or 3-D
+        b (:class:`TensorData`): tensor data `b`, 2-D or 3-D
+
+    Returns:
+        :class:`TensorData` : new tensor data
+    """
+    out = a.zeros(
+        matmul_shape(a.shape, b.shape), dtype=np.result_type(a.dtype, b.dtype)
+    )
+    tensor_matrix_multiply(
+        *out._tensor.as_batch().tuple(),
+        *a._tensor.as_batch().tuple(),
+        *b._tensor.as_batch().tuple(),
+    )
+    return out
+
+
+def tensor_nary(fn, nin, nout):
+    """
+    Higher-order n-ary tensor zip function, the generalization of
+    :func:`tensor_zip` used by fused kernels.
+
+    Args:
+        fn: function of `nin` values returning a tuple of `nout` values.
+        nin (int): number of input tensors.
+        nout (int): number of output tensors.
+        *args (arrays): storage, shape and strides of each output, then of
+            each input, all outputs having the same shape.
+
+    Returns:
+        None : Fills in the outputs
+    """
+
+    def _nary(*args):
+        outs = [args[3 * k : 3 * k + 3] for k in range(nout)]
+        ins = [args[3 * (nout + i) : 3 * (nout + i) + 3] for i in range(nin)]
+        out_shape = outs[0][1]
+        values = [
+            storage[broadcast_plan(out_shape, shape, strides)].tolist()
+            for storage, shape, strides in ins
+        ]
+        results = [fn(*xs) for xs in builtins.zip(*values)]
+        for k, (out, shape, strides) in enumerate(outs):
+            out[broadcast_plan(out_shape, shape, strides)] = [r[k] for r in results]
+
+    return _nary
+
+
+def nary(program):
+    """
+    Higher-order n-ary tensor zip for fused kernels (see `fusion.py`). ::
+
+      fn_nary = nary(program)
+      out, = fn_nary(a, b, c)
+
+    Args:
+        program (:class:`FusedProgram`): program to compile
+        *tensors (:class:`TensorData`): tensors to zip over, broadcast together
+        out (list of :class:`TensorData`): optional, one tensor data per output
+            of `program` to fill in
+
+    Returns:
+        list of :class:`TensorData` : one new tensor data per output
+    """
+    f = tensor_nary(program.compile(vars(operators)), program.nin, program.nout)
+
+    def ret(*tensors, out=None):
+        if out is None:
+            shape = functools.reduce(shape_broadcast, (t.shape for t in tensors))
+            dtype = np.result_type(*(t.dtype for t in tensors))
+            out = [tensors[0].empty(shape, dtype=dtype) for _ in range(program.nout)]
+        f(
+            *(x for o in out for x in o.tuple()),
+            *(x for t in tensors for x in t.tuple()),
+        )
+        return out
+
+    return ret
+
+
 class TensorOps:
     map = map
     zip = zip
     reduce = reduce
+    arg_reduce = arg_reduce
+    matrix_multiply = matrix_multiply
+    nary = nary
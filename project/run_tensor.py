@@ -9,51 +9,22 @@ HIDDEN = 3
 RATE = 0.5
 
 
-def RParam(*shape):
-    r = 2 * (minitorch.rand(shape) - 0.5)
-    return minitorch.Parameter(r)
-
-
 class Network(minitorch.Module):
     def __init__(self):
         super().__init__()
 
         # Submodules
-        self.layer1 = Linear(2, HIDDEN)
-        self.layer2 = Linear(HIDDEN, HIDDEN)
-        self.layer3 = Linear(HIDDEN, 1)
-
-    def forward(self, x):
-
-        # TODO: Implement for Task 2.5.
-        h = self.layer1.forward(x).relu()
-        h = self.layer2.forward(h).relu()
-        return self.layer3.forward(h).sigmoid()
-
-
-class Linear(minitorch.Module):
-    def __init__(self, in_size, out_size):
-        super().__init__()
-        self.weights = RParam(in_size, out_size)
-        self.bias = RParam(out_size)
-        self.out_size = out_size
+        self.layer1 = minitorch.nn.Linear(2, HIDDEN, activation="relu")
+        self.layer2 = minitorch.nn.Linear(HIDDEN, HIDDEN, activation="relu")
+        self.layer3 = minitorch.nn.Linear(HIDDEN, 1)
 
     def forward(self, x):
 
         # TODO: Implement for Task 2.5.
-
-        bias = self.bias.value
-        weights = self.weights.value
-
-        x = x.view(*(list(x.shape) + [1]))
-
-        y = bias + x * weights
-
-        y = y.sum(1)
-
-        y = y.view(x.shape[0], bias.size)
-
-        return y
+        h = self.layer1.forward(x)
+        h = self.layer2.forward(h)
+        # Logits, the loss applies the sigmoid.
+        return self.layer3.forward(h)
 
 
 model = Network()
@@ -71,22 +42,23 @@ for epoch in range(1000):
     # Forward
     out = model.forward(X).view(data.N)
 
-    prob = (out * y) + (out - 1.0) * (y - 1.0)
-    for i, lab in enumerate(data.y):
-        if lab == 1 and out[i] > 0.5:
+    pred = out.to_numpy()
+    for lab, p in zip(data.y, pred):
+        if lab == 1 and p > 0.0:
             correct += 1
-        if lab == 0 and out[i] < 0.5:
+        if lab == 0 and p < 0.0:
             correct += 1
 
-    loss = -prob.log()
-    (loss.sum().view(1)).backward()
+    loss = minitorch.binary_cross_entropy_with_logits(out, y)
+    loss.backward()
     total_loss += loss[0]
     losses.append(total_loss)
 
     # Update
     for p in model.parameters():
         if p.value.grad is not None:
-            p.update(p.value - RATE * (p.value.grad / float(data.N)))
+            p.value.sub_(p.value.grad * (RATE / float(data.N)))
+            p.value.zero_grad_()
 
     epoch_time = time.time() - start
 
@@ -103,6 +75,8 @@ for epoch in range(1000):
             epoch_time,
         )
         im = f"Epoch: {epoch}"
-        data.graph(im, lambda x: model.forward(minitorch.tensor(x, (1, 2)))[0, 0])
+        data.graph(
+            im, lambda x: model.forward(minitorch.tensor(x, (1, 2))).sigmoid()[0, 0]
+        )
         plt.plot(losses, c="blue")
         data.vis.matplot(plt, win="loss")
@@ -1,7 +1,8 @@
 import minitorch
+import numpy as np
 import pytest
 from hypothesis import given
-from hypothesis.strategies import floats, lists
+from hypothesis.strategies import data, floats, lists, permutations
 from .strategies import tensors, shaped_tensors, assert_close
 
 small_floats = floats(min_value=-100, max_value=100, allow_nan=False)
@@ -27,6 +28,8 @@ reduce = [
     ("mean", lambda a: a.mean()),
     ("sum2", lambda a: a.sum(0)),
     ("mean2", lambda a: a.mean(0)),
+    ("sum3", lambda a: a.sum((0, -1), keepdim=False)),
+    ("logsumexp", lambda a: a.logsumexp(0)),
 ]
 two_arg = [
     # Uncomment for task 2.4
@@ -150,3 +153,541 @@ def test_reduce_forward_all_dims():
     t_summed_all_expected = minitorch.tensor_fromlist([27])
 
     assert_close(t_summed_all[0], t_summed_all_expected[0])
+
+
+def test_reduce_multi_dim():
+    "Several dimensions are reduced at once, keeping or dropping them."
+    x = np.arange(24.0).reshape(2, 3, 4)
+    t = minitorch.tensor(x.ravel().tolist()).view(2, 3, 4)
+
+    out = t.sum((0, 2))
+    assert out.shape == (1, 3, 1)
+    np.testing.assert_allclose(out.to_numpy(), x.sum((0, 2), keepdims=True))
+
+    out = t.sum((0, -1), keepdim=False)
+    assert out.shape == (3,)
+    np.testing.assert_allclose(out.to_numpy(), x.sum((0, 2)))
+
+    out = t.mean((1, 2), keepdim=False)
+    assert out.shape == (2,)
+    np.testing.assert_allclose(out.to_numpy(), x.mean((1, 2)))
+
+    assert t.sum((0, 1, 2), keepdim=False).shape == (1,)
+    assert t.mean(1, keepdim=False).shape == (2, 4)
+    assert t.sum(np.int64(2), keepdim=False).shape == (2, 3)
+
+    minitorch.grad_check(lambda a: a.sum((0, 2), keepdim=False), t)
+    minitorch.grad_check(lambda a: a.mean((1, 2), keepdim=False), t)
+    minitorch.grad_check(lambda a: a.mean((0, 1), keepdim=True), t)
+
+
+def test_select_reductions():
+    "Max, min, argmax, prod and logsumexp in one pass, with their gradients."
+    x = np.random.RandomState(0).standard_normal((3, 4, 5))
+    t = minitorch.tensor(x.ravel().tolist()).view(3, 4, 5)
+
+    out = t.max((0, 2), keepdim=False)
+    np.testing.assert_allclose(out.to_numpy(), x.max((0, 2)))
+    np.testing.assert_allclose(t.min(1).to_numpy(), x.min(1, keepdims=True))
+    assert t.argmax(1, keepdim=False).to_numpy().tolist() == x.argmax(1).tolist()
+    assert t.argmax()[0] == x.argmax()
+    np.testing.assert_allclose(t.prod(2).to_numpy(), x.prod(2, keepdims=True))
+    m = x.max(2, keepdims=True)
+    expected = m + np.log(np.exp(x - m).sum(2, keepdims=True))
+    np.testing.assert_allclose(t.logsumexp(2).to_numpy(), expected)
+
+    # No overflow for large values.
+    big = minitorch.tensor([1000.0, 1000.0])
+    assert_close(big.logsumexp()[0], 1000.0 + np.log(2.0))
+
+    minitorch.grad_check(lambda a: a.max((0, 2), keepdim=False), t)
+    minitorch.grad_check(lambda a: a.min(), t)
+    minitorch.grad_check(lambda a: a.prod(2), t)
+    minitorch.grad_check(lambda a: a.logsumexp((1, 2), keepdim=False), t)
+
+    # Ties send the gradient to the first maximum only.
+    ties = minitorch.tensor([1.0, 3.0, 3.0])
+    ties.requires_grad_(True)
+    ties.max().backward()
+    assert ties.grad.to_numpy().tolist() == [0.0, 1.0, 0.0]
+
+
+def test_prod_zeros():
+    "The gradient of a product with zeros is the product of the others."
+    t = minitorch.tensor([2.0, 0.0, 0.0, 0.0, 5.0, 4.0]).view(3, 2)
+    t.requires_grad_(True)
+    t.prod(1).sum().backward()
+    assert t.grad.to_numpy().tolist() == [[0.0, 2.0], [0.0, 0.0], [4.0, 5.0]]
+
+
+def test_map_zip_strided():
+    # shape (3, 2) stored column-major
+    data = minitorch.TensorData([float(i) for i in range(6)], (3, 2), (1, 3))
+    t = minitorch.Tensor(data, backend=minitorch.TensorFunctions)
+    expected = minitorch.tensor_fromlist([[0, 3], [1, 4], [2, 5]])
+
+    out = -(-t)
+    out2 = t + expected
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+        assert_close(out2[ind], 2 * expected[ind])
+
+
+@given(data(), tensors())
+def test_permute(data, t1):
+    permutation = data.draw(permutations(range(len(t1.shape))))
+
+    def permute(a):
+        return a.permute(*permutation)
+
+    minitorch.grad_check(permute, t1)
+
+
+def test_permute_shares_storage():
+    t = minitorch.tensor_fromlist([[1, 2, 3], [4, 5, 6]])
+    t2 = t.permute(1, 0)
+    assert t2.shape == (3, 2)
+    assert t2._tensor._storage is t._tensor._storage
+    assert t2[2, 1] == t[1, 2]
+    assert_close(t2.contiguous().view(6)[1], 4.0)
+
+
+def test_from_file(tmp_path):
+    data = np.arange(6, dtype=np.float64).reshape(2, 3)
+
+    raw = tmp_path / "data.bin"
+    data.tofile(raw)
+    t = minitorch.from_file(str(raw), (2, 3))
+    assert isinstance(t._tensor._storage, np.memmap)
+    assert t[1, 2] == 5.0
+    assert_close(t.sum(1)[1, 0], 12.0)
+
+    npy = tmp_path / "data.npy"
+    np.save(npy, np.asfortranarray(data))
+    t = minitorch.from_file(str(npy))
+    assert t.shape == (2, 3)
+    assert t[1, 2] == 5.0
+    assert_close((t + 1.0)[0, 1], 2.0)
+    with pytest.raises(ValueError):
+        minitorch.from_file(str(npy), (3, 2))
+
+
+def test_slice():
+    t = minitorch.tensor_fromlist([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    rows = t[1:3]
+    assert rows.shape == (2, 3)
+    assert rows[0, 2] == 6.0
+    assert rows._tensor._storage.base is t._tensor._storage
+
+    col = t[:, 0]
+    assert col.shape == (3,)
+    assert [col[i] for i in range(3)] == [1.0, 4.0, 7.0]
+    assert_close(col.sum()[0], 12.0)
+    assert not col._tensor.is_contiguous()
+
+    assert t[::2, 1:][1, 1] == 9.0
+    assert t[2].shape == (3,)
+
+    with pytest.raises(minitorch.IndexingError):
+        t[3:, 5]
+
+
+def test_slice_setitem():
+    t = minitorch.zeros((2, 3))
+    t[:, 1] = 5.0
+    t[1, :] = minitorch.tensor([1.0, 2.0, 3.0])
+    assert [t[0, i] for i in range(3)] == [0.0, 5.0, 0.0]
+    assert [t[1, i] for i in range(3)] == [1.0, 2.0, 3.0]
+
+
+@given(tensors(shape=(3, 4)))
+def test_slice_grad(t1):
+    minitorch.grad_check(lambda a: a[1:, ::2] * 2.0, t1)
+    minitorch.grad_check(lambda a: a[:, 3].sigmoid(), t1)
+
+
+def test_numpy_interop():
+    arr = np.arange(12, dtype=np.float64).reshape(3, 4)
+
+    t = minitorch.from_numpy(arr)
+    assert np.shares_memory(t._tensor._storage, arr)
+    assert t[2, 1] == 9.0
+
+    # Transposed and sliced arrays keep their layout.
+    t = minitorch.from_numpy(arr.T[1:, ::2])
+    assert t.shape == (3, 2)
+    assert np.shares_memory(t._tensor._storage, arr)
+    np.testing.assert_array_equal((t + 0.0).to_numpy(), arr.T[1:, ::2])
+
+    # to_numpy views the storage with the tensor strides.
+    t = minitorch.from_numpy(arr).permute(1, 0)
+    out = t.to_numpy()
+    assert np.shares_memory(out, arr)
+    np.testing.assert_array_equal(out, arr.T)
+
+    t = minitorch.from_numpy(np.arange(3))
+    assert t.dtype == np.float64
+
+
+def test_storage_pool():
+    pool = minitorch.StoragePool()
+    a = pool.full((3, 5), 1.0)
+    assert pool.bucket(15) == 16
+    assert a._storage.shape == (15,)
+    del a
+    assert pool.stats()["bytes_in_pool"] == 16 * 8
+
+    b = pool.empty((4, 4))
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["bytes_in_pool"] == 0
+
+    # A released buffer is not reused while a view of it is alive.
+    b._storage.fill(2.0)
+    view = b.permute(1, 0)
+    del b
+    c = pool.full((16,), 3.0)
+    assert pool.stats()["misses"] == 2
+    assert view.get((0, 0)) == 2.0
+    assert c.get((0,)) == 3.0
+
+    # Nor while a numpy array of it is alive.
+    array = np.asarray(view)
+    del view
+    d = pool.full((16,), 4.0)
+    assert pool.stats()["misses"] == 3
+    assert array[0, 0] == 2.0 and d.get((0,)) == 4.0
+    del array
+    assert pool.stats()["bytes_in_pool"] == 16 * 8
+    assert pool.bucket(1000) == 1024 and pool.bucket(1025) == 1280
+
+
+def test_inplace():
+    t = minitorch.tensor_fromlist([[1.0, 2.0], [3.0, 4.0]])
+    data = t._tensor
+    t.add_(1.0).mul_(minitorch.tensor([2.0, 1.0]))
+    assert t._tensor is data
+    assert t[1, 0] == 8.0 and t[1, 1] == 5.0
+    t.sub_(t).add_(2.0).div_(4.0)
+    assert t[0, 1] == 0.5
+    t.neg_().exp_().log_()
+    assert_close(t[0, 0], -0.5)
+    t.zero_().relu_().sigmoid_()
+    assert t[1, 1] == 0.5
+    with pytest.raises(minitorch.IndexingError):
+        t.add_(minitorch.zeros((3, 2)))
+
+    # Writes through a view land in the base storage.
+    t.fill_(1.0)
+    t.permute(1, 0)[0].fill_(3.0)
+    assert t[1, 0] == 3.0 and t[1, 1] == 1.0
+
+    out = minitorch.zeros((2,))
+    minitorch.TensorFunctions._add_zip(
+        minitorch.tensor([1.0, 2.0]), minitorch.tensor([3.0]), out=out
+    )
+    assert out[1] == 5.0
+
+    # Read-only storage is not silently copied.
+    array = np.ones(3)
+    array.flags.writeable = False
+    t = minitorch.from_numpy(array)
+    with pytest.raises(ValueError):
+        t.add_(1.0)
+    with pytest.raises(ValueError):
+        t[0] = 2.0
+
+
+def test_inplace_version_check():
+    x = minitorch.tensor([1.0, 2.0], requires_grad=True)
+    y = (x * 2.0).sigmoid()
+    y.backward(minitorch.tensor([1.0, 1.0]))
+
+    # Modifying a value saved for backward invalidates the graph.
+    y = x.exp()
+    x.add_(1.0)
+    with pytest.raises(RuntimeError):
+        y.sum().backward()
+
+    x = minitorch.tensor([1.0, 2.0], requires_grad=True)
+    y = x.exp()
+    x[0] = 5.0
+    with pytest.raises(RuntimeError):
+        y.sum().backward()
+
+    # Gradients accumulate into the same buffer until zeroed.
+    x = minitorch.tensor([1.0, 2.0], requires_grad=True)
+    (x * 3.0).sum().backward()
+    grad = x.grad
+    (x * 3.0).sum().backward()
+    assert x.grad is grad and x.grad[0] == 6.0
+    x.zero_grad_()
+    assert x.grad is grad and x.grad[0] == 0.0
+
+
+@given(tensors(shape=(3, 4)))
+def test_take_index_select(t1):
+    out = t1.take([5, 0, 5])
+    assert out.shape == (3,)
+    assert out[0] == t1[1, 1] and out[1] == t1[0, 0]
+
+    out = t1.index_select(1, [3, 1])
+    assert out.shape == (3, 2)
+    for i in range(3):
+        assert out[i, 0] == t1[i, 3] and out[i, 1] == t1[i, 1]
+
+    minitorch.grad_check(lambda a: a.take([5, 0, 5, 11]), t1)
+    minitorch.grad_check(lambda a: a.index_select(0, [2, 2, 0]), t1)
+    minitorch.grad_check(lambda a: a.permute(1, 0).index_select(1, [1]), t1)
+    minitorch.grad_check(lambda a: a.index_select(-1, [0, 3, 0]), t1)
+    out = t1.index_select(-2, [1])
+    assert out.shape == (1, 4) and out[0, 2] == t1[1, 2]
+    with pytest.raises(minitorch.IndexingError):
+        t1.take([12])
+
+
+@given(tensors(shape=(2, 3, 4)), tensors(shape=(4, 2)))
+def test_matmul(t1, t2):
+    out = t1 @ t2
+    assert out.shape == (2, 3, 2)
+    for n in range(2):
+        for i in range(3):
+            for j in range(2):
+                expected = sum(t1[n, i, k] * t2[k, j] for k in range(4))
+                assert_close(out[n, i, j], expected)
+    minitorch.grad_check(lambda a, b: a @ b, t1, t2)
+    minitorch.grad_check(lambda a, b: b.permute(1, 0) @ a[0].permute(1, 0), t1, t2)
+    with pytest.raises(minitorch.IndexingError):
+        t2 @ t2
+
+
+def test_fuse():
+    f = minitorch.fuse(lambda a, b: (a * b).sigmoid() / (b.exp() + a.relu()) - 2.0)
+    assert f.program.source.count("\n") == 9
+    assert f.program.grad.nout == 2
+
+    a = minitorch.tensor_fromlist([[0.5, -1.0], [2.0, 3.0]])
+    b = minitorch.tensor([1.5, -0.5])
+    out = f(a, b)
+    expected = (a * b).sigmoid() / (b.exp() + a.relu()) - 2.0
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+    minitorch.grad_check(f, a, b)
+    minitorch.grad_check(minitorch.fuse(lambda a: 1.0 - a), a)
+    g = minitorch.fuse(lambda a, b: a.log() * a - b)
+    minitorch.grad_check(lambda a: g(a, 2.0), a.exp())
+
+    # Constants that have no literal in python source.
+    h = minitorch.fuse(lambda a: a + float("inf") + (a * float("nan")).relu())
+    assert h(b)[0] == float("inf")
+
+
+def test_bce_with_logits():
+    x = np.array([-3.0, -0.5, 0.0, 2.0, 800.0, -800.0])
+    y = np.array([0.0, 1.0, 1.0, 0.0, 1.0, 0.0])
+    logits = minitorch.tensor(x.tolist(), requires_grad=True)
+    labels = minitorch.tensor(y.tolist())
+
+    loss = minitorch.binary_cross_entropy_with_logits(logits, labels, "mean")
+    assert loss.shape == (1,)
+    assert_close(loss[0], np.mean(np.logaddexp(0.0, x) - x * y))
+    loss.backward()
+    prob = minitorch.tensor(x.tolist()).sigmoid().to_numpy()
+    np.testing.assert_allclose(logits.grad.to_numpy(), (prob - y) / len(x))
+
+    # Same as the loss of the probabilities, away from saturation.
+    a = minitorch.tensor([0.3, -1.2, 2.5])
+    b = minitorch.tensor([1.0, 0.0, 1.0])
+    p = a.sigmoid()
+    expected = -(p * b + (p - 1.0) * (b - 1.0)).log().sum()
+    assert_close(minitorch.binary_cross_entropy_with_logits(a, b)[0], expected[0])
+    minitorch.grad_check(minitorch.binary_cross_entropy_with_logits, a, b)
+    with pytest.raises(ValueError):
+        minitorch.binary_cross_entropy_with_logits(a, b, "max")
+
+
+@pytest.mark.parametrize("activation", [None, "relu", "sigmoid"])
+def test_linear(activation):
+    layer = minitorch.nn.Linear(3, 4, activation=activation)
+    assert set(layer.named_parameters()) == {"weights", "bias"}
+    x = minitorch.tensor_fromlist([[0.5, -1.0, 2.0], [1.5, 0.25, -0.5]])
+    out = layer(x)
+    assert out.shape == (2, 4)
+
+    expected = x @ layer.weights.value + layer.bias.value
+    if activation is not None:
+        expected = getattr(expected, activation)()
+    np.testing.assert_allclose(out.to_numpy(), expected.to_numpy())
+
+    def affine(a, w, b):
+        return a.backend.Affine.apply(a, w, b, activation)
+
+    minitorch.grad_check(affine, x, layer.weights.value, layer.bias.value)
+    batch = minitorch.rand((2, 2, 3))
+    minitorch.grad_check(affine, batch, layer.weights.value, layer.bias.value)
+    with pytest.raises(ValueError):
+        minitorch.nn.Linear(3, 4, activation="tanh")(x)
+
+
+def test_conv():
+    rng = np.random.RandomState(0)
+    x, w = rng.standard_normal((2, 3, 7, 6)), rng.standard_normal((4, 3, 3, 2))
+    out = minitorch.conv2d(
+        minitorch.from_numpy(x),
+        minitorch.from_numpy(w),
+        stride=(2, 1),
+        padding=(1, 2),
+        dilation=(1, 2),
+    )
+    assert out.shape == (2, 4, 4, 8)
+    padded = np.pad(x, [(0, 0), (0, 0), (1, 1), (2, 2)])
+    for i in range(4):
+        for j in range(8):
+            patch = padded[:, :, 2 * i : 2 * i + 3, j : j + 3 : 2]
+            expected = np.tensordot(patch, w, axes=([1, 2, 3], [1, 2, 3]))
+            np.testing.assert_allclose(out.to_numpy()[:, :, i, j], expected)
+
+    a = minitorch.rand((2, 2, 5, 4), requires_grad=True)
+    b = minitorch.rand((3, 2, 2, 3), requires_grad=True)
+    minitorch.grad_check(lambda a, b: minitorch.conv2d(a, b, 2, 1, (2, 1)), a, b)
+    a = minitorch.rand((2, 2, 7), requires_grad=True)
+    b = minitorch.rand((3, 2, 3), requires_grad=True)
+    minitorch.grad_check(lambda a, b: minitorch.conv1d(a, b, 2, 2, 2), a, b)
+
+    layer = minitorch.nn.Conv2d(2, 3, 3, padding=1)
+    assert layer(minitorch.rand((2, 2, 5, 4))).shape == (2, 3, 5, 4)
+    with pytest.raises(minitorch.IndexingError):
+        minitorch.conv2d(minitorch.rand((1, 2, 2, 2)), minitorch.rand((3, 2, 3, 3)))
+    with pytest.raises(minitorch.IndexingError):
+        minitorch.conv1d(minitorch.rand((1, 2, 5)), minitorch.rand((3, 1, 3)))
+
+
+@pytest.mark.parametrize("kernel,stride", [(2, None), ((3, 2), (2, 1))])
+def test_pool(kernel, stride):
+    x = np.random.RandomState(0).permutation(2 * 3 * 7 * 6).reshape(2, 3, 7, 6) / 10.0
+    t = minitorch.from_numpy(x, requires_grad=True)
+    kh, kw = (kernel, kernel) if isinstance(kernel, int) else kernel
+    sh, sw = (kh, kw) if stride is None else stride
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kh, kw), axis=(2, 3))
+    windows = windows[:, :, ::sh, ::sw]
+
+    out = minitorch.max_pool2d(t, kernel, stride)
+    np.testing.assert_allclose(out.to_numpy(), windows.max((4, 5)))
+    out = minitorch.nn.AvgPool2d(kernel, stride)(t)
+    np.testing.assert_allclose(out.to_numpy(), windows.mean((4, 5)))
+
+    minitorch.grad_check(lambda a: minitorch.max_pool2d(a, kernel, stride), t)
+    minitorch.grad_check(lambda a: minitorch.avg_pool2d(a, kernel, stride), t)
+    with pytest.raises(minitorch.IndexingError):
+        minitorch.max_pool2d(minitorch.rand((2, 3, 4)), kernel)
+
+
+@given(lists(small_floats, min_size=1), lists(small_floats, min_size=1))
+def test_vectorized_operators(xs, ys):
+    "Registered array and JIT variants agree with the scalar functions."
+    ops = minitorch.operators
+    n = min(len(xs), len(ys))
+    x, y = np.array(xs[:n]), np.array(ys[:n]) + 0.5
+    for fn, vec in ops.VECTORIZED.items():
+        args = (np.abs(x) + 0.1,) if fn in (ops.log, ops.inv) else (x,)
+        if fn in (ops.log_back, ops.inv_back):
+            args = (np.abs(x) + 0.1, y)
+        elif fn.__code__.co_argcount == 2:
+            args = (x, y)
+        expected = [fn(*vals) for vals in zip(*(a.tolist() for a in args))]
+        np.testing.assert_allclose(vec(*args), expected, rtol=1e-12, atol=1e-300)
+        jitted = [ops.jit_form(fn)(*vals) for vals in zip(*(a.tolist() for a in args))]
+        np.testing.assert_allclose(jitted, expected, rtol=1e-12, atol=1e-300)
+
+
+def test_vectorized_operators_nan():
+    "Registered variants treat NaN like the scalar functions."
+    ops = minitorch.operators
+    nan = float("nan")
+    x = np.array([nan, 1.0, nan, 2.0, 0.5])
+    y = np.array([1.0, nan, nan, 3.0, 0.5])
+    for fn, vec in ops.VECTORIZED.items():
+        args = (x, y) if fn.__code__.co_argcount == 2 else (x,)
+        expected = [fn(*vals) for vals in zip(*(a.tolist() for a in args))]
+        with np.errstate(invalid="ignore"):
+            np.testing.assert_allclose(vec(*args), expected, rtol=1e-12, atol=1e-300)
+        jitted = [ops.jit_form(fn)(*vals) for vals in zip(*(a.tolist() for a in args))]
+        np.testing.assert_allclose(jitted, expected, rtol=1e-12, atol=1e-300)
+
+
+def test_register_vectorized():
+    "Kernels call the array variant of a registered function once."
+    calls = []
+
+    def double(x):
+        raise AssertionError("The scalar function should not be called.")
+
+    def double_array(x):
+        calls.append(np.size(x))
+        return 2.0 * x
+
+    minitorch.operators.register(double, double_array)
+    try:
+        double_map = minitorch.TensorOps.map(double)
+        t = minitorch.tensor([1.0, 2.0, 3.0, 4.0]).view(2, 2)
+        out = double_map(t.permute(1, 0))
+        assert out.to_numpy().tolist() == [[2.0, 6.0], [4.0, 8.0]]
+        assert calls == [4]
+    finally:
+        del minitorch.operators.VECTORIZED[double]
+
+
+def test_lazy():
+    x = minitorch.tensor([1.0, -2.0, 3.0], requires_grad=True)
+    y = minitorch.tensor([1.0, 0.0, 1.0])
+    with minitorch.lazy():
+        z = x.sigmoid() * x.sigmoid() + (y - 1.0)
+        dead = x.exp()
+        assert isinstance(z._data, minitorch.LazyData)
+        assert z.shape == (3,)
+        z.sum().backward()
+    assert isinstance(dead._data, minitorch.LazyData)
+    # `zero_grad_` refills the same buffer, keep a copy.
+    grad = x.grad.to_numpy().copy()
+
+    x.zero_grad_()
+    expected = x.sigmoid() * x.sigmoid() + (y - 1.0)
+    expected.sum().backward()
+    for i in range(3):
+        assert_close(z[i], expected[i])
+        assert_close(grad[i], x.grad[i])
+
+    # The two sigmoids share one result.
+    nodes = z.history.inputs[0].history.inputs
+    assert nodes[0]._tensor is nodes[1]._tensor
+
+    # Only number constants are folded across scopes, other inputs may be
+    # written without bumping their version (e.g. through numpy).
+    y.to_numpy()[0] = 5.0
+    with minitorch.lazy():
+        c, e = y - 1.0, y.exp()
+    assert c[0] == 4.0
+    assert_close(e[1], 1.0)
+    one = y._ensure_tensor(1.0)
+    with minitorch.lazy():
+        p = -one
+    with minitorch.lazy():
+        q = -one
+    assert p._tensor is q._tensor
+
+    # Folded results are copied on write, the cached one is unchanged.
+    p.add_(1.0)
+    assert p[0] == 0.0 and q[0] == -1.0
+    assert p._version is q._version and p._version.value == 1
+
+    # Equal numbers in different tensors are different inputs.
+    a, b = minitorch.tensor([2.0]), minitorch.tensor([2.0])
+    with minitorch.lazy():
+        p, q = a.exp(), b.exp()
+    assert p._tensor is not q._tensor
+
+    with minitorch.lazy():
+        z = x * 2.0
+    x.add_(1.0)
+    with pytest.raises(RuntimeError):
+        z[0]
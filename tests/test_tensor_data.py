@@ -104,3 +104,82 @@ def test_shape_broadcast():
 @given(tensor_data())
 def test_string(tensor_data):
     tensor_data.to_string()
+
+
+@given(data())
+def test_strided_positions(data):
+    "Odometer iteration matches `count` followed by `index_to_position`."
+    td = data.draw(tensor_data())
+    td_rev = td.permute(*list(reversed(range(td.dims))))
+    positions = list(
+        minitorch.strided_positions(td_rev.shape, td_rev.strides, td.strides)
+    )
+    assert len(positions) == td.size
+    index = [0] * td.dims
+    for i, (p_rev, p) in enumerate(positions):
+        minitorch.count(i, td_rev.shape, index)
+        assert p_rev == minitorch.index_to_position(index, td_rev.strides)
+        assert p == minitorch.index_to_position(index, td.strides)
+
+
+def test_broadcast_strides():
+    assert minitorch.broadcast_strides((2, 3, 4), (3, 1), (1, 3)) == [0, 1, 0]
+    assert minitorch.broadcast_strides((2, 3), (2, 3), (3, 1)) == [3, 1]
+
+
+def test_broadcast_plan():
+    plan = minitorch.broadcast_plan((2, 3, 2), (3, 1), (1, 3))
+    assert list(plan) == [0, 0, 1, 1, 2, 2] * 2
+
+    # Plans are memoized on shapes and strides.
+    assert minitorch.broadcast_plan((2, 3, 2), (3, 1), (1, 3)) is plan
+    assert not plan.flags.writeable
+
+    # Large plans are not kept alive by the cache.
+    shape = (2, minitorch.PLAN_CACHE_MAX_SIZE)
+    plan = minitorch.broadcast_plan(shape, shape, (shape[1], 1))
+    assert list(plan[-2:]) == [2 * shape[1] - 2, 2 * shape[1] - 1]
+    assert minitorch.broadcast_plan(shape, shape, (shape[1], 1)) is not plan
+
+
+def test_to_string():
+    t = minitorch.TensorData([float(i) for i in range(6)], (2, 3))
+    assert t.to_string() == "\n[\n\t[0.00 1.00 2.00]\n\t[3.00 4.00 5.00]]"
+    assert t.permute(1, 0).to_string() == (
+        "\n[\n\t[0.00 3.00]\n\t[1.00 4.00]\n\t[2.00 5.00]]"
+    )
+
+    # Large tensors keep only the edge items of each dimension.
+    old = dict(minitorch.PRINT_OPTIONS)
+    try:
+        minitorch.set_printoptions(threshold=5, edgeitems=1, precision=1)
+        assert t.to_string() == "\n[\n\t[0.0 ... 2.0]\n\t[3.0 ... 5.0]]"
+        t = minitorch.TensorData([float(i) for i in range(27)], (3, 3, 3))
+        assert t.to_string().count("...") == 1 + 2 + 4
+    finally:
+        minitorch.set_printoptions(**old)
+
+
+def test_gather_scatter():
+    t = minitorch.TensorData([float(i) for i in range(6)], (2, 3))
+    index = [(1, 2), (0, 0), (1, 2)]
+    assert list(t.gather(index)) == [5.0, 0.0, 5.0]
+    assert list(t.permute(1, 0).gather([(2, 1), (0, 1)])) == [5.0, 3.0]
+
+    t.scatter(index, [10.0, 20.0, 30.0])
+    assert t.get((0, 0)) == 20.0 and t.get((1, 2)) == 30.0
+    t.scatter(index, 1.0, accumulate=True)
+    assert t.get((0, 0)) == 21.0 and t.get((1, 2)) == 32.0
+
+    for bad in [[(0, 3)], [(-1, 0)], [(0,)], [0, 1]]:
+        with pytest.raises(minitorch.IndexingError):
+            t.gather(bad)
+
+    # Whole slices along one dimension.
+    version = t._version.value
+    assert t.permute(1, 0).gather([2, 0], dim=0).tolist() == [[2.0, 32.0], [21.0, 3.0]]
+    t.scatter([1, 1], [[1.0], [2.0]], accumulate=True, dim=1)
+    assert t.get((0, 1)) == 3.0 and t.get((1, 1)) == 8.0
+    assert t._version.value == version + 1
+    with pytest.raises(minitorch.IndexingError):
+        t.gather([3], dim=1)
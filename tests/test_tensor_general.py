@@ -0,0 +1,390 @@
+import math
+import minitorch
+import numpy as np
+import pytest
+from hypothesis import given, settings
+from .strategies import tensors, shaped_tensors, assert_close
+from .test_tensor import one_arg, two_arg, reduce
+
+# Backends are compared against the reference `TensorFunctions`.
+backend_tests = [
+    pytest.param(minitorch.FastTensorFunctions, marks=pytest.mark.task3_1, id="fast"),
+    pytest.param(minitorch.NumpyTensorFunctions, marks=pytest.mark.task3_1, id="numpy"),
+]
+
+
+def to_backend(t, backend):
+    return minitorch.Tensor(t._tensor, backend=backend)
+
+
+@given(tensors())
+@settings(max_examples=25)
+@pytest.mark.parametrize("fn", one_arg)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_one_args(fn, backend, t1):
+    t2 = fn[1](to_backend(t1, backend))
+    expected = fn[1](t1)
+    for ind in t2._tensor.indices():
+        assert_close(t2[ind], expected[ind])
+
+
+@given(shaped_tensors(2))
+@settings(max_examples=25)
+@pytest.mark.parametrize("fn", two_arg)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_two_args(fn, backend, ts):
+    t1, t2 = ts
+    t3 = fn[1](to_backend(t1, backend), to_backend(t2, backend))
+    expected = fn[1](t1, t2)
+    for ind in t3._tensor.indices():
+        assert_close(t3[ind], expected[ind])
+
+
+@given(tensors())
+@settings(max_examples=25)
+@pytest.mark.parametrize("fn", reduce)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_reduce(fn, backend, t1):
+    minitorch.grad_check(fn[1], to_backend(t1, backend))
+
+
+@given(shaped_tensors(2))
+@settings(max_examples=25)
+@pytest.mark.parametrize("fn", two_arg)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_two_grad_broadcast(fn, backend, ts):
+    t1, t2 = [to_backend(t, backend) for t in ts]
+    minitorch.grad_check(fn[1], t1, t2)
+    minitorch.grad_check(fn[1], t1.sum(0), t2)
+    minitorch.grad_check(fn[1], t1, t2.sum(0))
+
+
+@pytest.mark.parametrize("backend", backend_tests)
+def test_strided_inputs(backend):
+    "Inputs with a transposed layout must be read through their strides."
+    data = minitorch.TensorData([float(i) for i in range(6)], (3, 2), (1, 3))
+    t = minitorch.Tensor(data, backend=backend)
+    expected = [[0.0, 3.0], [1.0, 4.0], [2.0, 5.0]]
+
+    out = -(-t)
+    out2 = t + t.zeros((3, 2))
+    out3 = t.sum(1)
+    for i in range(3):
+        assert out3[i, 0] == sum(expected[i])
+        for j in range(2):
+            assert out[i, j] == expected[i][j]
+            assert out2[i, j] == expected[i][j]
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_float32(backend):
+    x = minitorch.tensor_fromlist(
+        [[0.5, -1.0], [2.0, 3.0]], backend=backend, dtype=np.float32
+    )
+    w = minitorch.rand((2, 2), backend=backend, dtype=np.float32)
+    x.requires_grad_(True)
+    w.requires_grad_(True)
+
+    out = ((x * w + 1.0).relu().sigmoid() - x.exp()).sum(1).sum()
+    assert out.dtype == np.float32
+    out.backward()
+    assert x.grad.dtype == np.float32
+    assert w.grad.dtype == np.float32
+
+    x64 = minitorch.tensor_fromlist([[0.5, -1.0], [2.0, 3.0]], backend=backend)
+    w64 = minitorch.Tensor(
+        minitorch.TensorData(w._tensor._storage, w.shape, dtype=np.float64),
+        backend=backend,
+    )
+    x64.requires_grad_(True)
+    ((x64 * w64 + 1.0).relu().sigmoid() - x64.exp()).sum(1).sum().backward()
+    for ind in x.grad._tensor.indices():
+        assert_close(x.grad[ind], x64.grad[ind])
+
+
+@given(tensors(shape=(4, 3)))
+@settings(max_examples=10)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_slice(backend, t1):
+    t = to_backend(t1, backend)
+    for key in [(slice(1, 3),), (slice(None), 1), (slice(None, None, 2), slice(1, 3))]:
+        view = t[key]
+        expected = t1[key].contiguous()
+        assert_close(view.sum()[0], expected.sum()[0])
+        assert_close((view * 2.0).sum()[0], 2 * expected.sum()[0])
+    minitorch.grad_check(lambda a: a[1:, 1].exp(), t)
+
+
+@given(shaped_tensors(2))
+@settings(max_examples=10)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_inplace(backend, ts):
+    t1, t2 = ts
+    expected = (t1 + t2) * t2 - t1
+    out = to_backend(t1, backend) + 0.0
+    b = to_backend(t2, backend)
+    out.add_(b).mul_(b).sub_(to_backend(t1, backend))
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_inplace_overlap(backend):
+    "In-place ops reading a view of their own storage."
+    x = np.random.RandomState(0).standard_normal((64, 64))
+    t = minitorch.from_numpy(x.copy(), backend=backend)
+    t.add_(t.permute(1, 0))
+    np.testing.assert_allclose(t.to_numpy(), x + x.T)
+    t = minitorch.from_numpy(x.copy(), backend=backend)
+    t.mul_(t[0])
+    np.testing.assert_allclose(t.to_numpy(), x * x[0])
+    t = minitorch.from_numpy(x.copy(), backend=backend)
+    t[1:] = t[:-1]
+    np.testing.assert_allclose(t.to_numpy()[1:], x[:-1])
+
+
+@given(tensors(shape=(2, 3, 4)), tensors(shape=(4, 5)))
+@settings(max_examples=10)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_matmul(backend, t1, t2):
+    a, b = to_backend(t1, backend), to_backend(t2, backend)
+    expected = t1 @ t2
+    out = a @ b
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+    minitorch.grad_check(lambda x, y: x @ y, a, b)
+    minitorch.grad_check(lambda x, y: x[1] @ y.permute(1, 0).permute(1, 0), a, b)
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_matmul_blocks(backend):
+    "Shapes that are not multiples of the tile size."
+    a = np.random.rand(67, 130)
+    b = np.random.rand(130, 129)
+    out = minitorch.from_numpy(a, backend=backend) @ minitorch.from_numpy(
+        b, backend=backend
+    )
+    np.testing.assert_allclose(out.to_numpy(), a @ b)
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_reduce_accuracy(backend):
+    "Long sums, reduced pairwise or with compensation."
+    x = np.random.RandomState(0).standard_normal((3, 20001)) * 1e6 + 1e-3
+    t = minitorch.from_numpy(x, backend=backend)
+    exact = [math.fsum(row) for row in x]
+
+    pairwise = t.sum(1)
+    np.testing.assert_allclose(pairwise.to_numpy()[:, 0], exact, rtol=0, atol=1e-6)
+    # Within a couple of roundings of the exact sums.
+    compensated = t.permute(1, 0).sum(0, compensated=True).to_numpy()[0]
+    assert np.all(np.abs(compensated - exact) <= 2 * np.spacing(np.abs(exact)))
+    total = math.fsum(exact)
+    assert abs(t.sum(compensated=True)[0] - total) <= 2 * np.spacing(abs(total))
+
+
+@pytest.mark.parametrize("activation", [None, "relu", "sigmoid"])
+@pytest.mark.parametrize("backend", backend_tests)
+def test_affine(activation, backend):
+    layer = minitorch.nn.Linear(3, 2, activation=activation, backend=backend)
+    x, w, b = minitorch.rand((5, 3)), layer.weights.value, layer.bias.value
+    expected = minitorch.TensorFunctions.Affine.apply(x, w, b, activation)
+    out = layer(to_backend(x, backend))
+    np.testing.assert_allclose(out.to_numpy(), expected.to_numpy())
+    minitorch.grad_check(
+        lambda a, w, b: a.backend.Affine.apply(a, w, b, activation),
+        to_backend(x, backend),
+        w,
+        b,
+    )
+
+
+@pytest.mark.parametrize("backend", backend_tests)
+def test_conv(backend):
+    x, w = minitorch.rand((2, 3, 6, 5)), minitorch.rand((4, 3, 3, 2))
+    args = dict(stride=(1, 2), padding=1, dilation=(2, 1))
+    expected = minitorch.conv2d(x, w, **args)
+    out = minitorch.conv2d(to_backend(x, backend), to_backend(w, backend), **args)
+    np.testing.assert_allclose(out.to_numpy(), expected.to_numpy())
+    minitorch.grad_check(
+        lambda a, b: minitorch.conv2d(a, b, **args),
+        to_backend(x, backend),
+        to_backend(w, backend),
+    )
+    x, w = minitorch.rand((2, 3, 8)), minitorch.rand((2, 3, 3))
+    minitorch.grad_check(
+        lambda a, b: minitorch.conv1d(a, b, 3, 1),
+        to_backend(x, backend),
+        to_backend(w, backend),
+    )
+
+
+@pytest.mark.parametrize("backend", backend_tests)
+def test_pool(backend):
+    x = minitorch.rand((2, 3, 6, 5), requires_grad=True)
+    for pool in [minitorch.max_pool2d, minitorch.avg_pool2d]:
+        for kernel, stride in [(2, None), ((2, 3), 1)]:
+            expected = pool(x, kernel, stride)
+            out = pool(to_backend(x, backend), kernel, stride)
+            np.testing.assert_allclose(out.to_numpy(), expected.to_numpy())
+            minitorch.grad_check(
+                lambda a: pool(a, kernel, stride), to_backend(x, backend)
+            )
+
+
+@pytest.mark.parametrize("backend", backend_tests)
+def test_select_reductions(backend):
+    x = np.random.RandomState(0).standard_normal((3, 4, 5))
+    x[1, 2, 0] = 0.0
+    t = minitorch.from_numpy(x, backend=backend)
+    ref = minitorch.from_numpy(x)
+    fns = [
+        lambda a: a.max((0, 2), keepdim=False),
+        lambda a: a.min(1),
+        lambda a: a.prod(2),
+        lambda a: a.logsumexp((1, 2)),
+    ]
+    for fn in fns:
+        np.testing.assert_allclose(fn(t).to_numpy(), fn(ref).to_numpy())
+        minitorch.grad_check(fn, t)
+    for dim in [None, 0, (1, 2)]:
+        expected = ref.argmax(dim).to_numpy()
+        assert t.argmax(dim).to_numpy().tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_integer_promotion(backend):
+    "Float arithmetic on integer results (e.g. argmax) is not truncated."
+    x = np.array([[1.0, 3.0, 2.0], [0.0, 1.0, 5.0]])
+    arg = minitorch.from_numpy(x, backend=backend).argmax(1)
+    assert arg.mean()[0] == 1.5
+    np.testing.assert_allclose((arg * 0.5).to_numpy()[:, 0], [0.5, 1.0])
+    np.testing.assert_allclose((arg / 2.0).to_numpy()[:, 0], [0.5, 1.0])
+    np.testing.assert_allclose((arg / 2).to_numpy()[:, 0], [0.5, 1.0])
+    assert (arg * 2).dtype == np.int64
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_arg_reduce_nan(backend):
+    "NaN propagates through max and min, selecting the first NaN."
+    nan = float("nan")
+    x = np.array([[1.0, nan, 3.0, nan], [2.0, 0.0, 5.0, 4.0], [nan, 1.0, 2.0, 3.0]])
+    t = minitorch.from_numpy(x, backend=backend)
+    assert t.argmax(1).to_numpy()[:, 0].tolist() == [1, 2, 0]
+    np.testing.assert_array_equal(t.max(1).to_numpy()[:, 0], [nan, 5.0, nan])
+    np.testing.assert_array_equal(t.min(1).to_numpy()[:, 0], [nan, 0.0, nan])
+    assert t.argmax().to_numpy().tolist() == [1]
+
+
+@given(shaped_tensors(2))
+@settings(max_examples=10)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_bce_with_logits(backend, ts):
+    t1, t2 = [to_backend(t, backend) for t in ts]
+    labels = (t2 > 0.0) * 1.0
+    loss = minitorch.binary_cross_entropy_with_logits(t1, labels, "mean")
+    expected = minitorch.binary_cross_entropy_with_logits(ts[0], (ts[1] > 0.0) * 1.0)
+    assert_close(loss[0] * t1.size, expected[0])
+    minitorch.grad_check(minitorch.binary_cross_entropy_with_logits, t1, labels)
+
+
+def test_parallel_chunks():
+    "Kernels split across threads give the same results as serial ones."
+    x = np.random.RandomState(0).standard_normal((64, 30))
+    y = np.random.RandomState(1).standard_normal(30)
+    options = dict(minitorch.PARALLEL_OPTIONS)
+    try:
+        minitorch.set_parallel_options(threads=4, min_chunk=16)
+        assert minitorch.chunk_ranges(64, 30) == [(0, 16), (16, 32), (32, 48), (48, 64)]
+        assert minitorch.chunk_ranges(3, 1) == [(0, 3)]
+        assert minitorch.split_axis((64, 30)) == 0
+        assert minitorch.split_axis((2, 1, 4096)) == 2
+        assert minitorch.split_axis((1, 1)) is None
+        x2 = np.random.RandomState(3).standard_normal((2, 300))
+        t = minitorch.from_numpy(x2, backend=minitorch.NumpyTensorFunctions)
+        np.testing.assert_allclose(t.exp().to_numpy(), np.exp(x2))
+        np.testing.assert_allclose(t.sum(0).to_numpy()[0], x2.sum(0))
+        np.testing.assert_allclose(fused(t, t).to_numpy(), fused_fn(t, t).to_numpy())
+
+        # A pool still in use keeps working when the thread count changes.
+        executor = minitorch.parallel._get_executor()
+        minitorch.set_parallel_options(threads=2)
+        assert minitorch.parallel._get_executor() is not executor
+        assert executor.submit(lambda: 1).result() == 1
+        minitorch.set_parallel_options(threads=4)
+        backend = minitorch.NumpyTensorFunctions
+        t = minitorch.from_numpy(x, backend=backend)
+        u = minitorch.from_numpy(y, backend=backend)
+        np.testing.assert_allclose((t * u).to_numpy(), x * y)
+        np.testing.assert_allclose(t.sigmoid().to_numpy(), 1 / (1 + np.exp(-x)))
+        np.testing.assert_allclose(t.sum(1).to_numpy()[:, 0], x.sum(1))
+        np.testing.assert_allclose(t.permute(1, 0).mean(1).to_numpy()[:, 0], x.mean(0))
+        np.testing.assert_allclose(t.sum().to_numpy(), [x.sum()])
+        out = fused(t, u).to_numpy()
+        expected = fused(minitorch.from_numpy(x), minitorch.from_numpy(y)).to_numpy()
+        np.testing.assert_allclose(out, expected)
+
+        # Chunks reading a transposed view of the output they write.
+        x = np.random.RandomState(2).standard_normal((64, 64))
+        for backend in [minitorch.TensorFunctions, minitorch.NumpyTensorFunctions]:
+            t = minitorch.from_numpy(x.copy(), backend=backend)
+            backend._add_zip(t, t.permute(1, 0), out=t)
+            np.testing.assert_allclose(t.to_numpy(), x + x.T)
+            t = minitorch.from_numpy(x.copy(), backend=backend)
+            backend._exp_map(t.permute(1, 0), out=t)
+            np.testing.assert_allclose(t.to_numpy(), np.exp(x.T))
+            t = minitorch.from_numpy(x.copy(), backend=backend)
+            backend._add_zip(t, t, out=t)
+            np.testing.assert_allclose(t.to_numpy(), 2 * x)
+            u = minitorch.from_numpy(x[0], backend=backend)
+            expected = 1 / (1 + np.exp(-2 * x * x[0]))
+            np.testing.assert_allclose((t * u).sigmoid().to_numpy(), expected)
+    finally:
+        minitorch.set_parallel_options(**options)
+
+
+def fused_fn(a, b):
+    prob = (a * b - (a - 1.0) * (b + 2.0)).sigmoid()
+    return prob * (b + 2.5).relu() - (a.sigmoid() + 1.0).log()
+
+
+# Built once, kernels are compiled on first use for each backend.
+fused = minitorch.fuse(fused_fn)
+
+
+@given(shaped_tensors(2))
+@settings(max_examples=10)
+@pytest.mark.parametrize("backend", backend_tests)
+def test_fuse(backend, ts):
+    t1, t2 = ts
+    a, b = to_backend(t1, backend), to_backend(t2, backend)
+    out = fused(a, b)
+    expected = fused_fn(t1, t2)
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+    minitorch.grad_check(fused, a, b)
+    minitorch.grad_check(fused, a, b.sum(0))
+
+
+@pytest.mark.parametrize(
+    "backend", [pytest.param(minitorch.TensorFunctions, id="ref")] + backend_tests
+)
+def test_view_permute_backward(backend):
+    "View backward receives the strided gradient of a permute."
+    x = minitorch.tensor([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], backend=backend)
+    x.requires_grad_(True)
+    w = minitorch.tensor_fromlist([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], backend=backend)
+    (x.view(2, 3).permute(1, 0) * w).sum().backward()
+    np.testing.assert_allclose(x.grad.to_numpy(), [1.0, 3.0, 5.0, 2.0, 4.0, 6.0])